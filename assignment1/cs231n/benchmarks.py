@@ -0,0 +1,350 @@
+from __future__ import print_function, division
+
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import time
+
+import numpy as np
+
+from cs231n.classifiers.k_nearest_neighbor import KNearestNeighbor
+from cs231n.classifiers.linear_svm import svm_loss_naive, svm_loss_vectorized
+from cs231n.classifiers.softmax import (softmax_loss_naive,
+                                        softmax_loss_vectorized)
+
+"""
+Benchmarks for the classifiers of this assignment: the three distance
+implementations and predict_labels of KNearestNeighbor, the naive and
+vectorized SVM and softmax losses, and TwoLayerNet.loss.
+
+Every case is timed over a range of data sizes on random data with a fixed
+seed, repeating each call until a time budget is used up, and the median time
+and samples per second are recorded. Results are written to JSON files tagged
+with the machine they ran on, and can be compared to a baseline of the same
+machine to catch slowdowns; with --plot, the time of every case is plotted
+against the data size (this needs matplotlib).
+
+Run from the assignment1 directory:
+
+python -m cs231n.benchmarks --baseline-dir baselines --update-baseline
+python -m cs231n.benchmarks --baseline-dir baselines --plot scaling.png
+
+The first command stores the results as baselines/<machine tag>.json; the
+second compares a new run to it and exits with status 1 if any case is slower
+by more than --threshold.
+"""
+
+
+clock = getattr(time, 'perf_counter', time.time)
+
+NUM_CLASSES = 10
+
+
+def machine_info():
+  """
+  Describe the machine and software a benchmark runs with.
+  """
+  return {
+    'hostname': socket.gethostname(),
+    'machine': platform.machine(),
+    'processor': platform.processor(),
+    'cpu_count': os.cpu_count() if hasattr(os, 'cpu_count') else None,
+    'python': platform.python_version(),
+    'numpy': np.__version__,
+  }
+
+
+def machine_tag(info=None):
+  """
+  Short name of a machine, used to name its baseline file.
+  """
+  info = info or machine_info()
+  return '%s-%s-%s' % (info['hostname'], info['machine'], info['cpu_count'])
+
+
+def _knn(num_train, num_test, rng, dim=3072):
+  classifier = KNearestNeighbor()
+  classifier.train(rng.randn(num_train, dim),
+                   rng.randint(NUM_CLASSES, size=num_train))
+  return classifier, rng.randn(num_test, dim)
+
+
+def _distances(method):
+  # Sizes are numbers of test points; there are 1000 training points
+  def setup(size, rng):
+    classifier, X = _knn(1000, size, rng)
+    return getattr(classifier, method), (X,)
+  return setup
+
+
+def _predict_labels(size, rng):
+  classifier, X = _knn(5000, size, rng, dim=1)
+  dists = np.abs(rng.randn(size, 5000))
+  return lambda d: classifier.predict_labels(d, k=5), (dists,)
+
+
+def _linear_loss(loss):
+  # Sizes are numbers of samples of CIFAR-10 dimension plus a bias
+  def setup(size, rng):
+    W = 1e-4 * rng.randn(3073, NUM_CLASSES)
+    X = rng.randn(size, 3073)
+    y = rng.randint(NUM_CLASSES, size=size)
+    return loss, (W, X, y, 5e-6)
+  return setup
+
+
+def _two_layer_net(size, rng):
+  # neural_net imports matplotlib, so it is only imported when needed
+  from cs231n.classifiers.neural_net import TwoLayerNet
+  np.random.seed(rng.randint(2**31))
+  net = TwoLayerNet(3072, 100, NUM_CLASSES)
+  X = rng.randn(size, 3072)
+  y = rng.randint(NUM_CLASSES, size=size)
+  return lambda X, y: net.loss(X, y, reg=0.05), (X, y)
+
+
+# name -> (group, setup, sizes). setup(size, rng) returns a function and its
+# arguments. Within a group, the speedup of every case over the case of the
+# group listed in BASELINE_CASES is recorded.
+CASES = {
+  'knn_two_loops': ('knn_distances', _distances('compute_distances_two_loops'),
+                    [10, 50, 200]),
+  'knn_one_loop': ('knn_distances', _distances('compute_distances_one_loop'),
+                   [10, 50, 200, 500]),
+  'knn_no_loops': ('knn_distances', _distances('compute_distances_no_loops'),
+                   [10, 50, 200, 500]),
+  'knn_predict_labels': ('knn_predict_labels', _predict_labels,
+                         [10, 50, 200, 500]),
+  'svm_loss_naive': ('svm_loss', _linear_loss(svm_loss_naive),
+                     [100, 500, 2000]),
+  'svm_loss_vectorized': ('svm_loss', _linear_loss(svm_loss_vectorized),
+                          [100, 500, 2000, 10000]),
+  'softmax_loss_naive': ('softmax_loss', _linear_loss(softmax_loss_naive),
+                         [100, 500, 2000]),
+  'softmax_loss_vectorized': ('softmax_loss',
+                              _linear_loss(softmax_loss_vectorized),
+                              [100, 500, 2000, 10000]),
+  'two_layer_net_loss': ('two_layer_net', _two_layer_net,
+                         [100, 500, 2000, 10000]),
+}
+
+BASELINE_CASES = ('knn_two_loops', 'svm_loss_naive', 'softmax_loss_naive')
+
+
+def time_call(func, args, budget=0.5, min_repeats=3, max_repeats=100,
+              max_seconds=None):
+  """
+  Time func(*args), first once and then repeatedly until about budget
+  seconds have been spent, between min_repeats and max_repeats times. If
+  max_seconds is given and the first call takes longer, only that call is
+  reported.
+
+  Returns a dictionary with the median time, its interquartile range and
+  the number of repeats.
+  """
+  start = clock()
+  func(*args)
+  first = clock() - start
+  if max_seconds is not None and first > max_seconds:
+    times = [first]
+  else:
+    repeats = int(min(max(budget / max(first, 1e-9), min_repeats),
+                      max_repeats))
+    times = []
+    for _ in range(repeats):
+      start = clock()
+      func(*args)
+      times.append(clock() - start)
+  q1, median, q3 = np.percentile(times, [25, 50, 75])
+  return {'time_s': float(median), 'iqr_s': float(q3 - q1),
+          'repeats': len(times)}
+
+
+def case_name(name, size):
+  return '%s/%d' % (name, size)
+
+
+def run_benchmarks(cases=None, budget=0.5, max_seconds=5.0, seed=0,
+                   verbose=True):
+  """
+  Run the benchmarks.
+
+  Inputs:
+  - cases: Names of the cases to run; defaults to all of CASES.
+  - budget: Seconds spent on repeats of each case and size.
+  - max_seconds: Once a call takes longer than this, it is timed only once
+    and the larger sizes of the same case are skipped.
+  - seed: Seed of the random data.
+  - verbose: If True, print results as they are measured.
+
+  Returns a dictionary mapping '<case>/<size>' to dictionaries of metrics.
+  """
+  results = {}
+  for name in cases or sorted(CASES):
+    group, setup, sizes = CASES[name]
+    too_slow = False
+    for size in sizes:
+      key = case_name(name, size)
+      if too_slow:
+        result = {'skipped': 'too slow'}
+      else:
+        try:
+          func, args = setup(size, np.random.RandomState(seed))
+          result = time_call(func, args, budget, max_seconds=max_seconds)
+          result['samples_per_s'] = size / result['time_s']
+          too_slow = result['repeats'] == 1
+        except Exception as e:
+          result = {'error': '%s: %s' % (type(e).__name__, e)}
+      result.update({'case': name, 'group': group, 'size': size})
+      results[key] = result
+      if verbose:
+        _print_result(key, result)
+
+  for key, result in results.items():
+    for base in BASELINE_CASES:
+      other = results.get(case_name(base, result['size']), {})
+      if other.get('group') == result['group'] and 'time_s' in other and \
+          'time_s' in result:
+        result['speedup_vs_%s' % base] = other['time_s'] / result['time_s']
+  return results
+
+
+def _print_result(key, result):
+  for status in ('skipped', 'error'):
+    if status in result:
+      print('%-32s %s: %s' % (key, status, result[status]))
+      return
+  print('%-32s %10.3f ms %12.0f samples/s' % (
+    key, 1e3 * result['time_s'], result['samples_per_s']))
+
+
+def plot_scaling(results, filename):
+  """
+  Plot the time of every case against its data size on log-log axes, one
+  subplot per group, and save the figure to filename. Returns False without
+  plotting if matplotlib is not available.
+  """
+  try:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+  except ImportError:
+    return False
+
+  groups = sorted(set(r['group'] for r in results.values()))
+  fig, axes = plt.subplots(1, len(groups), figsize=(4 * len(groups), 3.5),
+                           squeeze=False)
+  for ax, group in zip(axes[0], groups):
+    for name in sorted(CASES):
+      points = sorted((r['size'], r['time_s']) for r in results.values()
+                      if r['case'] == name and r['group'] == group and
+                      'time_s' in r)
+      if points:
+        sizes, times = zip(*points)
+        ax.loglog(sizes, times, 'o-', label=name)
+    ax.set_title(group)
+    ax.set_xlabel('size')
+    ax.set_ylabel('seconds')
+    ax.legend(fontsize='small')
+  fig.tight_layout()
+  fig.savefig(filename)
+  plt.close(fig)
+  return True
+
+
+def write_results(filename, results):
+  out = {'machine': machine_info(), 'results': results}
+  with open(filename, 'w') as f:
+    json.dump(out, f, indent=1, sort_keys=True)
+  return out
+
+
+def read_results(filename):
+  with open(filename, 'r') as f:
+    return json.load(f)
+
+
+def compare_results(baseline, current, threshold=1.2):
+  """
+  Compare the median times of two result files.
+
+  Returns a tuple (rows, regressions) of lists of (case, baseline time,
+  current time, ratio) tuples; regressions holds the rows whose time grew by
+  more than threshold.
+  """
+  rows, regressions = [], []
+  for key in sorted(current['results']):
+    old = baseline['results'].get(key, {}).get('time_s')
+    new = current['results'][key].get('time_s')
+    if not old or new is None:
+      continue
+    row = (key, old, new, new / old)
+    rows.append(row)
+    if new / old > threshold:
+      regressions.append(row)
+  return rows, regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Benchmark the assignment 1 classifiers.')
+  parser.add_argument('--out', default=None,
+                      help='JSON file to write results to')
+  parser.add_argument('--baseline-dir', default=None,
+                      help='directory of baselines named by machine tag')
+  parser.add_argument('--update-baseline', action='store_true',
+                      help='store the results as the baseline of this '
+                           'machine')
+  parser.add_argument('--compare', default=None,
+                      help='JSON results to compare to, instead of the '
+                           'baseline of this machine')
+  parser.add_argument('--threshold', type=float, default=1.2,
+                      help='slowdown factor reported as a regression')
+  parser.add_argument('--case', action='append', default=None,
+                      choices=sorted(CASES), help='case to run')
+  parser.add_argument('--budget', type=float, default=0.5,
+                      help='seconds of repeats per case and size')
+  parser.add_argument('--max-seconds', type=float, default=5.0)
+  parser.add_argument('--plot', default=None,
+                      help='image file to plot the scaling curves to')
+  args = parser.parse_args(argv)
+
+  results = run_benchmarks(args.case, args.budget, args.max_seconds)
+  current = {'machine': machine_info(), 'results': results}
+  if args.out:
+    write_results(args.out, results)
+    print('Results written to %s' % args.out)
+  if args.plot:
+    if plot_scaling(results, args.plot):
+      print('Scaling plot written to %s' % args.plot)
+    else:
+      print('matplotlib is not available; no plot written')
+
+  baseline_file = args.compare
+  if args.baseline_dir:
+    path = os.path.join(args.baseline_dir, machine_tag() + '.json')
+    if args.update_baseline:
+      if not os.path.isdir(args.baseline_dir):
+        os.makedirs(args.baseline_dir)
+      write_results(path, results)
+      print('Baseline written to %s' % path)
+    elif baseline_file is None and os.path.isfile(path):
+      baseline_file = path
+
+  if baseline_file:
+    rows, regressions = compare_results(read_results(baseline_file), current,
+                                        args.threshold)
+    for key, old, new, ratio in rows:
+      print('%-32s %10.3f ms %10.3f ms %7.2fx%s' % (
+        key, 1e3 * old, 1e3 * new, ratio,
+        '  REGRESSION' if ratio > args.threshold else ''))
+    if regressions:
+      return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
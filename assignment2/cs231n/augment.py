@@ -0,0 +1,151 @@
+from builtins import object
+import numpy as np
+
+"""
+This file implements data augmentation for minibatches of images. Every
+function operates on a whole minibatch X of shape (N, C, H, W) at once, using
+strided views and batched indexing rather than a Python loop over images, so
+augmenting a minibatch costs a few passes over its memory.
+
+The functions draw their randomness from rng, which may be the np.random
+module or a np.random.RandomState. They may modify X in place and return the
+augmented minibatch, so they should be applied to copies of the training data
+such as the minibatches produced by Solver or data_loader.BatchLoader.
+"""
+
+
+def random_crop(X, pad, rng=np.random):
+    """
+    Zero-pad every image by pad pixels on each side and take a random crop of
+    the original size from the padded image.
+
+    Inputs:
+    - X: Array of shape (N, C, H, W) giving a minibatch of images.
+    - pad: Number of pixels of padding; crops are shifted by up to pad pixels
+      in each direction.
+    - rng: Source of randomness.
+
+    Returns:
+    - out: Array of shape (N, C, H, W) of cropped images.
+    """
+    N, C, H, W = X.shape
+    X_padded = np.zeros((N, C, H + 2 * pad, W + 2 * pad), dtype=X.dtype)
+    X_padded[:, :, pad:pad + H, pad:pad + W] = X
+
+    # windows[n, i, j] is the crop of image n whose top-left corner is at
+    # (i, j) in the padded image; gathering one window per image gives the
+    # whole minibatch of crops in a single indexing operation.
+    sN, sC, sH, sW = X_padded.strides
+    windows = np.lib.stride_tricks.as_strided(
+        X_padded, shape=(N, 2 * pad + 1, 2 * pad + 1, C, H, W),
+        strides=(sN, sH, sW, sC, sH, sW))
+    dy = rng.randint(0, 2 * pad + 1, size=N)
+    dx = rng.randint(0, 2 * pad + 1, size=N)
+    return windows[np.arange(N), dy, dx]
+
+
+def random_flip(X, rng=np.random, p=0.5):
+    """
+    Flip a random subset of the images horizontally, in place.
+
+    Inputs:
+    - X: Array of shape (N, C, H, W) giving a minibatch of images.
+    - rng: Source of randomness.
+    - p: Probability of flipping each image.
+
+    Returns:
+    - X: The minibatch with the selected images flipped.
+    """
+    flip = rng.rand(X.shape[0]) < p
+    X[flip] = X[flip, :, :, ::-1]
+    return X
+
+
+def color_jitter(X, brightness=0.0, contrast=0.0, saturation=0.0,
+                 rng=np.random):
+    """
+    Randomly perturb the brightness, contrast and saturation of every image,
+    in place. Each image draws its own factors.
+
+    Inputs:
+    - X: Float array of shape (N, C, H, W) giving a minibatch of images.
+    - brightness: An offset drawn uniformly from [-brightness, brightness] is
+      added to every pixel of an image; given in the units of X.
+    - contrast: Each image is scaled about its mean value by a factor drawn
+      uniformly from [1 - contrast, 1 + contrast].
+    - saturation: Each pixel is moved away from or towards its grayscale
+      value (the mean over channels) by a factor drawn uniformly from
+      [1 - saturation, 1 + saturation].
+    - rng: Source of randomness.
+
+    Returns:
+    - X: The jittered minibatch.
+    """
+    N = X.shape[0]
+    factor_shape = (N, 1, 1, 1)
+
+    if saturation > 0:
+        gray = X.mean(axis=1, keepdims=True)
+        factor = rng.uniform(1 - saturation, 1 + saturation, factor_shape)
+        X -= gray
+        X *= factor.astype(X.dtype)
+        X += gray
+    if contrast > 0:
+        mean = X.mean(axis=(1, 2, 3), keepdims=True)
+        factor = rng.uniform(1 - contrast, 1 + contrast, factor_shape)
+        X -= mean
+        X *= factor.astype(X.dtype)
+        X += mean
+    if brightness > 0:
+        offset = rng.uniform(-brightness, brightness, factor_shape)
+        X += offset.astype(X.dtype)
+    return X
+
+
+class Augmenter(object):
+    """
+    An Augmenter chains random crops, horizontal flips and color jitter into
+    a single callable that can be passed as the augment option of a Solver
+    or as the transform of a data_loader.BatchLoader:
+
+    augment = Augmenter(crop_pad=4, flip=True, brightness=20.0)
+    solver = Solver(model, data, augment=augment, ...)
+
+    An Augmenter keeps its own RandomState, which is safe to share between
+    the threads of a BatchLoader.
+    """
+
+    def __init__(self, crop_pad=0, flip=False, brightness=0.0, contrast=0.0,
+                 saturation=0.0, seed=None):
+        """
+        Inputs:
+        - crop_pad: If positive, take random crops with this much padding.
+        - flip: If True, flip half of the images horizontally.
+        - brightness, contrast, saturation: Strength of the color jitter; see
+          color_jitter. Zero disables the corresponding perturbation.
+        - seed: Seed for the random state. If None, a seed is drawn from
+          numpy's global random state so that np.random.seed still makes runs
+          reproducible.
+        """
+        self.crop_pad = crop_pad
+        self.flip = flip
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        if seed is None:
+            seed = np.random.randint(2**31 - 1)
+        self.rng = np.random.RandomState(seed)
+
+    def __call__(self, X):
+        """
+        Augment a minibatch X of shape (N, C, H, W), possibly in place, and
+        return the augmented minibatch.
+        """
+        if self.crop_pad > 0:
+            X = random_crop(X, self.crop_pad, self.rng)
+        if self.flip:
+            X = random_flip(X, self.rng)
+        if self.brightness > 0 or self.contrast > 0 or self.saturation > 0:
+            X = color_jitter(X, self.brightness, self.contrast,
+                             self.saturation, self.rng)
+        return X
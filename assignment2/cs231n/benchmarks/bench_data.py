@@ -0,0 +1,303 @@
+from __future__ import print_function, division
+from builtins import range
+import argparse
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from cs231n.data_utils import (load_CIFAR10, get_CIFAR10_data,
+                               load_tiny_imagenet, load_imagenet_val)
+from cs231n.timers import clock
+from cs231n.benchmarks.common import (PeakMemory, run_isolated,
+                                      summarize, write_results, read_results,
+                                      compare_results, print_comparison)
+
+"""
+Benchmarks for the data loaders in cs231n.data_utils.
+
+Synthetic datasets with the on-disk layout of CIFAR-10, Tiny ImageNet and the
+ImageNet validation sample are generated locally, so no download is needed.
+Every loader then runs in a fresh process: the first call is timed as the
+cold run and its peak resident memory is recorded, and further calls in the
+same process are timed as warm runs (the files are then in the page cache).
+For cached loaders the cold run also builds the cache. Optionally a separate
+run measures the peak memory allocated by Python and numpy with tracemalloc.
+
+Run from the assignment2 directory:
+
+python -m cs231n.benchmarks.bench_data --out data_results.json
+python -m cs231n.benchmarks.bench_data --out new.json --compare old.json
+"""
+
+
+METRICS = ('cold_s', 'warm_s', 'peak_rss_bytes', 'peak_traced_bytes')
+
+
+def make_cifar10_fixture(root, seed=0):
+    """
+    Write random CIFAR-10 python batches to
+    root/cs231n/datasets/cifar-10-batches-py, where get_CIFAR10_data expects
+    them relative to the working directory.
+    """
+    cifar10_dir = os.path.join(root, 'cs231n', 'datasets',
+                               'cifar-10-batches-py')
+    if not os.path.isdir(cifar10_dir):
+        os.makedirs(cifar10_dir)
+    rng = np.random.RandomState(seed)
+    names = ['data_batch_%d' % b for b in range(1, 6)] + ['test_batch']
+    for name in names:
+        batch = {
+          'data': rng.randint(0, 256, (10000, 3072)).astype(np.uint8),
+          'labels': list(rng.randint(0, 10, 10000)),
+        }
+        with open(os.path.join(cifar10_dir, name), 'wb') as f:
+            pickle.dump(batch, f, protocol=2)
+    return cifar10_dir
+
+
+def make_tiny_imagenet_fixture(root, num_classes=20, images_per_class=50,
+                               num_val=200, num_test=200, seed=0):
+    """
+    Write a random dataset with the directory structure of Tiny ImageNet to
+    root/tiny-imagenet. About one image in fifty is grayscale, as in the real
+    dataset.
+    """
+    from PIL import Image
+
+    path = os.path.join(root, 'tiny-imagenet')
+    rng = np.random.RandomState(seed)
+    wnids = ['n%08d' % i for i in range(num_classes)]
+
+    def write_image(filename):
+        if rng.rand() < 0.02:
+            img = rng.randint(0, 256, (64, 64))
+        else:
+            img = rng.randint(0, 256, (64, 64, 3))
+        Image.fromarray(img.astype(np.uint8)).save(filename, quality=90)
+
+    def makedirs(d):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+        return d
+
+    makedirs(path)
+    with open(os.path.join(path, 'wnids.txt'), 'w') as f:
+        f.write('\n'.join(wnids) + '\n')
+    with open(os.path.join(path, 'words.txt'), 'w') as f:
+        for i, wnid in enumerate(wnids):
+            f.write('%s\tclass %d, synset %d\n' % (wnid, i, i))
+
+    for wnid in wnids:
+        image_dir = makedirs(os.path.join(path, 'train', wnid, 'images'))
+        boxes_file = os.path.join(path, 'train', wnid, '%s_boxes.txt' % wnid)
+        with open(boxes_file, 'w') as f:
+            for j in range(images_per_class):
+                name = '%s_%d.JPEG' % (wnid, j)
+                write_image(os.path.join(image_dir, name))
+                f.write('%s\t0\t0\t63\t63\n' % name)
+
+    image_dir = makedirs(os.path.join(path, 'val', 'images'))
+    with open(os.path.join(path, 'val', 'val_annotations.txt'), 'w') as f:
+        for j in range(num_val):
+            name = 'val_%d.JPEG' % j
+            write_image(os.path.join(image_dir, name))
+            f.write('%s\t%s\t0\t0\t63\t63\n' % (name, wnids[j % num_classes]))
+
+    image_dir = makedirs(os.path.join(path, 'test', 'images'))
+    for j in range(num_test):
+        write_image(os.path.join(image_dir, 'test_%d.JPEG' % j))
+    return path
+
+
+def make_imagenet_val_fixture(root, seed=0):
+    """
+    Write a random root/cs231n/datasets/imagenet_val_25.npz.
+    """
+    rng = np.random.RandomState(seed)
+    datasets_dir = os.path.join(root, 'cs231n', 'datasets')
+    if not os.path.isdir(datasets_dir):
+        os.makedirs(datasets_dir)
+    label_map = {i: 'class %d' % i for i in range(1000)}
+    np.savez(os.path.join(datasets_dir, 'imagenet_val_25.npz'),
+             X=rng.randint(0, 256, (25, 224, 224, 3)).astype(np.uint8),
+             y=rng.randint(0, 1000, 25),
+             label_map=np.array(label_map, dtype=object))
+
+
+def make_fixtures(root, tiny_kwargs=None):
+    make_cifar10_fixture(root)
+    make_tiny_imagenet_fixture(root, **(tiny_kwargs or {}))
+    make_imagenet_val_fixture(root)
+
+
+# Each case is a function of the fixture root that runs one loader. Cases
+# are looked up by name in the child processes.
+
+def _load_cifar10(root):
+    return load_CIFAR10('cs231n/datasets/cifar-10-batches-py')
+
+
+def _load_cifar10_uint8(root):
+    return load_CIFAR10('cs231n/datasets/cifar-10-batches-py', dtype=np.uint8)
+
+
+def _get_cifar10_data(root):
+    return get_CIFAR10_data()
+
+
+def _get_cifar10_data_lazy(root):
+    return get_CIFAR10_data(lazy=True)
+
+
+def _load_tiny_imagenet(root):
+    return load_tiny_imagenet(os.path.join(root, 'tiny-imagenet'))
+
+
+def _load_tiny_imagenet_cached(root):
+    return load_tiny_imagenet(os.path.join(root, 'tiny-imagenet'),
+                              cache_dir=os.path.join(root, 'tiny-cache'))
+
+
+def _clear_tiny_imagenet_cache(root):
+    shutil.rmtree(os.path.join(root, 'tiny-cache'), ignore_errors=True)
+
+
+def _load_imagenet_val(root):
+    return load_imagenet_val()
+
+
+# name -> (run, setup run before the cold call or None)
+CASES = {
+  'load_CIFAR10': (_load_cifar10, None),
+  'load_CIFAR10_uint8': (_load_cifar10_uint8, None),
+  'get_CIFAR10_data': (_get_cifar10_data, None),
+  'get_CIFAR10_data_lazy': (_get_cifar10_data_lazy, None),
+  'load_tiny_imagenet': (_load_tiny_imagenet, None),
+  'load_tiny_imagenet_cached': (_load_tiny_imagenet_cached,
+                                _clear_tiny_imagenet_cache),
+  'load_imagenet_val': (_load_imagenet_val, None),
+}
+
+
+def _measure(name, root, warm_repeats):
+    run, setup = CASES[name]
+    os.chdir(root)
+    if setup is not None:
+        setup(root)
+    with PeakMemory(trace=False) as mem:
+        start = clock()
+        result = run(root)
+        cold = clock() - start
+    del result
+    warm = []
+    for _ in range(warm_repeats):
+        start = clock()
+        result = run(root)
+        warm.append(clock() - start)
+        del result
+    return cold, mem.rss_bytes, warm
+
+
+def _measure_traced(name, root):
+    run, setup = CASES[name]
+    os.chdir(root)
+    if setup is not None:
+        setup(root)
+    with PeakMemory(trace=True) as mem:
+        run(root)
+    return mem.traced_bytes
+
+
+def run_benchmarks(root, cases=None, warm_repeats=3, trace_memory=True,
+                   verbose=True):
+    """
+    Run the data loading benchmarks on the fixtures in root.
+
+    Inputs:
+    - root: Directory holding the fixtures written by make_fixtures.
+    - cases: Names of the cases to run; defaults to all of CASES.
+    - warm_repeats: Number of warm calls timed after the cold one.
+    - trace_memory: If True, measure the peak traced memory of every case in
+      an additional process.
+    - verbose: If True, print results as they are measured.
+
+    Returns a dictionary mapping case names to dictionaries of metrics.
+    """
+    results = {}
+    for name in cases or sorted(CASES):
+        try:
+            cold, rss, warm = run_isolated(_measure, name, root, warm_repeats)
+            result = {'cold_s': cold, 'peak_rss_bytes': rss}
+            if warm:
+                result['warm'] = summarize(warm)
+                result['warm_s'] = result['warm']['median']
+            if trace_memory:
+                result['peak_traced_bytes'] = run_isolated(
+                    _measure_traced, name, root)
+        except RuntimeError as e:
+            result = {'error': str(e)}
+        results[name] = result
+        if verbose:
+            if 'error' in result:
+                print('%-28s error: %s' % (name, result['error']))
+            else:
+                print('%-28s cold %8.3fs  warm %8.3fs  peak RSS %8.1f MB' % (
+                    name, cold, result.get('warm_s', float('nan')),
+                    (rss or 0) / 2.0**20))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the cs231n data loaders on synthetic data.')
+    parser.add_argument('--out', default='data_results.json',
+                        help='JSON file to write results to')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of an earlier run to compare to')
+    parser.add_argument('--threshold', type=float, default=1.1,
+                        help='slowdown factor reported as a regression')
+    parser.add_argument('--fixture-dir', default=None,
+                        help='directory for the synthetic datasets; a '
+                             'temporary directory is used by default')
+    parser.add_argument('--case', action='append', default=None,
+                        choices=sorted(CASES), help='case to run')
+    parser.add_argument('--warm-repeats', type=int, default=3)
+    parser.add_argument('--tiny-classes', type=int, default=20)
+    parser.add_argument('--tiny-images-per-class', type=int, default=50)
+    parser.add_argument('--no-trace', action='store_true',
+                        help='skip the tracemalloc measurements')
+    args = parser.parse_args(argv)
+
+    root = args.fixture_dir or tempfile.mkdtemp(prefix='cs231n_bench_')
+    root = os.path.abspath(root)
+    try:
+        if not os.path.isfile(os.path.join(root, 'cs231n', 'datasets',
+                                           'imagenet_val_25.npz')):
+            print('Writing fixtures to %s' % root)
+            make_fixtures(root, {
+              'num_classes': args.tiny_classes,
+              'images_per_class': args.tiny_images_per_class,
+            })
+        results = run_benchmarks(root, args.case, args.warm_repeats,
+                                 not args.no_trace)
+    finally:
+        if args.fixture_dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    current = write_results(args.out, results)
+    print('Results written to %s' % args.out)
+    if args.compare:
+        rows, regressions = compare_results(read_results(args.compare),
+                                            current, METRICS, args.threshold)
+        print_comparison(rows, regressions)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,363 @@
+from __future__ import print_function, division
+from builtins import range
+import argparse
+import sys
+
+import numpy as np
+
+from cs231n import layers
+from cs231n import fast_layers
+from cs231n.flops import layer_cost
+from cs231n.timers import clock
+from cs231n.benchmarks.common import (summarize, write_results, read_results,
+                                      compare_results, print_comparison)
+
+"""
+Micro-benchmarks for the forward and backward functions in cs231n.layers and
+cs231n.fast_layers.
+
+Every operation (convolution, max pooling, affine, ReLU, batch, layer and
+group normalization, dropout) is timed for each of its implementations over a
+sweep of shapes, including the ones used by ThreeLayerConvNet and
+FullyConnectedNet on CIFAR-10. Inputs are random with a fixed seed, and each
+case is repeated until a time budget is used up (at least three
+times). For every case the median time, samples per second and modelled
+GFLOP/s (see flops.py) are reported, along with the speedup over the naive
+implementation of the same operation and shape.
+
+Implementations that need the Cython extension (im2col_cython) are skipped
+when it has not been built.
+
+Run from the assignment2 directory:
+
+python -m cs231n.benchmarks.bench_layers --out layers.json
+python -m cs231n.benchmarks.bench_layers --out new.json --compare layers.json
+
+With --compare the run exits with status 1 if any case is slower than the
+baseline by more than --threshold.
+"""
+
+
+METRICS = ('time_s',)
+HAVE_CYTHON = hasattr(fast_layers, 'im2col_cython')
+
+
+def _conv_inputs(shape, rng):
+    N, C, H, F, K, stride = shape
+    x = rng.randn(N, C, H, H)
+    w = rng.randn(F, C, K, K)
+    b = rng.randn(F)
+    return x, w, b, {'stride': stride, 'pad': (K - 1) // 2}
+
+
+def _pool_inputs(shape, rng):
+    N, C, H, size, stride = shape
+    x = rng.randn(N, C, H, H)
+    return x, {'pool_height': size, 'pool_width': size, 'stride': stride}
+
+
+def _forward(make_inputs, func):
+    def setup(shape, rng):
+        return make_inputs(shape, rng)
+    return setup, func
+
+
+def _backward(make_inputs, forward, func):
+    # The backward pass runs on the cache of the matching forward pass
+    def setup(shape, rng):
+        out, cache = forward(*make_inputs(shape, rng))
+        return rng.randn(*out.shape), cache
+    return setup, func
+
+
+def _affine_inputs(shape, rng):
+    N, D, M = shape
+    return rng.randn(N, D), rng.randn(D, M), rng.randn(M)
+
+
+def _relu_inputs(shape, rng):
+    return (rng.randn(*shape),)
+
+
+def _bn_inputs(shape, rng):
+    N, D = shape
+    return (rng.randn(N, D), rng.randn(D), rng.randn(D),
+            {'mode': 'train'})
+
+
+def _ln_inputs(shape, rng):
+    N, D = shape
+    return rng.randn(N, D), rng.randn(D), rng.randn(D), {}
+
+
+def _spatial_bn_inputs(shape, rng):
+    N, C, H = shape
+    return (rng.randn(N, C, H, H), rng.randn(C), rng.randn(C),
+            {'mode': 'train'})
+
+
+def _gn_inputs(shape, rng):
+    N, C, H, G = shape
+    return (rng.randn(N, C, H, H), rng.randn(1, C, 1, 1),
+            rng.randn(1, C, 1, 1), G, {})
+
+
+def _dropout_inputs(shape, rng):
+    return rng.randn(*shape), {'mode': 'train', 'p': 0.5}
+
+
+L, FL = layers, fast_layers
+
+# Operation -> (shapes, {implementation: (setup, function, needs_cython)}).
+# Conv shapes are (N, C, H, F, K, stride) with H = W and 'same' padding; pool
+# shapes are (N, C, H, size, stride).
+OPS = {
+  'conv_forward': (
+    [(2, 3, 16, 8, 3, 1), (50, 3, 32, 32, 7, 1), (50, 32, 16, 64, 3, 1),
+     (50, 64, 16, 64, 3, 2)],
+    {'naive': _forward(_conv_inputs, L.conv_forward_naive) + (False,),
+     'im2col': _forward(_conv_inputs, FL.conv_forward_im2col) + (True,),
+     'strides': _forward(_conv_inputs, FL.conv_forward_strides) + (False,)}),
+  'conv_backward': (
+    [(2, 3, 16, 8, 3, 1), (50, 3, 32, 32, 7, 1), (50, 32, 16, 64, 3, 1),
+     (50, 64, 16, 64, 3, 2)],
+    {'naive': _backward(_conv_inputs, L.conv_forward_naive,
+                        L.conv_backward_naive) + (False,),
+     'im2col': _backward(_conv_inputs, FL.conv_forward_im2col,
+                         FL.conv_backward_im2col) + (True,),
+     'strides': _backward(_conv_inputs, FL.conv_forward_strides,
+                          FL.conv_backward_strides) + (True,)}),
+  'max_pool_forward': (
+    [(2, 3, 16, 2, 2), (50, 32, 32, 2, 2), (50, 64, 16, 4, 4)],
+    {'naive': _forward(_pool_inputs, L.max_pool_forward_naive) + (False,),
+     'reshape': _forward(_pool_inputs, FL.max_pool_forward_reshape) +
+                (False,),
+     'im2col': _forward(_pool_inputs, FL.max_pool_forward_im2col) + (True,),
+     'fast': _forward(_pool_inputs, FL.max_pool_forward_fast) + (True,)}),
+  'max_pool_backward': (
+    [(2, 3, 16, 2, 2), (50, 32, 32, 2, 2), (50, 64, 16, 4, 4)],
+    {'naive': _backward(_pool_inputs, L.max_pool_forward_naive,
+                        L.max_pool_backward_naive) + (False,),
+     'reshape': _backward(_pool_inputs, FL.max_pool_forward_reshape,
+                          FL.max_pool_backward_reshape) + (False,),
+     'im2col': _backward(_pool_inputs, FL.max_pool_forward_im2col,
+                         FL.max_pool_backward_im2col) + (True,),
+     'fast': _backward(_pool_inputs, FL.max_pool_forward_fast,
+                       FL.max_pool_backward_fast) + (True,)}),
+  'affine_forward': (
+    [(100, 3072, 100), (100, 3072, 512), (50, 8192, 100)],
+    {'naive': _forward(_affine_inputs, L.affine_forward) + (False,)}),
+  'affine_backward': (
+    [(100, 3072, 100), (100, 3072, 512), (50, 8192, 100)],
+    {'naive': _backward(_affine_inputs, L.affine_forward,
+                        L.affine_backward) + (False,)}),
+  'relu_forward': (
+    [(100, 512), (50, 32, 32, 32)],
+    {'naive': _forward(_relu_inputs, L.relu_forward) + (False,)}),
+  'relu_backward': (
+    [(100, 512), (50, 32, 32, 32)],
+    {'naive': _backward(_relu_inputs, L.relu_forward,
+                        L.relu_backward) + (False,)}),
+  'batchnorm_forward': (
+    [(100, 100), (100, 1024)],
+    {'naive': _forward(_bn_inputs, L.batchnorm_forward) + (False,)}),
+  'batchnorm_backward': (
+    [(100, 100), (100, 1024)],
+    {'naive': _backward(_bn_inputs, L.batchnorm_forward,
+                        L.batchnorm_backward) + (False,),
+     'alt': _backward(_bn_inputs, L.batchnorm_forward,
+                      L.batchnorm_backward_alt) + (False,)}),
+  'layernorm_forward': (
+    [(100, 100), (100, 1024)],
+    {'naive': _forward(_ln_inputs, L.layernorm_forward) + (False,)}),
+  'layernorm_backward': (
+    [(100, 100), (100, 1024)],
+    {'naive': _backward(_ln_inputs, L.layernorm_forward,
+                        L.layernorm_backward) + (False,)}),
+  'spatial_batchnorm_forward': (
+    [(50, 32, 32), (50, 64, 16)],
+    {'naive': _forward(_spatial_bn_inputs, L.spatial_batchnorm_forward) +
+              (False,)}),
+  'spatial_batchnorm_backward': (
+    [(50, 32, 32), (50, 64, 16)],
+    {'naive': _backward(_spatial_bn_inputs, L.spatial_batchnorm_forward,
+                        L.spatial_batchnorm_backward) + (False,)}),
+  'spatial_groupnorm_forward': (
+    [(50, 32, 32, 4), (50, 64, 16, 8)],
+    {'naive': _forward(_gn_inputs, L.spatial_groupnorm_forward) + (False,)}),
+  'spatial_groupnorm_backward': (
+    [(50, 32, 32, 4), (50, 64, 16, 8)],
+    {'naive': _backward(_gn_inputs, L.spatial_groupnorm_forward,
+                        L.spatial_groupnorm_backward) + (False,)}),
+  'dropout_forward': (
+    [(100, 512), (50, 32, 32, 32)],
+    {'naive': _forward(_dropout_inputs, L.dropout_forward) + (False,)}),
+  'dropout_backward': (
+    [(100, 512), (50, 32, 32, 32)],
+    {'naive': _backward(_dropout_inputs, L.dropout_forward,
+                        L.dropout_backward) + (False,)}),
+}
+
+
+def case_name(op, impl, shape):
+    return '%s/%s/%s' % (op, impl, 'x'.join(str(d) for d in shape))
+
+
+def time_case(setup, func, shape, budget=1.0, min_repeats=3,
+              max_repeats=100, max_seconds=None, seed=0):
+    """
+    Time one implementation on one shape.
+
+    Inputs:
+    - setup: Function of (shape, rng) returning the arguments of func.
+    - func: The layer function.
+    - shape: Shape tuple passed to setup.
+    - budget: Approximate number of seconds to spend on repeats.
+    - min_repeats, max_repeats: Bounds on the number of timed calls.
+    - max_seconds: If not None and the first call takes longer than this,
+      report that call alone instead of repeating it.
+    - seed: Seed of the random inputs.
+
+    Returns a dictionary of metrics.
+    """
+    args = setup(shape, np.random.RandomState(seed))
+    start = clock()
+    result = func(*args)
+    first = clock() - start
+    repeats = int(min(max(budget / max(first, 1e-9), min_repeats),
+                      max_repeats))
+    times = []
+    if max_seconds is not None and first > max_seconds:
+        repeats, times = 0, [first]
+    for _ in range(repeats):
+        start = clock()
+        func(*args)
+        times.append(clock() - start)
+
+    stats = summarize(times)
+    N = shape[0]
+    metrics = {
+      'time_s': stats['median'],
+      'iqr_s': stats['iqr'],
+      'repeats': stats['repeats'],
+      'samples_per_s': N / stats['median'],
+    }
+    cost = layer_cost(func.__name__, args, result)
+    if cost is not None:
+        metrics['gflops_per_s'] = cost[0] / stats['median'] / 1e9
+        metrics['gb_per_s'] = cost[1] / stats['median'] / 1e9
+    return metrics
+
+
+def run_benchmarks(ops=None, impls=None, budget=1.0, max_naive_seconds=None,
+                   verbose=True):
+    """
+    Run the layer benchmarks.
+
+    Inputs:
+    - ops: Names of the operations to run; defaults to all of OPS.
+    - impls: If not None, only run these implementations.
+    - budget: Seconds spent on repeats of each case.
+    - max_naive_seconds: If not None, a naive implementation whose first
+      call takes longer than this is timed once, and its remaining shapes
+      are skipped.
+    - verbose: If True, print results as they are measured.
+
+    Returns a dictionary mapping case names to dictionaries of metrics.
+    """
+    results = {}
+    for op in ops or sorted(OPS):
+        shapes, implementations = OPS[op]
+        for impl in sorted(implementations):
+            if impls is not None and impl not in impls:
+                continue
+            setup, func, needs_cython = implementations[impl]
+            too_slow = False
+            for shape in shapes:
+                name = case_name(op, impl, shape)
+                if needs_cython and not HAVE_CYTHON:
+                    results[name] = {'skipped': 'im2col_cython not built'}
+                elif too_slow:
+                    results[name] = {'skipped': 'naive too slow'}
+                else:
+                    max_seconds = max_naive_seconds if impl == 'naive' \
+                        else None
+                    try:
+                        results[name] = time_case(setup, func, shape, budget,
+                                                  max_seconds=max_seconds)
+                    except Exception as e:
+                        results[name] = {'error': '%s: %s' % (
+                            type(e).__name__, e)}
+                    too_slow = results[name].get('repeats') == 1
+                if verbose:
+                    _print_case(name, results[name])
+
+    _add_speedups(results)
+    return results
+
+
+def _add_speedups(results):
+    for name, r in results.items():
+        op, impl, shape = name.split('/')
+        naive = results.get('%s/naive/%s' % (op, shape), {})
+        if 'time_s' in r and 'time_s' in naive:
+            r['speedup_vs_naive'] = naive['time_s'] / r['time_s']
+
+
+def _print_case(name, r):
+    for key in ('skipped', 'error'):
+        if key in r:
+            print('%-52s %s: %s' % (name, key, r[key]))
+            return
+    line = '%-52s %10.3f ms %12.0f samples/s' % (
+        name, 1e3 * r['time_s'], r['samples_per_s'])
+    if 'gflops_per_s' in r:
+        line += ' %8.2f GFLOP/s' % r['gflops_per_s']
+    print(line)
+
+
+def print_speedups(results):
+    rows = [(name, r['speedup_vs_naive']) for name, r in results.items()
+            if 'speedup_vs_naive' in r and '/naive/' not in name]
+    if rows:
+        print('\nSpeedup over naive:')
+    for name, speedup in sorted(rows):
+        print('%-52s %8.1fx' % (name, speedup))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the cs231n layer implementations.')
+    parser.add_argument('--out', default='layers_results.json',
+                        help='JSON file to write results to')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of an earlier run to compare to')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown factor reported as a regression')
+    parser.add_argument('--op', action='append', default=None,
+                        choices=sorted(OPS), help='operation to run')
+    parser.add_argument('--impl', action='append', default=None,
+                        help='implementation to run, such as naive')
+    parser.add_argument('--budget', type=float, default=1.0,
+                        help='seconds of repeats per case')
+    parser.add_argument('--max-naive-seconds', type=float, default=5.0,
+                        help='skip larger shapes of a naive implementation '
+                             'once a call takes longer than this')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.op, args.impl, args.budget,
+                             args.max_naive_seconds)
+    print_speedups(results)
+    current = write_results(args.out, results)
+    print('Results written to %s' % args.out)
+    if args.compare:
+        rows, regressions = compare_results(read_results(args.compare),
+                                            current, METRICS, args.threshold)
+        print_comparison(rows, regressions)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
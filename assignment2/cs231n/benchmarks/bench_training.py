@@ -0,0 +1,289 @@
+from __future__ import print_function, division
+from builtins import range
+import argparse
+import sys
+from fractions import Fraction
+
+import numpy as np
+
+from cs231n.classifiers.fc_net import FullyConnectedNet
+from cs231n.classifiers.cnn import ThreeLayerConvNet
+from cs231n.solver import Solver
+from cs231n.timers import PhaseTimer
+from cs231n.benchmarks.common import (run_isolated, summarize, write_results,
+                                      read_results, compare_results,
+                                      print_comparison)
+
+"""
+End-to-end training benchmarks for models trained through the Solver.
+
+Every model is trained on a synthetic, learnable dataset shaped like
+CIFAR-10: each class has a smooth random template image, and a sample is its
+class template plus Gaussian noise. Training runs in slices of check_every
+iterations, continuing the same Solver, and the validation accuracy is
+checked after every slice until it reaches the target accuracy or
+max_epochs have been run. The default noise and target make every model
+train for tens to hundreds of iterations, so that the time to the target
+is not dominated by timer noise and the check granularity. For every trial
+this measures
+
+- images_per_s: training images per second, counting only the sample,
+  forward_backward and update phases of the Solver (see timers.py);
+- time_to_target_s, epochs_to_target: training time and epochs until the
+  validation accuracy first reached the target, or None if it never did.
+
+Each model runs in a fresh process, first trains for a few warmup
+iterations that are not measured, and then runs several trials with fixed
+seeds; the median and interquartile range over the trials are reported.
+
+Run from the assignment2 directory:
+
+python -m cs231n.benchmarks.bench_training --out training.json
+python -m cs231n.benchmarks.bench_training --out new.json \\
+    --compare training.json
+"""
+
+
+METRICS = ('images_per_s', 'time_to_target_s')
+HIGHER_IS_BETTER = ('images_per_s',)
+
+
+def make_synthetic_cifar(num_train=2000, num_val=500, num_classes=10,
+                         noise=6.0, dtype=np.float32, seed=0):
+    """
+    Make a learnable dataset with the shapes of CIFAR-10.
+
+    Inputs:
+    - num_train, num_val: Number of training and validation samples.
+    - num_classes: Number of classes.
+    - noise: Standard deviation of the noise added to the class templates,
+      which have unit variance; larger values make the task harder.
+    - dtype: Data type of the images.
+    - seed: Random seed.
+
+    Returns a dictionary with X_train, y_train, X_val and y_val, the images
+    being of shape (N, 3, 32, 32).
+    """
+    rng = np.random.RandomState(seed)
+    templates = rng.randn(num_classes, 3, 8, 8)
+    templates = templates.repeat(4, axis=2).repeat(4, axis=3)
+
+    def sample(n):
+        y = rng.randint(num_classes, size=n)
+        X = templates[y] + noise * rng.randn(n, 3, 32, 32)
+        return X.astype(dtype), y
+
+    X_train, y_train = sample(num_train)
+    X_val, y_val = sample(num_val)
+    return {'X_train': X_train, 'y_train': y_train,
+            'X_val': X_val, 'y_val': y_val}
+
+
+def _fc(seed, **kwargs):
+    # The seed argument of FullyConnectedNet fixes the dropout masks for
+    # gradient checking, and would also reseed the minibatch sampling on
+    # every iteration, so only the initialization is seeded here
+    np.random.seed(seed)
+    return FullyConnectedNet([100, 100], weight_scale=5e-2, **kwargs)
+
+
+def _cnn(seed):
+    np.random.seed(seed)
+    return ThreeLayerConvNet(weight_scale=1e-2)
+
+
+# name -> (function of the seed building the model, Solver options)
+MODELS = {
+  'fc': (lambda seed: _fc(seed),
+         {'update_rule': 'adam', 'optim_config': {'learning_rate': 1e-3}}),
+  'fc_batchnorm': (lambda seed: _fc(seed, normalization='batchnorm'),
+                   {'update_rule': 'adam',
+                    'optim_config': {'learning_rate': 1e-3}}),
+  'fc_dropout': (lambda seed: _fc(seed, dropout=0.5),
+                 {'update_rule': 'adam',
+                  'optim_config': {'learning_rate': 1e-3}}),
+  'fc_batchnorm_dropout': (lambda seed: _fc(seed, normalization='batchnorm',
+                                            dropout=0.5),
+                           {'update_rule': 'adam',
+                            'optim_config': {'learning_rate': 1e-3}}),
+  'three_layer_convnet': (_cnn,
+                          {'update_rule': 'adam',
+                           'optim_config': {'learning_rate': 1e-3}}),
+}
+
+
+def _solver(name, data, seed, **kwargs):
+    build, options = MODELS[name]
+    options = dict(options, optim_config=dict(options['optim_config']))
+    options.update(kwargs)
+    np.random.seed(seed)
+    return Solver(build(seed), data, verbose=False, **options)
+
+
+def run_trial(name, data, seed, target_acc=0.9, max_epochs=10,
+              check_every=5, batch_size=50):
+    """
+    Train one model until it reaches a validation accuracy.
+
+    Inputs:
+    - name: Name of the model in MODELS.
+    - data: Dictionary of training and validation data.
+    - seed: Seed of the model initialization and the minibatch sampling.
+    - target_acc: Validation accuracy to reach.
+    - max_epochs: Number of epochs after which training stops regardless.
+    - check_every: Number of iterations between validation accuracy checks.
+    - batch_size: Minibatch size.
+
+    Returns a dictionary of metrics.
+    """
+    timer = PhaseTimer()
+    solver = _solver(name, data, seed, batch_size=batch_size, num_epochs=0,
+                     timer=timer)
+    train_phases = ('sample', 'forward_backward', 'update')
+    result = {'time_to_target_s': None, 'epochs_to_target': None}
+    # Count in whole iterations; the Solver runs int(num_epochs *
+    # iterations_per_epoch) iterations, which a Fraction gives exactly
+    iterations_per_epoch = max(data['X_train'].shape[0] // batch_size, 1)
+    max_iterations = int(max_epochs * iterations_per_epoch)
+    while solver.iteration < max_iterations:
+        iterations = min(solver.iteration + check_every, max_iterations)
+        solver.num_epochs = Fraction(iterations, iterations_per_epoch)
+        solver.train()
+        if solver.val_acc_history[-1] >= target_acc:
+            result['time_to_target_s'] = sum(
+                timer.stats[p].total for p in train_phases)
+            result['epochs_to_target'] = (solver.iteration /
+                                          iterations_per_epoch)
+            break
+
+    seconds = sum(timer.stats[p].total for p in train_phases)
+    result['images_per_s'] = solver.iteration * batch_size / seconds
+    result['best_val_acc'] = solver.best_val_acc
+    result['iterations'] = solver.iteration
+    return result
+
+
+def _run_model(name, data_kwargs, trial_kwargs, trials, warmup_iterations,
+               seed):
+    data = make_synthetic_cifar(seed=seed, **data_kwargs)
+    if warmup_iterations > 0:
+        batch_size = trial_kwargs.get('batch_size', 50)
+        iterations_per_epoch = max(data['X_train'].shape[0] // batch_size, 1)
+        solver = _solver(name, data, seed, batch_size=batch_size,
+                         num_epochs=Fraction(warmup_iterations,
+                                             iterations_per_epoch))
+        solver.train()
+    return [run_trial(name, data, seed + i, **trial_kwargs)
+            for i in range(trials)]
+
+
+def _aggregate(trials):
+    result = {'trials': trials}
+    reached = [t for t in trials if t['time_to_target_s'] is not None]
+    result['trials_reached_target'] = len(reached)
+    for metric, values in [
+            ('images_per_s', [t['images_per_s'] for t in trials]),
+            ('time_to_target_s', [t['time_to_target_s'] for t in reached]),
+            ('epochs_to_target', [t['epochs_to_target'] for t in reached])]:
+        if values:
+            stats = summarize(values)
+            result[metric] = stats['median']
+            result[metric + '_iqr'] = stats['iqr']
+    return result
+
+
+def run_benchmarks(models=None, trials=3, warmup_iterations=10, seed=0,
+                   data_kwargs=None, trial_kwargs=None, verbose=True):
+    """
+    Run the training benchmarks.
+
+    Inputs:
+    - models: Names of the models to run; defaults to all of MODELS.
+    - trials: Number of measured trials per model.
+    - warmup_iterations: Number of unmeasured iterations run first.
+    - seed: Seed of the dataset and of the first trial; trial i uses
+      seed + i.
+    - data_kwargs: Keyword arguments of make_synthetic_cifar.
+    - trial_kwargs: Keyword arguments of run_trial.
+    - verbose: If True, print results as they are measured.
+
+    Returns a dictionary mapping model names to dictionaries of metrics.
+    """
+    results = {}
+    for name in models or sorted(MODELS):
+        try:
+            result = _aggregate(run_isolated(
+                _run_model, name, data_kwargs or {}, trial_kwargs or {},
+                trials, warmup_iterations, seed))
+        except RuntimeError as e:
+            result = {'error': str(e)}
+        results[name] = result
+        if verbose:
+            _print_result(name, result)
+    return results
+
+
+def _print_result(name, r):
+    if 'error' in r:
+        print('%-22s error: %s' % (name, r['error']))
+        return
+    line = '%-22s %9.1f images/s (IQR %7.1f)' % (
+        name, r['images_per_s'], r['images_per_s_iqr'])
+    if 'time_to_target_s' in r:
+        line += '  target in %7.2fs (IQR %5.2f), %.2f epochs, %d/%d trials' % (
+            r['time_to_target_s'], r['time_to_target_s_iqr'],
+            r['epochs_to_target'], r['trials_reached_target'],
+            len(r['trials']))
+    else:
+        line += '  target not reached'
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark end-to-end training through the Solver.')
+    parser.add_argument('--out', default='training_results.json',
+                        help='JSON file to write results to')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of an earlier run to compare to')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown factor reported as a regression')
+    parser.add_argument('--model', action='append', default=None,
+                        choices=sorted(MODELS), help='model to run')
+    parser.add_argument('--trials', type=int, default=3)
+    parser.add_argument('--warmup-iterations', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target-acc', type=float, default=0.9,
+                        help='validation accuracy to time')
+    parser.add_argument('--max-epochs', type=float, default=10)
+    parser.add_argument('--check-every', type=int, default=5,
+                        help='iterations between validation checks')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--num-train', type=int, default=2000)
+    parser.add_argument('--num-val', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=6.0)
+    args = parser.parse_args(argv)
+
+    data_kwargs = {'num_train': args.num_train, 'num_val': args.num_val,
+                   'noise': args.noise}
+    trial_kwargs = {'target_acc': args.target_acc,
+                    'max_epochs': args.max_epochs,
+                    'check_every': args.check_every,
+                    'batch_size': args.batch_size}
+    results = run_benchmarks(args.model, args.trials, args.warmup_iterations,
+                             args.seed, data_kwargs, trial_kwargs)
+    current = write_results(args.out, results, {'settings': dict(
+        data_kwargs, trials=args.trials, seed=args.seed, **trial_kwargs)})
+    print('Results written to %s' % args.out)
+    if args.compare:
+        rows, regressions = compare_results(read_results(args.compare),
+                                            current, METRICS, args.threshold,
+                                            HIGHER_IS_BETTER)
+        print_comparison(rows, regressions)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+from __future__ import print_function, division
+from future import standard_library
+standard_library.install_aliases()
+from builtins import object
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+"""
+Helpers shared by the benchmark modules in this package: peak memory
+measurement, running a measurement in a fresh process, machine tags and
+reading, writing and comparing JSON result files. The clock used for timing
+is cs231n.timers.clock.
+
+Every result file has the form
+
+{
+  "machine": {...},          machine_info() of the machine that ran it
+  "results": {
+    "<case>": {"<metric>": value, ...},
+    ...
+  }
+}
+
+and compare_results() matches cases and metrics by name, so files written by
+different commits of the same benchmark can be compared directly.
+"""
+
+
+def machine_info():
+    """
+    Return a dictionary describing the machine and software versions, used
+    to tag benchmark results.
+    """
+    info = {
+      'hostname': platform.node(),
+      'platform': platform.platform(),
+      'processor': platform.processor() or platform.machine(),
+      'cpu_count': multiprocessing.cpu_count(),
+      'python': platform.python_version(),
+      'numpy': np.__version__,
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    try:
+        info['commit'] = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        info['commit'] = None
+    return info
+
+
+def machine_tag(info=None):
+    """
+    Return a short string identifying a machine, such as 'myhost-x86_64-8',
+    suitable for naming baseline files.
+    """
+    info = info or machine_info()
+    return '%s-%s-%d' % (info['hostname'], platform.machine(),
+                         info['cpu_count'])
+
+
+class PeakMemory(object):
+    """
+    Context manager measuring the peak memory used while its block runs:
+
+    with PeakMemory() as mem:
+        X = load_something()
+    print(mem.rss_bytes, mem.traced_bytes)
+
+    - rss_bytes: Peak resident set size of the process. On Linux the
+      high-water mark is reset on entry, so this is the peak during the
+      block; elsewhere it is the peak over the lifetime of the process,
+      which is why benchmarks measure in a fresh process (see run_isolated).
+    - traced_bytes: Peak memory allocated through Python's allocators
+      (including numpy arrays) during the block, as reported by tracemalloc;
+      None if tracemalloc is unavailable. Memory-mapped files do not count.
+    """
+
+    def __init__(self, trace=True):
+        self.trace = trace and tracemalloc is not None
+        self.rss_bytes = None
+        self.traced_bytes = None
+
+    def __enter__(self):
+        _reset_peak_rss()
+        if self.trace:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *args):
+        if self.trace:
+            self.traced_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.rss_bytes = peak_rss_bytes()
+
+
+def _reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        pass
+
+
+def peak_rss_bytes():
+    """
+    Return the peak resident set size of this process in bytes.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def _isolated_target(results, func, args):
+    try:
+        results.put((True, func(*args)))
+    except Exception as e:
+        results.put((False, '%s: %s' % (type(e).__name__, e)))
+
+
+def run_isolated(func, *args, **kwargs):
+    """
+    Run func(*args) in a fresh child process and return its result, so that
+    memory measurements are not polluted by earlier benchmarks. func must be
+    a module-level function and its result must be picklable.
+
+    Optional arguments:
+    - poll_seconds: How often to check whether the child is still alive
+      while waiting for its result.
+
+    Raises RuntimeError if func raised an exception in the child, or if the
+    child exited without a result, for example because it was killed or
+    crashed in native code.
+    """
+    poll_seconds = kwargs.pop('poll_seconds', 1.0)
+    if kwargs:
+        raise TypeError('Unexpected keyword arguments: %s' %
+                        ', '.join(sorted(kwargs)))
+    ctx = multiprocessing
+    if hasattr(multiprocessing, 'get_context'):
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context(
+            'fork' if 'fork' in methods else methods[0])
+    results = ctx.Queue()
+    process = ctx.Process(target=_isolated_target,
+                          args=(results, func, args))
+    process.start()
+    try:
+        while True:
+            try:
+                ok, result = results.get(timeout=poll_seconds)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    # The result may have been put just before the exit
+                    try:
+                        ok, result = results.get(timeout=poll_seconds)
+                        break
+                    except queue.Empty:
+                        raise RuntimeError(
+                            'Child process exited with code %s without a '
+                            'result' % process.exitcode)
+    finally:
+        process.join(poll_seconds)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    if not ok:
+        raise RuntimeError(result)
+    return result
+
+
+def summarize(times):
+    """
+    Summarize repeated timings as median, min, max and interquartile range.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    q1, median, q3 = np.percentile(times, [25, 50, 75])
+    return {
+      'median': float(median),
+      'min': float(times.min()),
+      'max': float(times.max()),
+      'iqr': float(q3 - q1),
+      'repeats': int(times.size),
+    }
+
+
+def write_results(filename, results, extra=None):
+    """
+    Write a results dictionary, tagged with machine_info(), to a JSON file.
+    """
+    out = {'machine': machine_info(), 'results': results}
+    if extra:
+        out.update(extra)
+    with open(filename, 'w') as f:
+        json.dump(out, f, indent=1, sort_keys=True)
+    return out
+
+
+def read_results(filename):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def compare_results(baseline, current, metrics, threshold=1.1,
+                    higher_is_better=()):
+    """
+    Compare two result files case by case.
+
+    Inputs:
+    - baseline, current: Result dictionaries as written by write_results.
+    - metrics: Names of the metrics to compare.
+    - threshold: A metric regresses if it gets worse by more than this
+      factor.
+    - higher_is_better: Names of metrics, such as throughputs, for which
+      larger values are better; for all others smaller is better.
+
+    Returns a tuple (rows, regressions) where rows is a list of
+    (case, metric, baseline, current, ratio) tuples, ratio being
+    current / baseline, and regressions is the sublist of rows that regressed.
+    """
+    rows, regressions = [], []
+    for case in sorted(current['results']):
+        if case not in baseline['results']:
+            continue
+        old, new = baseline['results'][case], current['results'][case]
+        for metric in metrics:
+            a, b = old.get(metric), new.get(metric)
+            if not a or b is None:
+                continue
+            ratio = b / a
+            row = (case, metric, a, b, ratio)
+            rows.append(row)
+            if metric in higher_is_better:
+                # A throughput of zero means the run is broken
+                worse = 1 / ratio if ratio else float('inf')
+            else:
+                worse = ratio
+            if worse > threshold:
+                regressions.append(row)
+    return rows, regressions
+
+
+def print_comparison(rows, regressions):
+    regressed = set(regressions)
+    for case, metric, a, b, ratio in rows:
+        print('%-40s %-22s %12.4g %12.4g %7.2fx%s' % (
+            case, metric, a, b, ratio, '  REGRESSION' if (
+                case, metric, a, b, ratio) in regressed else ''))
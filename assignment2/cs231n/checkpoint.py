@@ -0,0 +1,541 @@
+from __future__ import print_function
+from future import standard_library
+standard_library.install_aliases()
+from builtins import range
+from builtins import object
+import json
+import numbers
+import os
+import pickle
+import queue
+import shutil
+import threading
+import zlib
+
+import numpy as np
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+"""
+This file implements array-native checkpoints that are written without
+stalling training.
+
+A checkpoint is a set of named numpy arrays plus a small JSON manifest:
+
+directory/<name>.npz    the arrays, in an uncompressed .npz archive
+directory/<name>.json   the manifest: format, array names, shapes, dtypes
+                        and any metadata given at save time
+
+With format 'raw' the arrays are instead written as one .npy file each into
+the directory directory/<name>/, so that they can be memory-mapped when
+loaded. Data and manifest are each written to a temporary name and renamed,
+and the manifest is written last, so an interrupted save never leaves a
+checkpoint that looks complete.
+
+Training state that is not made of arrays (counters, histories, the model
+object without its parameters) is packed by pack_state into one pickled
+uint8 array stored alongside the others.
+
+A CheckpointSeries stores a sequence of such checkpoints compactly, as
+compressed differences between consecutive ones; see its docstring.
+"""
+
+
+MANIFEST = '%s.json'
+
+
+class _ArrayRef(object):
+    """ Placeholder for an array moved out of a state by pack_state. """
+
+    def __init__(self, key):
+        self.key = key
+
+
+def pack_state(state):
+    """
+    Split a nested dictionary into a flat dictionary of arrays.
+
+    Every numpy array found in state or its nested dictionaries is stored
+    under its path of keys joined by '/', and everything else is pickled into
+    the uint8 array '__state__'.
+
+    Inputs:
+    - state: Dictionary with string keys.
+
+    Returns:
+    - arrays: Dictionary mapping names to numpy arrays.
+    """
+    arrays = {}
+
+    def walk(obj, path):
+        if isinstance(obj, np.ndarray):
+            arrays[path] = obj
+            return _ArrayRef(path)
+        if isinstance(obj, dict):
+            return {k: walk(v, '%s/%s' % (path, k) if path else str(k))
+                    for k, v in obj.items()}
+        return obj
+
+    rest = walk(state, '')
+    arrays['__state__'] = np.frombuffer(pickle.dumps(rest, protocol=2),
+                                        dtype=np.uint8)
+    return arrays
+
+
+def unpack_state(arrays):
+    """
+    Inverse of pack_state.
+    """
+    def walk(obj):
+        if isinstance(obj, _ArrayRef):
+            return arrays[obj.key]
+        if isinstance(obj, dict):
+            return {k: walk(v) for k, v in obj.items()}
+        return obj
+
+    return walk(pickle.loads(arrays['__state__'].tobytes()))
+
+
+def load_checkpoint(path, mmap_mode=None):
+    """
+    Load the arrays of a checkpoint written by an AsyncCheckpointWriter.
+
+    Inputs:
+    - path: The manifest (.json), the .npz archive or the directory of a raw
+      checkpoint.
+    - mmap_mode: Memory-map mode for the arrays of raw checkpoints.
+
+    Returns a tuple of:
+    - arrays: Dictionary mapping names to numpy arrays.
+    - manifest: The manifest dictionary.
+    """
+    for ext in ('.json', '.npz'):
+        if path.endswith(ext):
+            path = path[:-len(ext)]
+    with open(MANIFEST % path, 'r') as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(path)
+    data = os.path.join(directory, manifest['file'])
+    if manifest['format'] == 'raw':
+        arrays = {}
+        for i, k in enumerate(manifest['arrays']):
+            arrays[k] = np.load(os.path.join(data, '%d.npy' % i),
+                                mmap_mode=mmap_mode)
+    else:
+        with np.load(data) as f:
+            arrays = {k: f['a%d' % i]
+                      for i, k in enumerate(manifest['arrays'])}
+    return arrays, manifest
+
+
+class AsyncCheckpointWriter(object):
+    """
+    Writes checkpoints of numpy arrays from a background thread.
+
+    save() copies the arrays into one of two preallocated snapshot buffers
+    and returns; a background thread then writes the snapshot to disk while
+    training continues and modifies the originals. A save only blocks if both
+    buffers are still waiting to be written. Only the last keep checkpoints
+    written by the writer are kept on disk.
+
+    With fmt='series', the snapshots are appended to a CheckpointSeries in
+    directory instead, so that their delta compression also runs on the
+    background thread.
+
+    Example usage:
+
+    writer = AsyncCheckpointWriter('checkpoints', keep=3)
+    writer.save('epoch_1', model.params, metadata={'val_acc': 0.5})
+    ...
+    writer.close()
+    arrays, manifest = load_checkpoint('checkpoints/epoch_1.json')
+    """
+
+    def __init__(self, directory, fmt='npz', keep=None, num_buffers=2,
+                 keyframe_every=10):
+        """
+        Inputs:
+        - directory: Directory to write checkpoints to; created if needed.
+        - fmt: 'npz' for one uncompressed .npz archive per checkpoint, 'raw'
+          for a directory of .npy files or 'series' for a CheckpointSeries.
+        - keep: If not None, the number of most recent checkpoints to keep;
+          not supported by a series.
+        - num_buffers: Number of snapshot buffers.
+        - keyframe_every: Keyframe interval of a series.
+        """
+        if fmt not in ('npz', 'raw', 'series'):
+            raise ValueError('Invalid checkpoint format "%s"' % fmt)
+        if fmt == 'series' and keep is not None:
+            raise ValueError('A checkpoint series keeps all checkpoints')
+        self.directory = directory
+        self.fmt = fmt
+        self.keep = keep
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._series = None
+        if fmt == 'series':
+            self._series = CheckpointSeries(directory, keyframe_every)
+
+        self.saved = []
+        self._free = queue.Queue()
+        for _ in range(num_buffers):
+            self._free.put({})
+        self._pending = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def save(self, name, arrays, metadata=None):
+        """
+        Snapshot arrays and queue them to be written as checkpoint name.
+
+        Inputs:
+        - name: Name of the checkpoint, used for its files.
+        - arrays: Dictionary mapping string names to numpy arrays.
+        - metadata: Optional JSON-serializable dictionary for the manifest.
+        """
+        self._check_error()
+        buf = self._free.get()
+        for k in list(buf):
+            if k not in arrays:
+                del buf[k]
+        for k, v in arrays.items():
+            v = np.asarray(v)
+            if k not in buf or buf[k].shape != v.shape or \
+                    buf[k].dtype != v.dtype:
+                buf[k] = np.empty_like(v)
+            np.copyto(buf[k], v)
+        self._pending.put((name, buf, metadata))
+
+    def wait(self):
+        """
+        Block until all queued checkpoints are written.
+        """
+        self._pending.join()
+        self._check_error()
+
+    def close(self):
+        """
+        Write all queued checkpoints and stop the background thread.
+        """
+        if self._thread is None:
+            return
+        self._pending.put(None)
+        self._thread.join()
+        self._thread = None
+        self._check_error()
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._pending.task_done()
+                break
+            name, buf, metadata = item
+            try:
+                if self._error is None:
+                    self._write(name, buf, metadata)
+            except Exception as e:
+                self._error = e
+            self._free.put(buf)
+            self._pending.task_done()
+
+    def _write(self, name, arrays, metadata):
+        if self._series is not None:
+            self._series.append(name, arrays, metadata)
+            return
+        path = os.path.join(self.directory, name)
+        names = sorted(arrays)
+        if self.fmt == 'raw':
+            filename = name
+            tmp = path + '.tmp'
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            for i, k in enumerate(names):
+                np.save(os.path.join(tmp, '%d.npy' % i), arrays[k])
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            filename = name + '.npz'
+            tmp = path + '.npz.tmp'
+            with open(tmp, 'wb') as f:
+                np.savez(f, **{'a%d' % i: arrays[k]
+                               for i, k in enumerate(names)})
+        os.rename(tmp, os.path.join(self.directory, filename))
+
+        manifest = {
+          'format': self.fmt,
+          'file': filename,
+          'arrays': names,
+          'shapes': [list(arrays[k].shape) for k in names],
+          'dtypes': [str(arrays[k].dtype) for k in names],
+          'metadata': metadata or {},
+        }
+        tmp = MANIFEST % path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.rename(tmp, MANIFEST % path)
+
+        if name in self.saved:
+            self.saved.remove(name)
+        self.saved.append(name)
+        if self.keep is not None:
+            while len(self.saved) > self.keep:
+                self._remove(self.saved.pop(0))
+
+    def _remove(self, name):
+        path = os.path.join(self.directory, name)
+        # Remove the manifest first, so a partly removed checkpoint is never
+        # mistaken for a complete one
+        if os.path.isfile(MANIFEST % path):
+            os.remove(MANIFEST % path)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.isfile(path + '.npz'):
+            os.remove(path + '.npz')
+
+
+def _compress(data, codec, level):
+    if codec == 'zlib':
+        return zlib.compress(data, level)
+    if codec == 'lzma':
+        return lzma.compress(data, preset=level)
+    return data
+
+
+def _decompress(data, codec):
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'lzma':
+        return lzma.decompress(data)
+    return data
+
+
+def _bits(a):
+    # View the bytes of an array as unsigned integers of the same width
+    if a.dtype.itemsize in (1, 2, 4, 8):
+        return a.view('u%d' % a.dtype.itemsize)
+    return a.view(np.uint8)
+
+
+def _shuffle(a):
+    # Group byte k of every element together; the sign and exponent bytes of
+    # an XOR delta of floats are mostly zero and compress very well
+    b = np.ascontiguousarray(a).reshape(-1).view(np.uint8)
+    return b.reshape(-1, a.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle(data, dtype, shape):
+    itemsize = np.dtype(dtype).itemsize
+    b = np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1)
+    return np.ascontiguousarray(b.T).view(dtype).reshape(shape)
+
+
+class CheckpointSeries(object):
+    """
+    A CheckpointSeries stores a sequence of checkpoints, such as one per
+    epoch, in a directory:
+
+    directory/series.json    index of all checkpoints
+    directory/00000.bin      compressed arrays of checkpoint 0
+    directory/00001.bin      ...
+
+    Every keyframe_every-th checkpoint is a keyframe holding all arrays in
+    full; every other checkpoint holds, for each array, the XOR of its bits
+    with the same array in the previous checkpoint. Parameters change little
+    between epochs, so the deltas are mostly zero in their high bytes; the
+    bytes of each delta are grouped by significance and compressed with zlib
+    or lzma, which makes a series much smaller than separate full copies
+    while staying lossless. Arrays whose shape or dtype changed are stored in
+    full.
+
+    Loading checkpoint i reads the closest keyframe at or before i and
+    applies at most keyframe_every - 1 deltas.
+
+    Appending a checkpoint under a name that is already in the series, such
+    as when a second training run writes to the same directory, replaces
+    the earlier checkpoint of that name: loading the name returns the new
+    one. The earlier checkpoint stays in the series, since later deltas may
+    depend on it, but no longer has a name and can only be loaded by
+    position.
+
+    Example usage:
+
+    series = CheckpointSeries('run1_series', keyframe_every=10)
+    for epoch in range(num_epochs):
+        ...
+        series.append('epoch_%d' % epoch, model.params)
+    params = series.load('epoch_7')
+    """
+
+    INDEX = 'series.json'
+
+    def __init__(self, directory, keyframe_every=10, codec='zlib', level=6):
+        """
+        Open the series in directory, creating it if needed.
+
+        Inputs:
+        - directory: Directory of the series.
+        - keyframe_every: Store a full keyframe every this many checkpoints.
+        - codec: 'zlib', 'lzma' (if the lzma module is available) or None.
+        - level: Compression level for zlib or preset for lzma.
+        """
+        if codec == 'lzma' and lzma is None:
+            raise ValueError('The lzma module is not available')
+        if codec not in ('zlib', 'lzma', None):
+            raise ValueError('Invalid codec "%s"' % codec)
+        self.directory = directory
+        self.keyframe_every = keyframe_every
+        self.codec = codec
+        self.level = level
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.entries = []
+        index_file = os.path.join(directory, self.INDEX)
+        if os.path.isfile(index_file):
+            with open(index_file, 'r') as f:
+                self.entries = json.load(f)['entries']
+        self._last = None
+        self._cache = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def names(self):
+        return [e['name'] for e in self.entries]
+
+    @property
+    def nbytes(self):
+        """ Total size of the stored checkpoint files. """
+        return sum(e['nbytes'] for e in self.entries)
+
+    def append(self, name, arrays, metadata=None):
+        """
+        Add a checkpoint to the end of the series.
+
+        Inputs:
+        - name: Name of the checkpoint; an earlier checkpoint of the same
+          name is replaced.
+        - arrays: Dictionary mapping string names to numpy arrays.
+        - metadata: Optional JSON-serializable dictionary stored in the index.
+        """
+        i = len(self.entries)
+        keyframe = i % self.keyframe_every == 0
+        if not keyframe and self._last is None:
+            self._last = self.load(i - 1)
+
+        filename = '%05d.bin' % i
+        records = {}
+        offset = 0
+        tmp = os.path.join(self.directory, filename + '.tmp')
+        with open(tmp, 'wb') as f:
+            for k in sorted(arrays):
+                a = np.ascontiguousarray(arrays[k])
+                prev = None if keyframe else self._last.get(k)
+                if prev is not None and prev.shape == a.shape and \
+                        prev.dtype == a.dtype:
+                    mode = 'xor'
+                    a = np.bitwise_xor(_bits(a), _bits(prev))
+                else:
+                    mode = 'full'
+                data = _compress(_shuffle(a), self.codec, self.level)
+                f.write(data)
+                records[k] = {
+                  'mode': mode,
+                  'offset': offset,
+                  'nbytes': len(data),
+                  'shape': list(arrays[k].shape),
+                  'dtype': str(arrays[k].dtype),
+                }
+                offset += len(data)
+        os.rename(tmp, os.path.join(self.directory, filename))
+
+        for entry in self.entries:
+            if entry['name'] == name:
+                entry['name'] = None
+        self.entries.append({
+          'name': name,
+          'file': filename,
+          'keyframe': keyframe,
+          'codec': self.codec,
+          'arrays': records,
+          'nbytes': offset,
+          'metadata': metadata or {},
+        })
+        self._write_index()
+        self._last = {k: np.array(v, copy=True) for k, v in arrays.items()}
+
+    def load(self, key):
+        """
+        Reconstruct a checkpoint.
+
+        Inputs:
+        - key: Name or integer position of the checkpoint, such as a Python
+          or numpy integer; negative integers count from the end.
+
+        Returns:
+        - arrays: Dictionary mapping names to numpy arrays.
+        """
+        if isinstance(key, numbers.Integral):
+            i = key % len(self.entries)
+        else:
+            # Index files written before names were replaced on append may
+            # hold a name more than once; the last one is the newest
+            names = self.names
+            if key not in names:
+                raise ValueError('No checkpoint named "%s"' % key)
+            i = len(names) - 1 - names[::-1].index(key)
+
+        # Start from the cached checkpoint if it is on the way, otherwise
+        # from the closest keyframe
+        start = i
+        while not self.entries[start]['keyframe']:
+            start -= 1
+        arrays = None
+        if self._cache is not None and start <= self._cache[0] <= i:
+            start, arrays = self._cache
+            arrays = dict(arrays)
+        for j in range(start if arrays is None else start + 1, i + 1):
+            arrays = self._apply(self.entries[j], arrays)
+        self._cache = (i, arrays)
+        return {k: v.copy() for k, v in arrays.items()}
+
+    def _apply(self, entry, prev):
+        with open(os.path.join(self.directory, entry['file']), 'rb') as f:
+            data = f.read()
+        arrays = {}
+        for k, r in entry['arrays'].items():
+            chunk = data[r['offset']:r['offset'] + r['nbytes']]
+            dtype = np.dtype(r['dtype'])
+            if r['mode'] == 'xor':
+                delta = _unshuffle(_decompress(chunk, entry['codec']),
+                                   _bits(prev[k]).dtype, r['shape'])
+                a = np.bitwise_xor(delta, _bits(prev[k])).view(dtype)
+            else:
+                a = _unshuffle(_decompress(chunk, entry['codec']), dtype,
+                               r['shape'])
+            arrays[k] = a
+        return arrays
+
+    def _write_index(self):
+        index_file = os.path.join(self.directory, self.INDEX)
+        tmp_file = index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'entries': self.entries}, f, indent=1)
+        os.rename(tmp_file, index_file)
@@ -0,0 +1,164 @@
+from __future__ import print_function, division
+from future import standard_library
+standard_library.install_aliases()
+from builtins import range
+from builtins import object
+import queue
+import threading
+
+import numpy as np
+
+
+class BatchLoader(object):
+    """
+    A BatchLoader samples random minibatches of training data in background
+    threads so that gathering, casting and augmenting the next batches
+    overlaps with the forward and backward pass on the current one.
+
+    Batches are written into a ring of preallocated buffers. Each worker
+    thread repeatedly takes a free buffer, samples batch_size indices with
+    replacement (just like Solver._step), gathers the images and labels into
+    the buffer, applies the optional transform and hands the buffer to the
+    consumer. The arrays returned by next() stay valid until the following
+    call to next(), at which point their buffer is recycled; copy them if
+    they need to outlive the training step.
+
+    Example usage:
+
+    loader = BatchLoader(data['X_train'], data['y_train'], batch_size=100,
+                         prefetch=4, num_workers=2)
+    for t in range(num_iterations):
+        X_batch, y_batch = next(loader)
+        loss, grads = model.loss(X_batch, y_batch)
+        ...
+    loader.close()
+
+    With a single worker and a fixed seed the sequence of batches is
+    deterministic; with several workers batches may be delivered out of
+    order.
+    """
+
+    def __init__(self, X, y, batch_size, prefetch=2, num_workers=1,
+                 dtype=None, transform=None, seed=None):
+        """
+        Construct a new BatchLoader and start its worker threads.
+
+        Inputs:
+        - X: Array or array-like (such as data_utils.ImageDataset) of shape
+          (N, d_1, ..., d_k) giving the training data.
+        - y: Array of shape (N,) giving the training labels.
+        - batch_size: Number of samples per minibatch.
+        - prefetch: Number of minibatches to prepare ahead of the consumer.
+        - num_workers: Number of background threads filling buffers.
+        - dtype: Datatype of the X minibatches; defaults to the datatype
+          produced by indexing X.
+        - transform: If not None, a function applied to each X minibatch
+          before it is handed out, such as data augmentation. It may modify
+          its input in place and must return the transformed batch.
+        - seed: Seed for sampling minibatch indices. If None, a seed is drawn
+          from numpy's global random state so that np.random.seed still makes
+          runs reproducible.
+        """
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.transform = transform
+        if seed is None:
+            seed = np.random.randint(2**31 - 1)
+        self.rng = np.random.RandomState(seed)
+
+        sample = X[:1]
+        if dtype is None:
+            dtype = sample.dtype
+        self.dtype = np.dtype(dtype)
+
+        # One buffer per prefetched batch plus the one held by the consumer
+        num_buffers = max(prefetch, num_workers) + 1
+        self._X_buffers = [np.empty((batch_size,) + sample.shape[1:],
+                                    dtype=self.dtype)
+                           for _ in range(num_buffers)]
+        self._y_buffers = [np.empty(batch_size, dtype=np.asarray(y).dtype)
+                           for _ in range(num_buffers)]
+
+        self._free = queue.Queue()
+        self._ready = queue.Queue()
+        for i in range(num_buffers):
+            self._free.put(i)
+        self._current = None
+        self._closed = False
+
+        self._workers = []
+        for _ in range(num_workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """
+        Return the next minibatch as a tuple (X_batch, y_batch).
+        """
+        if self._closed:
+            raise StopIteration
+        if self._current is not None:
+            self._free.put(self._current)
+            self._current = None
+        i = self._ready.get()
+        if isinstance(i, Exception):
+            self.close()
+            raise i
+        self._current = i
+        return self._X_buffers[i], self._y_buffers[i]
+
+    next = __next__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Stop the worker threads. Batches already handed out stay valid.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._free.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def _work(self):
+        while True:
+            i = self._free.get()
+            if i is None or self._closed:
+                return
+            try:
+                self._fill(self._X_buffers[i], self._y_buffers[i])
+            except Exception as e:
+                self._ready.put(e)
+                return
+            self._ready.put(i)
+
+    def _fill(self, X_buffer, y_buffer):
+        num_train = self.y.shape[0]
+        batch_mask = self.rng.choice(num_train, self.batch_size)
+
+        if isinstance(self.X, np.ndarray) and self.X.dtype == self.dtype:
+            # mode='clip' lets take write straight into the buffer
+            np.take(self.X, batch_mask, axis=0, out=X_buffer, mode='clip')
+        elif hasattr(self.X, 'take') and not isinstance(self.X, np.ndarray):
+            self.X.take(batch_mask, out=X_buffer)
+        else:
+            X_buffer[...] = self.X[batch_mask]
+        np.take(self.y, batch_mask, axis=0, out=y_buffer, mode='clip')
+
+        if self.transform is not None:
+            X_batch = self.transform(X_buffer)
+            if X_batch is not X_buffer:
+                X_buffer[...] = X_batch
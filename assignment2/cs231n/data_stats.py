@@ -0,0 +1,313 @@
+from __future__ import division
+from builtins import range
+from builtins import object
+import os
+import zlib
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+
+class RunningStats(object):
+    """
+    Accumulates the mean and variance of a stream of samples using Welford's
+    algorithm in its batched form (Chan et al.): every chunk of samples is
+    summarized by its count, mean and sum of squared deviations, which are
+    then merged into the running totals. The result is numerically stable
+    and only ever needs one chunk of float64 data in memory.
+
+    Statistics are kept for each element of a sample (per-pixel statistics
+    for images) and, if channel_axis is given, also per channel.
+
+    Two RunningStats over disjoint parts of a dataset can be combined with
+    merge(), which is how compute_stats parallelizes the accumulation.
+    """
+
+    def __init__(self, channel_axis=None):
+        """
+        Inputs:
+        - channel_axis: If not None, the axis of a sample (not counting the
+          sample axis) holding the channels, e.g. 0 for (C, H, W) images.
+        """
+        self.channel_axis = channel_axis
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, X):
+        """
+        Add a chunk of samples to the statistics.
+
+        Inputs:
+        - X: Array of shape (N, d_1, ..., d_k) of any numeric datatype,
+          including uint8 and memory-mapped arrays.
+        """
+        n = X.shape[0]
+        if n == 0:
+            return
+        X = np.asarray(X, dtype=np.float64)
+        mean = X.mean(axis=0)
+        m2 = ((X - mean) ** 2).sum(axis=0)
+        self._merge(n, mean, m2)
+
+    def merge(self, other):
+        """
+        Merge the statistics accumulated by another RunningStats into this
+        one.
+        """
+        if other.count > 0:
+            self._merge(other.count, other.mean, other.m2)
+        return self
+
+    def _merge(self, n, mean, m2):
+        if self.count == 0:
+            self.count, self.mean, self.m2 = n, mean.copy(), m2.copy()
+            return
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * (n / total)
+        self.m2 += m2 + delta ** 2 * (self.count * n / total)
+        self.count = total
+
+    @property
+    def var(self):
+        """ Per-element (population) variance. """
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def channel_mean(self):
+        """ Per-channel mean, computed from the per-element statistics. """
+        return self.mean.mean(axis=self._other_axes())
+
+    def channel_var(self):
+        """
+        Per-channel variance over all samples and positions. This is the
+        variance of the union of the per-element populations, so it adds the
+        spread of the per-element means to their average variance.
+        """
+        axes = self._other_axes()
+        mean = self.mean.mean(axis=axes, keepdims=True)
+        var = (self.var + (self.mean - mean) ** 2).mean(axis=axes)
+        return var
+
+    def channel_std(self):
+        return np.sqrt(self.channel_var())
+
+    def _other_axes(self):
+        if self.channel_axis is None:
+            raise ValueError('channel statistics need a channel_axis')
+        ndim = self.mean.ndim
+        return tuple(i for i in range(ndim) if i != self.channel_axis % ndim)
+
+
+def compute_stats(X, chunk_size=1000, num_workers=1, channel_axis=None):
+    """
+    Compute streaming statistics over a dataset without materializing it as
+    floats.
+
+    Inputs:
+    - X: Array-like of shape (N, d_1, ..., d_k) supporting .shape and slicing
+      along the first axis, such as a uint8 array or a np.memmap.
+    - chunk_size: Number of samples converted to float64 at a time.
+    - num_workers: Number of threads accumulating chunks in parallel; each
+      keeps its own RunningStats and the results are merged at the end.
+    - channel_axis: Passed to RunningStats.
+
+    Returns:
+    - stats: A RunningStats holding the statistics of all of X.
+    """
+    N = X.shape[0]
+    starts = list(range(0, N, chunk_size))
+    if num_workers is None:
+        num_workers = cpu_count()
+    num_workers = max(1, min(num_workers, len(starts)))
+
+    def accumulate(worker):
+        stats = RunningStats(channel_axis)
+        for start in starts[worker::num_workers]:
+            stats.update(X[start:start + chunk_size])
+        return stats
+
+    if num_workers == 1:
+        return accumulate(0)
+    pool = ThreadPool(num_workers)
+    try:
+        partial = pool.map(accumulate, range(num_workers))
+    finally:
+        pool.close()
+        pool.join()
+    stats = RunningStats(channel_axis)
+    for p in partial:
+        stats.merge(p)
+    return stats
+
+
+class Normalizer(object):
+    """
+    A Normalizer applies the transform (X - mean) / std, where mean and std
+    are either per-element arrays (such as a mean image) or per-channel
+    vectors. It can be built from a RunningStats and saved to and loaded from
+    an .npz file, so the statistics of a dataset only need to be computed
+    once:
+
+    stats = compute_stats(X_train_uint8, channel_axis=0)
+    normalizer = Normalizer.from_stats(stats, per_channel=True)
+    normalizer.save('cifar10_norm.npz')
+    ...
+    normalizer = Normalizer.load('cifar10_norm.npz')
+    X_batch = normalizer(X_train_uint8[batch_mask])
+    """
+
+    def __init__(self, mean, std=None, channel_axis=None, dtype=np.float32):
+        """
+        Inputs:
+        - mean: Array broadcastable against a single sample, or a vector of
+          per-channel means if channel_axis is given.
+        - std: Array of the same shape as mean, or None to only subtract the
+          mean.
+        - channel_axis: Axis of a sample holding the channels when mean and
+          std are per-channel vectors.
+        - dtype: Floating point datatype of the normalized data.
+        """
+        self.dtype = np.dtype(dtype)
+        self.channel_axis = channel_axis
+        self.mean = np.asarray(mean, dtype=self.dtype)
+        self.std = None if std is None else np.asarray(std, dtype=self.dtype)
+
+    @classmethod
+    def from_stats(cls, stats, per_channel=False, divide_std=True, eps=1e-8,
+                   dtype=np.float32):
+        """
+        Build a Normalizer from a RunningStats.
+
+        Inputs:
+        - stats: A RunningStats.
+        - per_channel: If True use per-channel statistics, otherwise
+          per-element ones.
+        - divide_std: If False only subtract the mean.
+        - eps: Added to the standard deviation to avoid dividing by zero.
+        - dtype: Floating point datatype of the normalized data.
+
+        Raises ValueError if stats holds no samples.
+        """
+        if stats.count == 0:
+            raise ValueError('Cannot normalize with statistics of no samples')
+        if per_channel:
+            mean, std = stats.channel_mean(), stats.channel_std()
+            channel_axis = stats.channel_axis
+        else:
+            mean, std = stats.mean, stats.std
+            channel_axis = None
+        std = std + eps if divide_std else None
+        return cls(mean, std, channel_axis=channel_axis, dtype=dtype)
+
+    def _broadcast(self, a, ndim):
+        # Per-channel vectors are reshaped to broadcast against a minibatch
+        # of shape (N, d_1, ..., d_k) with ndim dimensions.
+        if a is None or self.channel_axis is None:
+            return a
+        shape = [1] * (ndim - 1)
+        shape[self.channel_axis] = -1
+        return a.reshape(shape)
+
+    def __call__(self, X, out=None):
+        """
+        Normalize a minibatch X of shape (N, d_1, ..., d_k) of any numeric
+        datatype, converting it in the same pass.
+
+        Inputs:
+        - X: Minibatch to normalize.
+        - out: Optional preallocated output array.
+
+        Returns:
+        - out: Normalized minibatch.
+        """
+        if out is None:
+            out = np.empty(X.shape, dtype=self.dtype)
+        np.subtract(X, self._broadcast(self.mean, X.ndim), out=out)
+        if self.std is not None:
+            out /= self._broadcast(self.std, X.ndim)
+        return out
+
+    def save(self, filename, **extra):
+        """
+        Save the normalizer to an .npz file. Any extra arrays, such as a
+        description of the data the statistics were computed from, are
+        stored alongside and ignored by load().
+        """
+        arrays = dict(extra, mean=self.mean)
+        if self.std is not None:
+            arrays['std'] = self.std
+        if self.channel_axis is not None:
+            arrays['channel_axis'] = np.array(self.channel_axis)
+        np.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            std = f['std'] if 'std' in f else None
+            channel_axis = None
+            if 'channel_axis' in f:
+                channel_axis = int(f['channel_axis'])
+            return cls(f['mean'], std, channel_axis=channel_axis,
+                       dtype=f['mean'].dtype)
+
+
+# Number of evenly spaced images checksummed by _data_signature
+_SIGNATURE_SAMPLES = 256
+
+
+def _data_signature(X):
+    """
+    Describe images X cheaply enough to tell whether saved statistics were
+    computed from them: their shape and a checksum of _SIGNATURE_SAMPLES
+    evenly spaced images, including the first and the last one. Changes
+    that only touch images between the sampled ones go unnoticed.
+    """
+    n = X.shape[0]
+    idx = np.unique(np.linspace(0, n - 1, min(n, _SIGNATURE_SAMPLES))
+                    .astype(np.intp))
+    sample = np.ascontiguousarray(X[idx]) if n else np.zeros(0)
+    return np.array(list(X.shape) +
+                    [zlib.crc32(sample.tobytes()) & 0xffffffff],
+                    dtype=np.int64)
+
+
+def compute_mean_image(X, dtype=np.float32, stats_file=None,
+                       num_workers=None):
+    """
+    Compute the mean image of a dataset chunk by chunk with compute_stats,
+    so that it is never converted to floats as a whole, optionally caching
+    the statistics in a file.
+
+    Inputs:
+    - X: Array-like of images of shape (N, C, H, W), as for compute_stats.
+    - dtype: Datatype of the returned mean image.
+    - stats_file: If not None, an .npz file the per-pixel statistics are
+      loaded from if it was computed from the same data, and saved to
+      otherwise. The data is identified by its shape and a checksum of a
+      sample of its images (see _data_signature), so delete the file after
+      changing images in place.
+    - num_workers: Passed to compute_stats.
+
+    Returns:
+    - mean_image: Array of shape (C, H, W).
+
+    Raises ValueError if X holds no images.
+    """
+    signature = _data_signature(X)
+    if stats_file is not None and os.path.isfile(stats_file):
+        with np.load(stats_file) as f:
+            matches = 'signature' in f and \
+                np.array_equal(f['signature'], signature)
+        if matches:
+            return Normalizer.load(stats_file).mean.astype(dtype)
+    stats = compute_stats(X, num_workers=num_workers)
+    normalizer = Normalizer.from_stats(stats, dtype=np.float64)
+    if stats_file is not None:
+        normalizer.save(stats_file, signature=signature)
+    return normalizer.mean.astype(dtype)
@@ -4,9 +4,15 @@ from builtins import range
 from six.moves import cPickle as pickle
 import numpy as np
 import os
+import json
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 from scipy.misc import imread
 import platform
 
+from cs231n.data_stats import compute_mean_image
+from cs231n.model_store import ModelStore
+
 def load_pickle(f):
     version = platform.python_version_tuple()
     if version[0] == '2':
@@ -15,41 +21,134 @@ def load_pickle(f):
         return  pickle.load(f, encoding='latin1')
     raise ValueError("invalid python version: {}".format(version))
 
-def load_CIFAR_batch(filename):
+def load_CIFAR_batch(filename, dtype="float", channels_first=False):
     """ load single batch of cifar """
     with open(filename, 'rb') as f:
         datadict = load_pickle(f)
         X = datadict['data']
         Y = datadict['labels']
-        X = X.reshape(10000, 3, 32, 32).transpose(0,2,3,1).astype("float")
+        # The batches store uint8 pixels channels first, so channels_first
+        # with dtype uint8 returns them without copying
+        X = X.reshape(10000, 3, 32, 32)
+        if not channels_first:
+            X = X.transpose(0,2,3,1)
+        X = X.astype(dtype, copy=False)
         Y = np.array(Y)
         return X, Y
 
-def load_CIFAR10(ROOT):
+def load_CIFAR10(ROOT, dtype="float", channels_first=False):
     """ load all of cifar """
     xs = []
     ys = []
     for b in range(1,6):
         f = os.path.join(ROOT, 'data_batch_%d' % (b, ))
-        X, Y = load_CIFAR_batch(f)
+        X, Y = load_CIFAR_batch(f, dtype=dtype, channels_first=channels_first)
         xs.append(X)
         ys.append(Y)
     Xtr = np.concatenate(xs)
     Ytr = np.concatenate(ys)
     del X, Y
-    Xte, Yte = load_CIFAR_batch(os.path.join(ROOT, 'test_batch'))
+    Xte, Yte = load_CIFAR_batch(os.path.join(ROOT, 'test_batch'), dtype=dtype,
+                                channels_first=channels_first)
     return Xtr, Ytr, Xte, Yte
 
 
+class ImageDataset(object):
+    """
+    An array-like set of images that keeps its pixels resident as uint8 and
+    only produces normalized floating point data on demand.
+
+    Indexing an ImageDataset with an integer array, a boolean mask or a slice
+    returns a minibatch of X[idx] - mean_image in the requested floating point
+    datatype, optionally divided by std. The conversion and the mean
+    subtraction happen in a single pass over the selected uint8 pixels, so a
+    dataset only needs one byte per pixel of memory and can be handed to a
+    Solver in place of a float array for X_train, X_val or X_test.
+    """
+
+    def __init__(self, X, mean_image=None, dtype=np.float32, std=None):
+        """
+        Inputs:
+        - X: Array of shape (N, C, H, W) holding uint8 pixel values.
+        - mean_image: Array broadcastable to (C, H, W), such as a mean image
+          or per-channel means of shape (C, 1, 1), that is subtracted from
+          every image; or None to return raw pixel values.
+        - dtype: numpy datatype of the minibatches produced by indexing.
+        - std: If not None, an array broadcastable to (C, H, W) that the
+          centered images are divided by.
+        """
+        self.X = X
+        self.dtype = np.dtype(dtype)
+        self.mean_image = None
+        if mean_image is not None:
+            self.mean_image = np.asarray(mean_image, dtype=self.dtype)
+        self.std = None
+        if std is not None:
+            self.std = np.asarray(std, dtype=self.dtype)
+
+    @property
+    def shape(self):
+        return self.X.shape
+
+    @property
+    def nbytes(self):
+        return self.X.nbytes
+
+    def __len__(self):
+        return self.X.shape[0]
+
+    def __getitem__(self, idx):
+        return self.take(idx)
+
+    def take(self, idx, out=None):
+        """
+        Convert the images selected by idx to normalized floating point data.
+
+        Inputs:
+        - idx: Anything that can be used to index the first axis of X.
+        - out: Optional preallocated array of the right shape and dtype to
+          write the minibatch into; lets callers reuse batch buffers.
+
+        Returns:
+        - out: Array of shape (len(idx), C, H, W) of normalized images.
+        """
+        X = self.X[idx]
+        if out is None:
+            out = np.empty(X.shape, dtype=self.dtype)
+        if self.mean_image is None:
+            out[...] = X
+        else:
+            np.subtract(X, self.mean_image, out=out)
+        if self.std is not None:
+            out /= self.std
+        return out
+
+
 def get_CIFAR10_data(num_training=49000, num_validation=1000, num_test=1000,
-                     subtract_mean=True):
+                     subtract_mean=True, lazy=False, dtype=np.float32,
+                     stats_file=None):
     """
     Load the CIFAR-10 dataset from disk and perform preprocessing to prepare
     it for classifiers. These are the same steps as we used for the SVM, but
     condensed to a single function.
+
+    If lazy is True then X_train, X_val and X_test are returned as
+    ImageDataset objects that keep the pixels as uint8 in channels-first
+    layout and convert minibatches to normalized arrays of the given dtype
+    when they are indexed; mean_image is returned alongside them. This needs
+    an eighth of the memory of the float64 arrays returned otherwise. The
+    mean image is then computed with streaming statistics over the uint8
+    pixels; if stats_file is given, the statistics are saved there as a
+    data_stats.Normalizer and reused by later calls on the same training
+    split. Whether the split is the same is decided from its shape and a
+    sample of its images, so delete stats_file after editing the dataset
+    in place.
     """
     # Load the raw CIFAR-10 data
     cifar10_dir = 'cs231n/datasets/cifar-10-batches-py'
+    if lazy:
+        return _get_CIFAR10_lazy(cifar10_dir, num_training, num_validation,
+                                 num_test, subtract_mean, dtype, stats_file)
     X_train, y_train, X_test, y_test = load_CIFAR10(cifar10_dir)
 
     # Subsample the data
@@ -83,16 +182,58 @@ def get_CIFAR10_data(num_training=49000, num_validation=1000, num_test=1000,
     }
 
 
-def load_tiny_imagenet(path, dtype=np.float32, subtract_mean=True):
+def _get_CIFAR10_lazy(cifar10_dir, num_training, num_validation, num_test,
+                      subtract_mean, dtype, stats_file):
+    # The splits below are views into these arrays rather than copies
+    X_train, y_train, X_test, y_test = load_CIFAR10(
+        cifar10_dir, dtype=np.uint8, channels_first=True)
+
+    X_val = X_train[num_training:num_training + num_validation]
+    y_val = y_train[num_training:num_training + num_validation]
+    X_train = X_train[:num_training]
+    y_train = y_train[:num_training]
+    X_test = X_test[:num_test]
+    y_test = y_test[:num_test]
+
+    mean_image = None
+    if subtract_mean:
+        mean_image = compute_mean_image(X_train, dtype, stats_file)
+
+    return {
+      'X_train': ImageDataset(X_train, mean_image, dtype), 'y_train': y_train,
+      'X_val': ImageDataset(X_val, mean_image, dtype), 'y_val': y_val,
+      'X_test': ImageDataset(X_test, mean_image, dtype), 'y_test': y_test,
+      'mean_image': mean_image,
+    }
+
+
+def load_tiny_imagenet(path, dtype=np.float32, subtract_mean=True,
+                       num_workers=None, cache_dir=None, progress=None,
+                       lazy=False):
     """
     Load TinyImageNet. Each of TinyImageNet-100-A, TinyImageNet-100-B, and
     TinyImageNet-200 have the same directory structure, so this can be used
     to load any of them.
 
+    JPEGs are decoded by a pool of threads straight into preallocated uint8
+    arrays. If cache_dir is given, the decoded pixels, labels and wnid maps
+    are packed into that directory the first time the dataset is loaded, and
+    later loads memory-map the cache instead of decoding any JPEGs.
+
     Inputs:
     - path: String giving path to the directory to load.
     - dtype: numpy datatype used to load the data.
     - subtract_mean: Whether to subtract the mean training image.
+    - num_workers: Number of threads used to decode images; defaults to the
+      number of CPUs.
+    - cache_dir: If not None, directory holding the packed cache.
+    - progress: If not None, a function progress(split, done, total) that is
+      called periodically while images of a split are being decoded.
+    - lazy: If True, return the images as uint8 ImageDataset objects that
+      normalize minibatches on demand instead of float arrays.
+
+    The mean image is computed with streaming statistics over the uint8
+    pixels; with a cache_dir the statistics are stored in the cache as well.
 
     Returns: A dictionary with the following entries:
     - class_names: A list where class_names[i] is a list of strings giving the
@@ -101,11 +242,52 @@ def load_tiny_imagenet(path, dtype=np.float32, subtract_mean=True):
     - y_train: (N_tr,) array of training labels
     - X_val: (N_val, 3, 64, 64) array of validation images
     - y_val: (N_val,) array of validation labels
-    - X_test: (N_test, 3, 64, 64) array of testing images.
+    - X_test: (N_test, 3, 64, 64) array of testing images, ordered by file
+      name.
     - y_test: (N_test,) array of test labels; if test labels are not available
       (such as in student code) then y_test will be None.
     - mean_image: (3, 64, 64) array giving mean training image
     """
+    if cache_dir is not None and os.path.isfile(
+            os.path.join(cache_dir, _TINY_IMAGENET_META)):
+        meta, splits = _read_tiny_imagenet_cache(cache_dir)
+    else:
+        meta, splits = _decode_tiny_imagenet(path, num_workers, cache_dir,
+                                             progress)
+
+    stats_file = None
+    if cache_dir is not None:
+        stats_file = os.path.join(cache_dir, 'stats.npz')
+    mean_image = compute_mean_image(splits['X_train'], dtype, stats_file)
+    subtracted = mean_image if subtract_mean else None
+
+    data = {
+      'class_names': meta['class_names'],
+      'y_train': splits['y_train'],
+      'y_val': splits['y_val'],
+      'y_test': splits.get('y_test'),
+      'mean_image': mean_image,
+    }
+    for split in ('X_train', 'X_val', 'X_test'):
+        images = ImageDataset(splits[split], subtracted, dtype)
+        if not lazy:
+            # A single pass converts the uint8 pixels and subtracts the mean
+            images = images[:]
+        data[split] = images
+    return data
+
+
+_TINY_IMAGENET_META = 'meta.json'
+
+
+def _read_tiny_imagenet_index(path):
+    """
+    Read the annotation files of a TinyImageNet directory.
+
+    Returns a tuple (meta, files, labels) where meta holds the wnids, class
+    names and test file names, and files and labels map each split to a list
+    of image paths and an array of labels (None for unlabeled test data).
+    """
     # First load wnids
     with open(os.path.join(path, 'wnids.txt'), 'r') as f:
         wnids = [x.strip() for x in f]
@@ -120,67 +302,36 @@ def load_tiny_imagenet(path, dtype=np.float32, subtract_mean=True):
             wnid_to_words[wnid] = [w.strip() for w in words.split(',')]
     class_names = [wnid_to_words[wnid] for wnid in wnids]
 
-    # Next load training data.
-    X_train = []
-    y_train = []
-    for i, wnid in enumerate(wnids):
-        if (i + 1) % 20 == 0:
-            print('loading training data for synset %d / %d'
-                  % (i + 1, len(wnids)))
-        # To figure out the filenames we need to open the boxes file
+    files, labels = {}, {}
+
+    # Training images; to figure out the filenames we need to open the boxes
+    # file of each synset
+    files['train'], y_train = [], []
+    for wnid in wnids:
         boxes_file = os.path.join(path, 'train', wnid, '%s_boxes.txt' % wnid)
         with open(boxes_file, 'r') as f:
             filenames = [x.split('\t')[0] for x in f]
-        num_images = len(filenames)
-
-        X_train_block = np.zeros((num_images, 3, 64, 64), dtype=dtype)
-        y_train_block = wnid_to_label[wnid] * \
-                        np.ones(num_images, dtype=np.int64)
-        for j, img_file in enumerate(filenames):
-            img_file = os.path.join(path, 'train', wnid, 'images', img_file)
-            img = imread(img_file)
-            if img.ndim == 2:
-        ## grayscale file
-                img.shape = (64, 64, 1)
-            X_train_block[j] = img.transpose(2, 0, 1)
-        X_train.append(X_train_block)
-        y_train.append(y_train_block)
-
-    # We need to concatenate all training data
-    X_train = np.concatenate(X_train, axis=0)
-    y_train = np.concatenate(y_train, axis=0)
-
-    # Next load validation data
+        files['train'].extend(os.path.join(path, 'train', wnid, 'images', img)
+                              for img in filenames)
+        y_train.extend([wnid_to_label[wnid]] * len(filenames))
+    labels['train'] = np.array(y_train, dtype=np.int64)
+
+    # Validation images
     with open(os.path.join(path, 'val', 'val_annotations.txt'), 'r') as f:
-        img_files = []
-        val_wnids = []
+        files['val'], y_val = [], []
         for line in f:
             img_file, wnid = line.split('\t')[:2]
-            img_files.append(img_file)
-            val_wnids.append(wnid)
-        num_val = len(img_files)
-        y_val = np.array([wnid_to_label[wnid] for wnid in val_wnids])
-        X_val = np.zeros((num_val, 3, 64, 64), dtype=dtype)
-        for i, img_file in enumerate(img_files):
-            img_file = os.path.join(path, 'val', 'images', img_file)
-            img = imread(img_file)
-            if img.ndim == 2:
-                img.shape = (64, 64, 1)
-            X_val[i] = img.transpose(2, 0, 1)
-
-    # Next load test images
-    # Students won't have test labels, so we need to iterate over files in the
-    # images directory.
-    img_files = os.listdir(os.path.join(path, 'test', 'images'))
-    X_test = np.zeros((len(img_files), 3, 64, 64), dtype=dtype)
-    for i, img_file in enumerate(img_files):
-        img_file = os.path.join(path, 'test', 'images', img_file)
-        img = imread(img_file)
-        if img.ndim == 2:
-            img.shape = (64, 64, 1)
-        X_test[i] = img.transpose(2, 0, 1)
+            files['val'].append(os.path.join(path, 'val', 'images', img_file))
+            y_val.append(wnid_to_label[wnid])
+    labels['val'] = np.array(y_val, dtype=np.int64)
 
-    y_test = None
+    # Students won't have test labels, so we need to iterate over files in the
+    # images directory; sort them so that the order does not depend on the
+    # file system.
+    test_files = sorted(os.listdir(os.path.join(path, 'test', 'images')))
+    files['test'] = [os.path.join(path, 'test', 'images', img_file)
+                     for img_file in test_files]
+    labels['test'] = None
     y_test_file = os.path.join(path, 'test', 'test_annotations.txt')
     if os.path.isfile(y_test_file):
         with open(y_test_file, 'r') as f:
@@ -188,49 +339,147 @@ def load_tiny_imagenet(path, dtype=np.float32, subtract_mean=True):
             for line in f:
                 line = line.split('\t')
                 img_file_to_wnid[line[0]] = line[1]
-        y_test = [wnid_to_label[img_file_to_wnid[img_file]]
-                  for img_file in img_files]
-        y_test = np.array(y_test)
-
-    mean_image = X_train.mean(axis=0)
-    if subtract_mean:
-        X_train -= mean_image[None]
-        X_val -= mean_image[None]
-        X_test -= mean_image[None]
+        labels['test'] = np.array([wnid_to_label[img_file_to_wnid[img_file]]
+                                   for img_file in test_files], dtype=np.int64)
 
-    return {
-      'class_names': class_names,
-      'X_train': X_train,
-      'y_train': y_train,
-      'X_val': X_val,
-      'y_val': y_val,
-      'X_test': X_test,
-      'y_test': y_test,
+    meta = {
+      'wnids': wnids,
       'class_names': class_names,
-      'mean_image': mean_image,
+      'test_files': test_files,
     }
+    return meta, files, labels
 
 
-def load_models(models_dir):
+def _decode_tiny_imagenet(path, num_workers, cache_dir, progress):
+    """
+    Decode every image of a TinyImageNet directory into uint8 arrays, writing
+    them into a packed cache in cache_dir if it is not None.
+    """
+    meta, files, labels = _read_tiny_imagenet_index(path)
+    if cache_dir is not None and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    splits = {}
+    for split in ('train', 'val', 'test'):
+        shape = (len(files[split]), 3, 64, 64)
+        if cache_dir is None:
+            X = np.empty(shape, dtype=np.uint8)
+        else:
+            X = np.lib.format.open_memmap(
+                os.path.join(cache_dir, 'X_%s.npy' % split), mode='w+',
+                dtype=np.uint8, shape=shape)
+        _decode_images(files[split], X, num_workers,
+                       _split_progress(progress, split))
+        splits['X_' + split] = X
+        if labels[split] is not None:
+            splits['y_' + split] = labels[split]
+
+    if cache_dir is not None:
+        for name, array in splits.items():
+            if name.startswith('X_'):
+                array.flush()
+            else:
+                np.save(os.path.join(cache_dir, name + '.npy'), array)
+        # The metadata file is written last; its presence marks the cache as
+        # complete.
+        with open(os.path.join(cache_dir, _TINY_IMAGENET_META), 'w') as f:
+            json.dump(meta, f)
+    return meta, splits
+
+
+def _read_tiny_imagenet_cache(cache_dir):
+    with open(os.path.join(cache_dir, _TINY_IMAGENET_META), 'r') as f:
+        meta = json.load(f)
+    splits = {}
+    for split in ('train', 'val', 'test'):
+        splits['X_' + split] = np.load(
+            os.path.join(cache_dir, 'X_%s.npy' % split), mmap_mode='r')
+        y_file = os.path.join(cache_dir, 'y_%s.npy' % split)
+        if os.path.isfile(y_file):
+            splits['y_' + split] = np.load(y_file)
+    return meta, splits
+
+
+def _split_progress(progress, split):
+    if progress is None:
+        return None
+    return lambda done, total: progress(split, done, total)
+
+
+def _decode_images(filenames, out, num_workers=None, progress=None):
     """
-    Load saved models from disk. This will attempt to unpickle all files in a
-    directory; any files that give errors on unpickling (such as README.txt)
-    will be skipped.
+    Decode image files in parallel into a preallocated uint8 array.
+
+    Inputs:
+    - filenames: List of N image file names.
+    - out: Array of shape (N, C, H, W) to decode the images into; grayscale
+      images are broadcast over the channels.
+    - num_workers: Number of decoding threads; defaults to the CPU count.
+    - progress: If not None, a function progress(done, total).
+    """
+    def decode(i):
+        img = imread(filenames[i])
+        if img.ndim == 2:
+            ## grayscale file
+            img = img[:, :, None]
+        out[i] = img.transpose(2, 0, 1)
+
+    total = len(filenames)
+    num_workers = num_workers or cpu_count()
+    pool = ThreadPool(num_workers)
+    try:
+        chunksize = max(1, min(256, total // (4 * num_workers)))
+        report_every = max(1, total // 100)
+        for done, _ in enumerate(pool.imap_unordered(decode, range(total),
+                                                     chunksize), 1):
+            if progress is not None and (done % report_every == 0 or
+                                         done == total):
+                progress(done, total)
+    finally:
+        pool.close()
+        pool.join()
+    return out
+
+
+def load_models(models_dir, lazy=False):
+    """
+    Load saved models from disk.
+
+    If models_dir is a model_store.ModelStore (it contains an index.json),
+    the models listed in its index are loaded; with lazy=True, ModelHandles
+    that only read parameters when they are accessed are returned instead.
+
+    Otherwise this will attempt to unpickle all files in the directory.
+    Files that are not pickles (such as README.txt) and pickles that do not
+    hold a dictionary with a 'model' field are skipped. Errors importing the
+    class of a pickled model, such as after it was renamed, are raised.
 
     Inputs:
     - models_dir: String giving the path to a directory containing model files.
       Each model file is a pickled dictionary with a 'model' field.
+    - lazy: If True and models_dir is a ModelStore, return ModelHandles.
 
     Returns:
     A dictionary mapping model file names to models.
     """
+    if os.path.isfile(os.path.join(models_dir, ModelStore.INDEX)):
+        store = ModelStore(models_dir)
+        if lazy:
+            return {name: store[name] for name in store}
+        return {name: store[name].load() for name in store}
+
     models = {}
-    for model_file in os.listdir(models_dir):
-        with open(os.path.join(models_dir, model_file), 'rb') as f:
+    for model_file in sorted(os.listdir(models_dir)):
+        filename = os.path.join(models_dir, model_file)
+        if not os.path.isfile(filename):
+            continue
+        with open(filename, 'rb') as f:
             try:
-                models[model_file] = load_pickle(f)['model']
-            except pickle.UnpicklingError:
+                data = load_pickle(f)
+            except (pickle.UnpicklingError, EOFError):
                 continue
+        if isinstance(data, dict) and 'model' in data:
+            models[model_file] = data['model']
     return models
 
 
@@ -252,7 +501,7 @@ def load_imagenet_val(num=None):
       print('cd cs231n/datasets')
       print('bash get_imagenet_val.sh')
       assert False, 'Need to download imagenet_val_25.npz'
-    f = np.load(imagenet_fn)
+    f = np.load(imagenet_fn, allow_pickle=True)
     X = f['X']
     y = f['y']
     class_names = f['label_map'].item()
@@ -9,8 +9,10 @@ except ImportError:
     print('You may also need to restart your iPython kernel')
 
 from cs231n.im2col import *
+from cs231n.tracing import traced
 
 
+@traced
 def conv_forward_im2col(x, w, b, conv_param):
     """
     A fast implementation of the forward pass for a convolutional layer
@@ -40,6 +42,7 @@ def conv_forward_im2col(x, w, b, conv_param):
     return out, cache
 
 
+@traced
 def conv_forward_strides(x, w, b, conv_param):
     N, C, H, W = x.shape
     F, _, HH, WW = w.shape
@@ -84,6 +87,7 @@ def conv_forward_strides(x, w, b, conv_param):
     return out, cache
 
 
+@traced
 def conv_backward_strides(dout, cache):
     x, w, b, conv_param, x_cols = cache
     stride, pad = conv_param['stride'], conv_param['pad']
@@ -104,6 +108,7 @@ def conv_backward_strides(dout, cache):
     return dx, dw, db
 
 
+@traced
 def conv_backward_im2col(dout, cache):
     """
     A fast implementation of the backward pass for a convolutional layer
@@ -130,6 +135,7 @@ conv_forward_fast = conv_forward_strides
 conv_backward_fast = conv_backward_strides
 
 
+@traced
 def max_pool_forward_fast(x, pool_param):
     """
     A fast implementation of the forward pass for a max pooling layer.
@@ -154,6 +160,7 @@ def max_pool_forward_fast(x, pool_param):
     return out, cache
 
 
+@traced
 def max_pool_backward_fast(dout, cache):
     """
     A fast implementation of the backward pass for a max pooling layer.
@@ -170,6 +177,7 @@ def max_pool_backward_fast(dout, cache):
         raise ValueError('Unrecognized method "%s"' % method)
 
 
+@traced
 def max_pool_forward_reshape(x, pool_param):
     """
     A fast implementation of the forward pass for the max pooling layer that uses
@@ -191,6 +199,7 @@ def max_pool_forward_reshape(x, pool_param):
     return out, cache
 
 
+@traced
 def max_pool_backward_reshape(dout, cache):
     """
     A fast implementation of the backward pass for the max pooling layer that
@@ -222,6 +231,7 @@ def max_pool_backward_reshape(dout, cache):
     return dx
 
 
+@traced
 def max_pool_forward_im2col(x, pool_param):
     """
     An implementation of the forward pass for max pooling based on im2col.
@@ -249,6 +259,7 @@ def max_pool_forward_im2col(x, pool_param):
     return out, cache
 
 
+@traced
 def max_pool_backward_im2col(dout, cache):
     """
     An implementation of the backward pass for max pooling based on im2col.
@@ -0,0 +1,84 @@
+from __future__ import print_function, division
+from builtins import object
+
+import numpy as np
+
+"""
+This file implements flat parameter storage for models that follow the
+Solver API.
+
+A FlatParams object copies a dictionary of parameter arrays into one
+contiguous one-dimensional buffer and exposes every parameter as a view into
+it, in sorted order of the parameter names. Gradients are gathered into a
+matching buffer, so that an update rule from optim.py can update all
+parameters of a model with a single vectorized call instead of one call per
+parameter:
+
+flat = FlatParams(model.params)
+model.params = flat.params
+...
+loss, grads = model.loss(X_batch, y_batch)
+w, dw = flat.data, flat.gather_grads(grads)
+next_w, config = optim.adam(w, dw, config)
+
+Since a single array has a single dtype, all parameters must have the same
+dtype. Update rules that treat every parameter separately (such as ones that
+normalize by the norm of each weight matrix) are not suited to flat storage.
+
+The Solver uses FlatParams when it is constructed with flat_params=True.
+"""
+
+
+# Key of the single optimizer config used with flat parameters
+FLAT_KEY = '__flat__'
+
+
+class FlatParams(object):
+    """
+    Parameters stored as views into one contiguous buffer; see the top of
+    this file.
+
+    Instance variables:
+    - data: 1D array holding all parameters.
+    - grad: 1D array of the same size holding the gathered gradients.
+    - params: Dictionary mapping parameter names to views into data.
+    - layout: List of (name, shape, start, stop) tuples giving the slice of
+      data holding each parameter.
+    """
+
+    def __init__(self, params):
+        """
+        Inputs:
+        - params: Dictionary mapping parameter names to arrays, whose values
+          are copied into the buffer.
+        """
+        dtypes = set(np.asarray(p).dtype for p in params.values())
+        if len(dtypes) > 1:
+            raise ValueError('Flat parameters need a single dtype, got %s' %
+                             ', '.join(sorted(str(d) for d in dtypes)))
+        dtype = dtypes.pop() if dtypes else np.float64
+
+        self.layout = []
+        start = 0
+        for name in sorted(params):
+            shape = np.shape(params[name])
+            stop = start + int(np.prod(shape))
+            self.layout.append((name, shape, start, stop))
+            start = stop
+
+        self.data = np.empty(start, dtype=dtype)
+        self.grad = np.zeros(start, dtype=dtype)
+        self.params = {}
+        for name, shape, start, stop in self.layout:
+            view = self.data[start:stop].reshape(shape)
+            view[...] = params[name]
+            self.params[name] = view
+
+    def gather_grads(self, grads):
+        """
+        Copy a dictionary of gradients, with the same names and shapes as
+        the parameters, into the gradient buffer and return it.
+        """
+        np.concatenate([np.ravel(grads[name]) for name, _, _, _
+                        in self.layout], out=self.grad)
+        return self.grad
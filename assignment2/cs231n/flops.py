@@ -0,0 +1,301 @@
+from __future__ import print_function, division
+from builtins import range
+from builtins import object
+
+import numpy as np
+
+from cs231n.tracing import add_listener, remove_listener
+
+"""
+This file implements an analytic model of the floating point operations and
+memory traffic of the layers in layers.py and fast_layers.py, and a counter
+that combines it with measured time to report achieved GFLOP/s and GB/s.
+
+For every layer function, FLOP_MODELS maps its name to a function of the
+arguments and the return value of a call that returns (flops, bytes):
+
+- flops counts multiplies and adds separately (a multiply-accumulate is 2),
+  and elementwise operations such as comparisons, exp or sqrt as 1.
+- bytes is the minimum memory traffic of the call: every input read once and
+  every output written once. For the im2col-based convolutions, the column
+  matrix is counted as written and read once more.
+
+The ratio flops / bytes is the arithmetic intensity of a call. A kernel whose
+intensity is below the machine balance (peak GFLOP/s divided by peak GB/s) is
+memory-bound and can at best reach intensity * peak GB/s; above it, it is
+compute-bound.
+
+FlopCounter is a tracing listener (see tracing.py) that counts the leaf layer
+calls, so convenience layers from layer_utils.py are counted through the
+layers they call:
+
+counter = count_model(model, X_batch, y_batch)
+counter.report(peak_gflops=100, peak_gbps=20)
+"""
+
+
+def _nbytes(*arrays):
+    return sum(a.nbytes for a in arrays if isinstance(a, np.ndarray))
+
+
+def _elementwise(flops_per_element):
+    # Forward layers whose cost is proportional to the size of their input
+    def model(args, result):
+        x = args[0]
+        return flops_per_element * x.size, _nbytes(*args) + _nbytes(result[0])
+    return model
+
+
+def _relu_backward(args, result):
+    dout, x = args
+    return dout.size, _nbytes(dout, x, result)
+
+
+def _affine_forward(args, result):
+    x, w, b = args
+    N, M = x.shape[0], w.shape[1]
+    D = x.size // N
+    return 2 * N * D * M + N * M, _nbytes(x, w, b, result[0])
+
+
+def _affine_backward(args, result):
+    dout, (x, w, b) = args
+    N, M = dout.shape
+    D = x.size // N
+    flops = 4 * N * D * M + N * M
+    return flops, _nbytes(dout, x, w) + _nbytes(*result)
+
+
+def _conv_forward(cols):
+    def model(args, result):
+        x, w, b = args[:3]
+        out = result[0]
+        N, F, HO, WO = out.shape
+        K = w.size // F
+        flops = 2 * N * F * HO * WO * K + out.size
+        nbytes = _nbytes(x, w, b, out)
+        if cols:
+            nbytes += 2 * N * HO * WO * K * x.itemsize
+        return flops, nbytes
+    return model
+
+
+def _conv_backward(cols):
+    def model(args, result):
+        dout, cache = args
+        x, w = cache[0], cache[1]
+        N, F, HO, WO = dout.shape
+        K = w.size // F
+        flops = 4 * N * F * HO * WO * K + dout.size
+        nbytes = _nbytes(dout, x, w) + _nbytes(*result)
+        if cols:
+            nbytes += 2 * N * HO * WO * K * x.itemsize
+        return flops, nbytes
+    return model
+
+
+def _pool_forward(args, result):
+    x, pool_param = args
+    out = result[0]
+    window = pool_param['pool_height'] * pool_param['pool_width']
+    return out.size * window, _nbytes(x, out)
+
+
+def _pool_backward(args, result):
+    dout, cache = args
+    x = cache[0]
+    # One comparison per input to find the maxima, one add per output
+    return x.size + dout.size, _nbytes(dout, x, result)
+
+
+def _batchnorm_forward(args, result):
+    x = args[0]
+    mode = args[3].get('mode', 'train') if len(args) > 3 else 'train'
+    # mean, variance, normalization and scale/shift in training; normalize
+    # with the running averages and scale/shift at test time
+    flops = (8 if mode == 'train' else 4) * x.size
+    return flops, _nbytes(*args[:3]) + _nbytes(result[0])
+
+
+def _norm_backward(flops_per_element):
+    def model(args, result):
+        dout = args[0]
+        x = args[1][0]
+        return (flops_per_element * dout.size,
+                _nbytes(dout, x) + _nbytes(*result))
+    return model
+
+
+def _dropout_forward(args, result):
+    x, dropout_param = args
+    if dropout_param.get('mode') == 'train':
+        # draw, compare and scale
+        return 3 * x.size, _nbytes(x) + 2 * _nbytes(result[0])
+    return 0, 0
+
+
+def _dropout_backward(args, result):
+    dout, (dropout_param, mask) = args
+    if dropout_param.get('mode') == 'train':
+        return dout.size, _nbytes(dout, mask, result)
+    return 0, 0
+
+
+def _loss(flops_per_element):
+    def model(args, result):
+        x = args[0]
+        return flops_per_element * x.size, _nbytes(x, result[1])
+    return model
+
+
+FLOP_MODELS = {
+  'affine_forward': _affine_forward,
+  'affine_backward': _affine_backward,
+  'relu_forward': _elementwise(1),
+  'relu_backward': _relu_backward,
+  'batchnorm_forward': _batchnorm_forward,
+  'batchnorm_backward': _norm_backward(12),
+  'batchnorm_backward_alt': _norm_backward(8),
+  'layernorm_forward': _elementwise(8),
+  'layernorm_backward': _norm_backward(8),
+  'spatial_groupnorm_forward': _elementwise(8),
+  'spatial_groupnorm_backward': _norm_backward(8),
+  'dropout_forward': _dropout_forward,
+  'dropout_backward': _dropout_backward,
+  'conv_forward_naive': _conv_forward(False),
+  'conv_backward_naive': _conv_backward(False),
+  'conv_forward_im2col': _conv_forward(True),
+  'conv_backward_im2col': _conv_backward(True),
+  'conv_forward_strides': _conv_forward(True),
+  'conv_backward_strides': _conv_backward(True),
+  'max_pool_forward_naive': _pool_forward,
+  'max_pool_backward_naive': _pool_backward,
+  'max_pool_forward_reshape': _pool_forward,
+  'max_pool_backward_reshape': _pool_backward,
+  'max_pool_forward_im2col': _pool_forward,
+  'max_pool_backward_im2col': _pool_backward,
+  'svm_loss': _loss(4),
+  'softmax_loss': _loss(5),
+}
+
+
+def layer_cost(name, args, result):
+    """
+    Return (flops, bytes) of a call of the layer function called name, or
+    None if there is no model for it.
+    """
+    model = FLOP_MODELS.get(name)
+    if model is None:
+        return None
+    return model(args, result)
+
+
+class FlopCounter(object):
+    """
+    Accumulates, for every leaf layer function, the number of calls, the
+    modelled FLOPs and bytes and the measured time.
+
+    Use it as a context manager, pass it to a Solver in its profilers list or
+    use count_model. After counting, layers maps layer names to dictionaries
+    with the keys calls, flops, bytes and seconds.
+    """
+
+    def __init__(self):
+        self.layers = {}
+
+    def __enter__(self):
+        add_listener(self)
+        return self
+
+    def __exit__(self, *args):
+        remove_listener(self)
+
+    def event(self, name, args, result, start, end, depth, leaf):
+        if args is None or not leaf:
+            return
+        cost = layer_cost(name, args, result)
+        if cost is None:
+            return
+        stats = self.layers.get(name)
+        if stats is None:
+            stats = self.layers[name] = {'calls': 0, 'flops': 0, 'bytes': 0,
+                                         'seconds': 0.0}
+        stats['calls'] += 1
+        stats['flops'] += cost[0]
+        stats['bytes'] += cost[1]
+        stats['seconds'] += end - start
+
+    @property
+    def total_flops(self):
+        return sum(s['flops'] for s in self.layers.values())
+
+    @property
+    def total_bytes(self):
+        return sum(s['bytes'] for s in self.layers.values())
+
+    def summary(self, peak_gflops=None, peak_gbps=None):
+        """
+        Return a dictionary mapping layer names to their counts extended with
+        gflops_per_s, gb_per_s and intensity (FLOPs per byte). If the peak
+        compute and bandwidth of the machine are given, every layer is also
+        classified as 'compute' or 'memory' bound and given the fraction of
+        its attainable throughput that it reaches (the roofline model).
+        """
+        result = {}
+        for name, s in self.layers.items():
+            r = dict(s)
+            seconds = s['seconds'] or float('nan')
+            r['gflops_per_s'] = s['flops'] / seconds / 1e9
+            r['gb_per_s'] = s['bytes'] / seconds / 1e9
+            r['intensity'] = s['flops'] / s['bytes'] if s['bytes'] else 0.0
+            if peak_gflops and peak_gbps:
+                balance = peak_gflops / peak_gbps
+                attainable = min(peak_gflops, r['intensity'] * peak_gbps)
+                r['bound'] = 'compute' if r['intensity'] >= balance \
+                    else 'memory'
+                r['efficiency'] = r['gflops_per_s'] / attainable \
+                    if attainable else 0.0
+            result[name] = r
+        return result
+
+    def report(self, peak_gflops=None, peak_gbps=None):
+        """
+        Print the achieved throughput of every layer, slowest first.
+        """
+        summary = self.summary(peak_gflops, peak_gbps)
+        header = '%-26s %6s %10s %10s %9s %8s %7s' % (
+            'layer', 'calls', 'GFLOP', 'ms', 'GFLOP/s', 'GB/s', 'F/B')
+        if peak_gflops and peak_gbps:
+            header += ' %8s %6s' % ('bound', 'eff')
+        print(header)
+        for name in sorted(summary, key=lambda k: -summary[k]['seconds']):
+            r = summary[name]
+            line = '%-26s %6d %10.4f %10.3f %9.2f %8.2f %7.2f' % (
+                name, r['calls'], r['flops'] / 1e9, 1e3 * r['seconds'],
+                r['gflops_per_s'], r['gb_per_s'], r['intensity'])
+            if 'bound' in r:
+                line += ' %8s %5.0f%%' % (r['bound'], 100 * r['efficiency'])
+            print(line)
+        print('total: %.4f GFLOP, %.4f GB' % (self.total_flops / 1e9,
+                                              self.total_bytes / 1e9))
+
+
+def count_model(model, X, y=None, repeats=1):
+    """
+    Count the FLOPs, bytes and time of the layers of a model, such as a
+    FullyConnectedNet or a ThreeLayerConvNet.
+
+    Inputs:
+    - model: A model conforming to the Solver API.
+    - X: Minibatch of input data.
+    - y: Labels; if given, a training-time forward and backward pass is
+      counted, otherwise a test-time forward pass.
+    - repeats: Number of passes to run and accumulate.
+
+    Returns:
+    - counter: A FlopCounter holding the counts.
+    """
+    with FlopCounter() as counter:
+        for _ in range(repeats):
+            model.loss(X, y)
+    return counter
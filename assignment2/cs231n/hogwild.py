@@ -0,0 +1,222 @@
+from __future__ import print_function, division
+from builtins import range
+from builtins import object
+import traceback
+from multiprocessing import cpu_count
+
+import numpy as np
+
+from cs231n import optim
+from cs231n.parallel import _get_context, _param_layout, _views
+from cs231n.timers import clock
+
+"""
+This file implements lock-free asynchronous SGD in the style of Hogwild!
+(Niu et al., 2011).
+
+Worker processes share a single copy of the parameters in shared memory.
+Every worker repeatedly samples its own minibatch, computes gradients against
+whatever the shared parameters hold at that moment and applies the update
+rule directly to the shared arrays, without any locking. Updates of
+different workers can interleave and a gradient may be computed from
+parameters that other workers have changed since, but for models whose
+updates touch the parameters sparsely or which are small enough that the
+synchronization of the data-parallel Solver dominates, this trades a little
+statistical efficiency for much higher throughput.
+
+To see how stale the gradients are, the workers share a global update
+counter. A worker reads it before computing a gradient and again when it
+applies the update; the difference is the number of updates made by other
+workers in between. The counter is incremented without a lock too, so under
+heavy contention it can undercount slightly.
+"""
+
+
+def _worker(rank, trainer, shared, counter, losses, staleness, errors, seed):
+    try:
+        np.random.seed(seed)
+        rng = np.random.RandomState(seed)
+        model = trainer.model
+        model.params = shared
+        configs = {p: dict(trainer.optim_config) for p in shared}
+        num_train = trainer.X_train.shape[0]
+        for t in range(losses.shape[1]):
+            batch_mask = rng.choice(num_train, trainer.batch_size)
+            X_batch = trainer.X_train[batch_mask]
+            y_batch = trainer.y_train[batch_mask]
+
+            start = counter.value
+            loss, grads = model.loss(X_batch, y_batch)
+            for p, w in shared.items():
+                next_w, configs[p] = trainer.update_rule(w, grads[p],
+                                                         configs[p])
+                if next_w is not w:
+                    w[...] = next_w
+            end = counter.value
+            counter.value = end + 1
+
+            losses[rank, t] = loss
+            staleness[rank, t] = end - start
+    except Exception:
+        errors.put(traceback.format_exc())
+
+
+class HogwildTrainer(object):
+    """
+    A HogwildTrainer trains a model with asynchronous, lock-free SGD across
+    several worker processes. It accepts the same models and data as a
+    Solver, so the two can be compared directly:
+
+    trainer = HogwildTrainer(model, data, update_rule='sgd_momentum',
+                             optim_config={'learning_rate': 1e-3},
+                             num_workers=4, num_iterations=2000)
+    trainer.train()
+    print(trainer.throughput, trainer.mean_staleness, trainer.val_acc)
+
+    After train() returns, model.params holds the final shared parameters;
+    the instance variable loss_history holds the losses of all updates,
+    ordered by worker and iteration, and staleness_history the staleness of
+    each of these updates.
+    """
+
+    def __init__(self, model, data, **kwargs):
+        """
+        Construct a new HogwildTrainer instance.
+
+        Required arguments:
+        - model: A model object conforming to the Solver API.
+        - data: A dictionary with the keys 'X_train', 'y_train', 'X_val' and
+          'y_val', as for the Solver.
+
+        Optional arguments:
+        - update_rule: A string giving the name of an update rule in optim.py.
+          Default is 'sgd'. The rules are applied to the shared arrays in
+          place; 'sgd' and 'sgd_momentum' update in place already and keep
+          their state (such as the velocity) per worker.
+        - optim_config: A dictionary of hyperparameters passed to the update
+          rule.
+        - batch_size: Size of the minibatches of every worker.
+        - num_iterations: Total number of updates, split evenly across the
+          workers.
+        - num_workers: Number of worker processes; default is the number of
+          CPUs.
+        - num_val_samples: Number of validation samples used to check
+          accuracy after training; default is None, which uses all of them.
+        - seed: Base seed for the workers' random states; worker k uses
+          seed + k. If None, it is drawn from numpy's global random state.
+        - verbose: Boolean; if set to false then no output will be printed.
+        """
+        self.model = model
+        self.X_train = data['X_train']
+        self.y_train = data['y_train']
+        self.X_val = data['X_val']
+        self.y_val = data['y_val']
+
+        self.update_rule = kwargs.pop('update_rule', 'sgd')
+        self.optim_config = kwargs.pop('optim_config', {})
+        self.batch_size = kwargs.pop('batch_size', 100)
+        self.num_iterations = kwargs.pop('num_iterations', 1000)
+        self.num_workers = kwargs.pop('num_workers', None) or cpu_count()
+        self.num_val_samples = kwargs.pop('num_val_samples', None)
+        self.seed = kwargs.pop('seed', None)
+        self.verbose = kwargs.pop('verbose', True)
+
+        if len(kwargs) > 0:
+            extra = ', '.join('"%s"' % k for k in list(kwargs.keys()))
+            raise ValueError('Unrecognized arguments %s' % extra)
+
+        if not hasattr(optim, self.update_rule):
+            raise ValueError('Invalid update_rule "%s"' % self.update_rule)
+        self.update_rule = getattr(optim, self.update_rule)
+
+        self.loss_history = None
+        self.staleness_history = None
+        self.train_time = None
+        self.val_acc = None
+
+    @property
+    def throughput(self):
+        """ Training images per second over the whole run. """
+        return self.loss_history.size * self.batch_size / self.train_time
+
+    @property
+    def mean_staleness(self):
+        return float(self.staleness_history.mean())
+
+    @property
+    def max_staleness(self):
+        return int(self.staleness_history.max())
+
+    def train(self):
+        """
+        Run asynchronous training and check the validation accuracy of the
+        final parameters.
+        """
+        ctx = _get_context()
+        K = self.num_workers
+        iterations = -(-self.num_iterations // K)
+
+        layout, _, nbytes = _param_layout(self.model.params)
+        param_buf = ctx.RawArray('b', max(nbytes, 1))
+        shared = _views(param_buf, layout)
+        for k, v in shared.items():
+            v[...] = self.model.params[k]
+        self.model.params = shared
+
+        counter = ctx.RawValue('q', 0)
+        losses = np.frombuffer(ctx.RawArray('d', K * iterations))
+        staleness = np.frombuffer(ctx.RawArray('q', K * iterations),
+                                  dtype=np.int64)
+        losses = losses.reshape(K, iterations)
+        staleness = staleness.reshape(K, iterations)
+        errors = ctx.Queue()
+
+        seed = self.seed
+        if seed is None:
+            seed = np.random.randint(2**31 - K)
+        if self.verbose:
+            print('%d workers, %d iterations each.' % (K, iterations))
+
+        start = clock()
+        processes = []
+        for rank in range(K):
+            process = ctx.Process(
+                target=_worker,
+                args=(rank, self, shared, counter, losses, staleness, errors,
+                      seed + rank))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+        for process in processes:
+            process.join()
+        self.train_time = clock() - start
+
+        if not errors.empty():
+            raise RuntimeError('Hogwild worker failed:\n%s' % errors.get())
+
+        self.loss_history = losses.copy()
+        self.staleness_history = staleness.copy()
+        self.val_acc = self.check_accuracy(self.X_val, self.y_val,
+                                           self.num_val_samples)
+        if self.verbose:
+            print('%.1f images/sec; staleness mean %.2f, max %d; '
+                  'val_acc: %f' % (self.throughput, self.mean_staleness,
+                                   self.max_staleness, self.val_acc))
+
+    def check_accuracy(self, X, y, num_samples=None, batch_size=100):
+        """
+        Check accuracy of the model on the provided data; see
+        Solver.check_accuracy.
+        """
+        N = X.shape[0]
+        if num_samples is not None and N > num_samples:
+            mask = np.random.choice(N, num_samples)
+            N = num_samples
+            X = X[mask]
+            y = y[mask]
+
+        y_pred = []
+        for start in range(0, N, batch_size):
+            scores = self.model.loss(X[start:start + batch_size])
+            y_pred.append(np.argmax(scores, axis=1))
+        return np.mean(np.hstack(y_pred) == y)
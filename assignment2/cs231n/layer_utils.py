@@ -1,8 +1,10 @@
 pass
 from cs231n.layers import *
 from cs231n.fast_layers import *
+from cs231n.tracing import traced
 
 
+@traced
 def affine_relu_forward(x, w, b):
     """
     Convenience layer that perorms an affine transform followed by a ReLU
@@ -21,6 +23,7 @@ def affine_relu_forward(x, w, b):
     return out, cache
 
 
+@traced
 def affine_relu_backward(dout, cache):
     """
     Backward pass for the affine-relu convenience layer
@@ -31,6 +34,7 @@ def affine_relu_backward(dout, cache):
     return dx, dw, db
 
 
+@traced
 def conv_relu_forward(x, w, b, conv_param):
     """
     A convenience layer that performs a convolution followed by a ReLU.
@@ -49,6 +53,7 @@ def conv_relu_forward(x, w, b, conv_param):
     return out, cache
 
 
+@traced
 def conv_relu_backward(dout, cache):
     """
     Backward pass for the conv-relu convenience layer.
@@ -59,6 +64,7 @@ def conv_relu_backward(dout, cache):
     return dx, dw, db
 
 
+@traced
 def conv_bn_relu_forward(x, w, b, gamma, beta, conv_param, bn_param):
     a, conv_cache = conv_forward_fast(x, w, b, conv_param)
     an, bn_cache = spatial_batchnorm_forward(a, gamma, beta, bn_param)
@@ -67,6 +73,7 @@ def conv_bn_relu_forward(x, w, b, gamma, beta, conv_param, bn_param):
     return out, cache
 
 
+@traced
 def conv_bn_relu_backward(dout, cache):
     conv_cache, bn_cache, relu_cache = cache
     dan = relu_backward(dout, relu_cache)
@@ -75,6 +82,7 @@ def conv_bn_relu_backward(dout, cache):
     return dx, dw, db, dgamma, dbeta
 
 
+@traced
 def conv_relu_pool_forward(x, w, b, conv_param, pool_param):
     """
     Convenience layer that performs a convolution, a ReLU, and a pool.
@@ -95,6 +103,7 @@ def conv_relu_pool_forward(x, w, b, conv_param, pool_param):
     return out, cache
 
 
+@traced
 def conv_relu_pool_backward(dout, cache):
     """
     Backward pass for the conv-relu-pool convenience layer
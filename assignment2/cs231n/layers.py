@@ -2,7 +2,10 @@ from builtins import range
 import numpy as np
 import math
 
+from cs231n.tracing import traced
 
+
+@traced
 def affine_forward(x, w, b):
     """
     Computes the forward pass for an affine (fully-connected) layer.
@@ -34,6 +37,7 @@ def affine_forward(x, w, b):
     return out, cache
 
 
+@traced
 def affine_backward(dout, cache):
     """
     Computes the backward pass for an affine layer.
@@ -65,6 +69,7 @@ def affine_backward(dout, cache):
     return dx, dw, db
 
 
+@traced
 def relu_forward(x):
     """
     Computes the forward pass for a layer of rectified linear units (ReLUs).
@@ -88,6 +93,7 @@ def relu_forward(x):
     return out, cache
 
 
+@traced
 def relu_backward(dout, cache):
     """
     Computes the backward pass for a layer of rectified linear units (ReLUs).
@@ -110,6 +116,7 @@ def relu_backward(dout, cache):
     return dx
 
 
+@traced
 def batchnorm_forward(x, gamma, beta, bn_param):
     """
     Forward pass for batch normalization.
@@ -213,6 +220,7 @@ def batchnorm_forward(x, gamma, beta, bn_param):
     return out, cache
 
 
+@traced
 def batchnorm_backward(dout, cache):
     """
     Backward pass for batch normalization.
@@ -254,6 +262,7 @@ def batchnorm_backward(dout, cache):
     return dx, dgamma, dbeta
 
 
+@traced
 def batchnorm_backward_alt(dout, cache):
     """
     Alternative backward pass for batch normalization.
@@ -295,6 +304,7 @@ def batchnorm_backward_alt(dout, cache):
     return dx, dgamma, dbeta
 
 
+@traced
 def layernorm_forward(x, gamma, beta, ln_param):
     """
     Forward pass for layer normalization.
@@ -340,6 +350,7 @@ def layernorm_forward(x, gamma, beta, ln_param):
     return out, cache
 
 
+@traced
 def layernorm_backward(dout, cache):
     """
     Backward pass for layer normalization.
@@ -381,6 +392,7 @@ def layernorm_backward(dout, cache):
     return dx, dgamma, dbeta
 
 
+@traced
 def dropout_forward(x, dropout_param):
     """
     Performs the forward pass for (inverted) dropout.
@@ -439,6 +451,7 @@ def dropout_forward(x, dropout_param):
     return out, cache
 
 
+@traced
 def dropout_backward(dout, cache):
     """
     Perform the backward pass for (inverted) dropout.
@@ -464,6 +477,7 @@ def dropout_backward(dout, cache):
     return dx
 
 
+@traced
 def conv_forward_naive(x, w, b, conv_param):
     """
     A naive implementation of the forward pass for a convolutional layer.
@@ -532,6 +546,7 @@ def conv_forward_naive(x, w, b, conv_param):
     return out, cache
 
 
+@traced
 def conv_backward_naive(dout, cache):
     """
     A naive implementation of the backward pass for a convolutional layer.
@@ -603,6 +618,7 @@ def conv_backward_naive(dout, cache):
     return dx, dw, db
 
 
+@traced
 def max_pool_forward_naive(x, pool_param):
     """
     A naive implementation of the forward pass for a max-pooling layer.
@@ -665,6 +681,7 @@ def max_pool_forward_naive(x, pool_param):
     return out, cache
 
 
+@traced
 def max_pool_backward_naive(dout, cache):
     """
     A naive implementation of the backward pass for a max-pooling layer.
@@ -723,6 +740,7 @@ def max_pool_backward_naive(dout, cache):
     return dx
 
 
+@traced
 def spatial_batchnorm_forward(x, gamma, beta, bn_param):
     """
     Computes the forward pass for spatial batch normalization.
@@ -763,6 +781,7 @@ def spatial_batchnorm_forward(x, gamma, beta, bn_param):
     return out, cache
 
 
+@traced
 def spatial_batchnorm_backward(dout, cache):
     """
     Computes the backward pass for spatial batch normalization.
@@ -795,6 +814,7 @@ def spatial_batchnorm_backward(dout, cache):
     return dx, dgamma, dbeta
 
 
+@traced
 def spatial_groupnorm_forward(x, gamma, beta, G, gn_param):
     """
     Computes the forward pass for spatial group normalization.
@@ -847,6 +867,7 @@ def spatial_groupnorm_forward(x, gamma, beta, G, gn_param):
     return out, cache
 
 
+@traced
 def spatial_groupnorm_backward(dout, cache):
     """
     Computes the backward pass for spatial group normalization.
@@ -888,6 +909,7 @@ def spatial_groupnorm_backward(dout, cache):
     return dx, dgamma, dbeta
 
 
+@traced
 def svm_loss(x, y):
     """
     Computes the loss and gradient using for multiclass SVM classification.
@@ -915,6 +937,7 @@ def svm_loss(x, y):
     return loss, dx
 
 
+@traced
 def softmax_loss(x, y):
     """
     Computes the loss and gradient for softmax classification.
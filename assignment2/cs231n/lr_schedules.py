@@ -0,0 +1,115 @@
+from __future__ import print_function, division
+from builtins import object
+import math
+
+"""
+This file implements learning rate schedules evaluated at every iteration.
+
+A schedule is a callable with the interface
+
+def schedule(t, num_iterations):
+
+Inputs:
+  - t: The iteration about to be run, counting from 0.
+  - num_iterations: The total number of iterations of the run.
+
+Returns:
+  - factor: A scalar by which the learning_rate of every optim_config is
+    multiplied for this iteration.
+
+Schedules return factors rather than learning rates so that they combine
+with the per-parameter optim_configs of the Solver and with its per-epoch
+lr_decay. The Solver accepts a schedule through its lr_schedule option:
+
+solver = Solver(model, data, update_rule='sgd_momentum',
+                optim_config={'learning_rate': 0.1},
+                lr_schedule=Warmup(100, Cosine()))
+
+The warmup_iterations option of the Solver wraps its lr_schedule in Warmup,
+so the two lines below train identically:
+
+Solver(..., warmup_iterations=100, lr_schedule=Cosine())
+Solver(..., lr_schedule=Warmup(100, Cosine()))
+
+Schedules are small objects rather than closures so that they can be
+pickled along with the rest of a training setup.
+"""
+
+
+class Constant(object):
+    """
+    Keeps the learning rate unchanged.
+    """
+
+    def __call__(self, t, num_iterations):
+        return 1.0
+
+
+class Step(object):
+    """
+    Multiplies the learning rate by gamma every step_size iterations.
+    """
+
+    def __init__(self, step_size, gamma=0.1):
+        self.step_size = step_size
+        self.gamma = gamma
+
+    def __call__(self, t, num_iterations):
+        return self.gamma ** (t // self.step_size)
+
+
+class Cosine(object):
+    """
+    Anneals the learning rate from its configured value down to min_factor
+    times it along half a cosine over the run.
+    """
+
+    def __init__(self, min_factor=0.0):
+        self.min_factor = min_factor
+
+    def __call__(self, t, num_iterations):
+        progress = min(t / max(num_iterations - 1, 1), 1.0)
+        cosine = 0.5 * (1 + math.cos(math.pi * progress))
+        return self.min_factor + (1 - self.min_factor) * cosine
+
+
+class OneCycle(object):
+    """
+    The one-cycle policy: the learning rate rises from 1 / div_factor of its
+    configured value to the configured value over the first pct_start of
+    the run, then anneals along a cosine to 1 / final_div_factor of it. The
+    configured learning_rate is therefore the peak learning rate.
+    """
+
+    def __init__(self, pct_start=0.3, div_factor=25.0, final_div_factor=1e4):
+        self.pct_start = pct_start
+        self.div_factor = div_factor
+        self.final_div_factor = final_div_factor
+
+    def __call__(self, t, num_iterations):
+        peak = max(int(self.pct_start * num_iterations), 1)
+        if t < peak:
+            start, end, progress = 1 / self.div_factor, 1.0, t / peak
+        else:
+            start, end = 1.0, 1 / self.final_div_factor
+            progress = min((t - peak) / max(num_iterations - 1 - peak, 1), 1.0)
+        cosine = 0.5 * (1 + math.cos(math.pi * progress))
+        return end + (start - end) * cosine
+
+
+class Warmup(object):
+    """
+    Ramps the learning rate up linearly over the first warmup_iterations
+    iterations, then follows another schedule, by default a constant one.
+    The other schedule sees the iterations after the warmup, counted from 0.
+    """
+
+    def __init__(self, warmup_iterations, schedule=None):
+        self.warmup_iterations = warmup_iterations
+        self.schedule = schedule if schedule is not None else Constant()
+
+    def __call__(self, t, num_iterations):
+        if t < self.warmup_iterations:
+            return (t + 1) / self.warmup_iterations
+        return self.schedule(t - self.warmup_iterations,
+                             max(num_iterations - self.warmup_iterations, 1))
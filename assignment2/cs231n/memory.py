@@ -0,0 +1,209 @@
+from __future__ import print_function, division
+from builtins import object
+import weakref
+
+import numpy as np
+
+from cs231n.tracing import add_listener, remove_listener, in_span
+
+"""
+This file implements a profiler for the memory held by the caches of the
+forward passes in layers.py, fast_layers.py and layer_utils.py.
+
+MemoryProfiler is a tracing listener (see tracing.py). Whenever a leaf
+forward function returns (out, cache), it walks the cache (nested tuples,
+lists and dictionaries of arrays) and records every array in it. Arrays
+that are views of another array, such as a reshaped input, share their root
+buffer, so memory is counted per unique root buffer: once per cache for the
+per-layer numbers and once overall for the live total. When a backward
+function is called with a cache, that cache is released.
+
+The live total is the memory kept alive by caches that have not been
+consumed by a backward pass yet; its maximum over a training step is the
+peak cache memory of the step. Steps are delimited by the 'step' spans of
+the Solver, or by calling end_step() by hand. By default only caches of
+forward passes inside a 'step' span are registered, so that the test-time
+forward passes of check_accuracy are left out.
+
+Example usage:
+
+profiler = MemoryProfiler()
+solver = Solver(model, data, profilers=[profiler], ...)
+solver.train()
+profiler.report()
+"""
+
+
+def _root(a):
+    while isinstance(a.base, np.ndarray):
+        a = a.base
+    return a
+
+
+def _walk(obj, path, out):
+    if isinstance(obj, np.ndarray):
+        out.append((path, obj))
+    elif isinstance(obj, (tuple, list)):
+        for i, v in enumerate(obj):
+            _walk(v, '%s[%d]' % (path, i), out)
+    elif isinstance(obj, dict):
+        for k, v in obj.items():
+            _walk(v, '%s[%r]' % (path, k), out)
+    return out
+
+
+def cache_arrays(cache):
+    """
+    Return a list of (path, array) pairs of the arrays found in a cache, where
+    path describes how the array is reached, such as '[1][0]'.
+    """
+    return _walk(cache, '', [])
+
+
+def cache_nbytes(cache):
+    """
+    Return the number of bytes held by the unique root buffers of the arrays
+    in a cache.
+    """
+    roots = {}
+    for _, a in cache_arrays(cache):
+        root = _root(a)
+        roots[id(root)] = root.nbytes
+    return sum(roots.values())
+
+
+class MemoryProfiler(object):
+    """
+    Tracks the memory held by forward caches; see the top of this file.
+
+    After training, the instance variables are:
+    - layers: Dictionary mapping layer function names to dictionaries with
+      the number of calls, the total and the largest cache size in bytes.
+    - arrays: Dictionary mapping layer function names to a list of
+      (path, shape, dtype, nbytes, is_view) tuples describing the arrays in
+      its largest cache.
+    - step_peaks: List of the peak live cache bytes of every step.
+    - peak_bytes: Largest live cache size seen.
+    """
+
+    def __init__(self, step_span='step'):
+        """
+        Inputs:
+        - step_span: Name of the span inside which forward caches are
+          registered, or None to register them everywhere, such as when
+          profiling forward passes by hand.
+        """
+        self.step_span = step_span
+        self.layers = {}
+        self.arrays = {}
+        self.step_peaks = []
+        self.peak_bytes = 0
+        self._live = {}
+        self._roots = {}
+        self._step_peak = 0
+
+    def __enter__(self):
+        add_listener(self)
+        return self
+
+    def __exit__(self, *args):
+        remove_listener(self)
+
+    @property
+    def live_bytes(self):
+        """ Bytes of root buffers held by caches not yet released. """
+        total = 0
+        for root_id, (ref, nbytes, count) in list(self._roots.items()):
+            if ref() is None:
+                del self._roots[root_id]
+            else:
+                total += nbytes
+        return total
+
+    def event(self, name, args, result, start, end, depth, leaf):
+        if args is None:
+            if name == 'step':
+                self.end_step()
+            return
+        if not leaf:
+            return
+        if '_forward' in name and isinstance(result, tuple) and \
+                len(result) == 2:
+            if self.step_span is None or in_span(self.step_span):
+                self._register(name, result[1])
+        elif '_backward' in name and len(args) > 1:
+            self._release(args[1])
+
+    def _register(self, name, cache):
+        arrays = cache_arrays(cache)
+        roots, records = {}, []
+        for path, a in arrays:
+            root = _root(a)
+            roots[id(root)] = root
+            records.append((path, a.shape, str(a.dtype), a.nbytes,
+                            root is not a))
+        nbytes = sum(r.nbytes for r in roots.values())
+
+        stats = self.layers.get(name)
+        if stats is None:
+            stats = self.layers[name] = {'calls': 0, 'bytes': 0,
+                                         'max_bytes': 0}
+        stats['calls'] += 1
+        stats['bytes'] += nbytes
+        if nbytes >= stats['max_bytes']:
+            stats['max_bytes'] = nbytes
+            self.arrays[name] = records
+
+        for root_id, root in roots.items():
+            entry = self._roots.get(root_id)
+            if entry is None or entry[0]() is not root:
+                self._roots[root_id] = [weakref.ref(root), root.nbytes, 1]
+            else:
+                entry[2] += 1
+        self._live[id(cache)] = list(roots)
+
+        live = self.live_bytes
+        self._step_peak = max(self._step_peak, live)
+        self.peak_bytes = max(self.peak_bytes, live)
+
+    def _release(self, cache):
+        root_ids = self._live.pop(id(cache), None)
+        if root_ids is None:
+            return
+        for root_id in root_ids:
+            entry = self._roots.get(root_id)
+            if entry is not None:
+                entry[2] -= 1
+                if entry[2] <= 0:
+                    del self._roots[root_id]
+
+    def end_step(self):
+        """
+        Record the peak of the current step and forget caches that were
+        never released, such as those of test-time forward passes.
+        """
+        self.step_peaks.append(self._step_peak)
+        self._step_peak = 0
+        self._live = {}
+        self._roots = {}
+
+    def report(self, num_arrays=5):
+        """
+        Print the cache size of every layer function and the largest arrays
+        in its largest cache.
+        """
+        print('peak cache memory per step: %.2f MB' % (
+            max(self.step_peaks or [self.peak_bytes]) / 2.0**20))
+        print('%-28s %8s %12s %12s' % ('layer', 'calls', 'mean MB',
+                                       'max MB'))
+        by_size = sorted(self.layers, key=lambda k: -self.layers[k]['bytes'])
+        for name in by_size:
+            s = self.layers[name]
+            print('%-28s %8d %12.3f %12.3f' % (
+                name, s['calls'], s['bytes'] / s['calls'] / 2.0**20,
+                s['max_bytes'] / 2.0**20))
+            largest = sorted(self.arrays[name], key=lambda r: -r[3])
+            for path, shape, dtype, nbytes, is_view in largest[:num_arrays]:
+                print('    cache%-20s %-20s %-8s %10.3f MB%s' % (
+                    path, shape, dtype, nbytes / 2.0**20,
+                    ' (view)' if is_view else ''))
@@ -0,0 +1,198 @@
+from __future__ import print_function
+from builtins import object
+import json
+import os
+import pickle
+
+import numpy as np
+
+
+class ModelStore(object):
+    """
+    A ModelStore is a directory of saved models with a small JSON index, so
+    that hundreds of checkpoints can be listed and compared without reading
+    their parameters.
+
+    Every model is saved as a pickle of the model object with its params
+    removed, plus one .npy file per parameter:
+
+    models_dir/index.json
+    models_dir/<name>/model.pkl
+    models_dir/<name>/<param>.npy
+
+    The index records, for each model, its architecture (class name), the
+    shape and dtype of every parameter and any metrics given at save time.
+    Looking up a name returns a ModelHandle; parameters are only read when
+    the handle's params are accessed or the model is loaded, and then by
+    memory-mapping the .npy files.
+
+    Example usage:
+
+    store = ModelStore('models')
+    store.save('fc_lr1e-3', model, metrics={'val_acc': solver.best_val_acc})
+    ...
+    best = max(store.handles(), key=lambda h: h.metrics.get('val_acc', 0))
+    model = best.load()
+    """
+
+    INDEX = 'index.json'
+
+    def __init__(self, models_dir):
+        """
+        Open the store in models_dir, creating the directory if needed.
+        """
+        self.models_dir = models_dir
+        if not os.path.isdir(models_dir):
+            os.makedirs(models_dir)
+        self.index = {}
+        index_file = os.path.join(models_dir, self.INDEX)
+        if os.path.isfile(index_file):
+            with open(index_file, 'r') as f:
+                self.index = json.load(f)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(sorted(self.index))
+
+    def __getitem__(self, name):
+        if name not in self.index:
+            raise KeyError(name)
+        return ModelHandle(self, name, self.index[name])
+
+    def handles(self):
+        """
+        Return a list of ModelHandles for all models in the store.
+        """
+        return [self[name] for name in self]
+
+    def save(self, name, model, metrics=None):
+        """
+        Save a model under the given name, replacing any model of that name.
+
+        Inputs:
+        - name: String naming the model; used as a directory name.
+        - model: A model object with a params dictionary, such as a
+          FullyConnectedNet or a ThreeLayerConvNet.
+        - metrics: Optional dictionary of JSON-serializable values, such as
+          validation accuracy, to record in the index.
+        """
+        model_dir = os.path.join(self.models_dir, name)
+        if not os.path.isdir(model_dir):
+            os.makedirs(model_dir)
+
+        params = {}
+        for k, v in model.params.items():
+            filename = '%s.npy' % k
+            np.save(os.path.join(model_dir, filename), v)
+            params[k] = {
+              'file': filename,
+              'shape': list(v.shape),
+              'dtype': str(v.dtype),
+            }
+
+        # Pickle the model without its parameters; they live in the .npy files
+        model_params = model.params
+        model.params = {}
+        try:
+            with open(os.path.join(model_dir, 'model.pkl'), 'wb') as f:
+                pickle.dump(model, f, protocol=2)
+        finally:
+            model.params = model_params
+
+        self.index[name] = {
+          'architecture': type(model).__name__,
+          'params': params,
+          'num_params': int(sum(np.prod(p['shape']) for p in params.values())),
+          'metrics': metrics or {},
+        }
+        self._write_index()
+
+    def remove(self, name):
+        """
+        Remove a model from the index. Its files are left on disk.
+        """
+        del self.index[name]
+        self._write_index()
+
+    def _write_index(self):
+        index_file = os.path.join(self.models_dir, self.INDEX)
+        tmp_file = index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.rename(tmp_file, index_file)
+
+
+class ModelHandle(object):
+    """
+    A lazy reference to a model in a ModelStore. The architecture, parameter
+    shapes and metrics are available from the index without touching the
+    model's files; params and load() read them on demand.
+    """
+
+    def __init__(self, store, name, info):
+        self.store = store
+        self.name = name
+        self.info = info
+        self._params = None
+
+    def __repr__(self):
+        return '<ModelHandle %s: %s, %d params>' % (
+            self.name, self.architecture, self.num_params)
+
+    @property
+    def architecture(self):
+        return self.info['architecture']
+
+    @property
+    def num_params(self):
+        return self.info['num_params']
+
+    @property
+    def metrics(self):
+        return self.info['metrics']
+
+    @property
+    def shapes(self):
+        return {k: tuple(p['shape']) for k, p in self.info['params'].items()}
+
+    @property
+    def params(self):
+        """
+        Dictionary of read-only memory-mapped parameter arrays, opened the
+        first time it is accessed.
+        """
+        if self._params is None:
+            self._params = self._load_params('r')
+        return self._params
+
+    def load(self, mmap_mode='c'):
+        """
+        Load the model object with its parameters.
+
+        Inputs:
+        - mmap_mode: Memory-map mode for the parameter arrays. The default
+          'c' maps them copy-on-write, so the model can be trained further
+          while untouched pages are never read into memory; 'r' gives
+          read-only arrays and None reads the arrays into memory.
+
+        Returns:
+        - model: The saved model object.
+        """
+        model_dir = os.path.join(self.store.models_dir, self.name)
+        with open(os.path.join(model_dir, 'model.pkl'), 'rb') as f:
+            model = pickle.load(f)
+        model.params = self._load_params(mmap_mode)
+        return model
+
+    def _load_params(self, mmap_mode):
+        model_dir = os.path.join(self.store.models_dir, self.name)
+        params = {}
+        for k, p in self.info['params'].items():
+            params[k] = np.load(os.path.join(model_dir, p['file']),
+                                mmap_mode=mmap_mode)
+        return params
@@ -27,9 +27,21 @@ work well for a variety of different problems.
 
 For efficiency, update rules may perform in-place updates, mutating w and
 setting next_w equal to w.
+
+sgd_momentum_fused, rmsprop_fused and adam_fused compute the same updates as
+sgd_momentum, rmsprop and adam entirely in place, keeping a scratch buffer in
+the config, so that they allocate no arrays after their first call. Combined
+with flat parameters (flat_params=True in the Solver) a step then runs a
+fixed, small number of vectorized operations. The scratch buffer holds no
+state between calls and is allocated again when it is missing, so the Solver
+leaves it out of checkpoints.
 """
 
 
+# Config entries that hold temporaries rather than optimizer state
+SCRATCH_KEYS = ('scratch',)
+
+
 def sgd(w, dw, config=None):
     """
     Performs vanilla stochastic gradient descent.
@@ -167,3 +179,212 @@ def adam(w, dw, config=None):
     ###########################################################################
 
     return next_w, config
+
+
+def _buffer(config, key, w, init=np.zeros_like):
+    # Return config[key], allocating it only on the first call
+    buf = config.get(key)
+    if buf is None:
+        buf = config[key] = init(w)
+    return buf
+
+
+def sgd_momentum_fused(w, dw, config=None):
+    """
+    Same update as sgd_momentum, computed in place: the velocity and w are
+    updated with out= ufuncs, using a scratch buffer kept in the config, so
+    that no arrays are allocated after the first call.
+
+    config format: as for sgd_momentum, plus
+    - scratch: A numpy array of the same shape as w used for temporaries.
+    """
+    if config is None: config = {}
+    config.setdefault('learning_rate', 1e-2)
+    config.setdefault('momentum', 0.9)
+    v = _buffer(config, 'velocity', w)
+    scratch = _buffer(config, 'scratch', w, np.empty_like)
+
+    v *= config['momentum']
+    np.multiply(dw, config['learning_rate'], out=scratch)
+    v -= scratch
+    w += v
+
+    return w, config
+
+
+def rmsprop_fused(w, dw, config=None):
+    """
+    Same update as rmsprop, computed in place with a scratch buffer kept in
+    the config; see sgd_momentum_fused.
+    """
+    if config is None: config = {}
+    config.setdefault('learning_rate', 1e-2)
+    config.setdefault('decay_rate', 0.99)
+    config.setdefault('epsilon', 1e-8)
+    cache = _buffer(config, 'cache', w)
+    scratch = _buffer(config, 'scratch', w, np.empty_like)
+    decay_rate = config['decay_rate']
+
+    # cache = decay_rate * cache + (1 - decay_rate) * dw**2
+    cache *= decay_rate
+    np.multiply(dw, dw, out=scratch)
+    scratch *= 1 - decay_rate
+    cache += scratch
+
+    # w -= learning_rate * dw / (sqrt(cache) + epsilon)
+    np.sqrt(cache, out=scratch)
+    scratch += config['epsilon']
+    np.divide(dw, scratch, out=scratch)
+    scratch *= config['learning_rate']
+    w -= scratch
+
+    return w, config
+
+
+def adam_fused(w, dw, config=None):
+    """
+    Same update as adam, computed in place with a scratch buffer kept in the
+    config; see sgd_momentum_fused.
+    """
+    if config is None: config = {}
+    config.setdefault('learning_rate', 1e-3)
+    config.setdefault('beta1', 0.9)
+    config.setdefault('beta2', 0.999)
+    config.setdefault('epsilon', 1e-8)
+    config.setdefault('t', 0)
+    m = _buffer(config, 'm', w)
+    v = _buffer(config, 'v', w)
+    scratch = _buffer(config, 'scratch', w, np.empty_like)
+    beta1, beta2 = config['beta1'], config['beta2']
+
+    config['t'] += 1
+    t = config['t']
+
+    # m = beta1 * m + (1 - beta1) * dw
+    m *= beta1
+    np.multiply(dw, 1 - beta1, out=scratch)
+    m += scratch
+
+    # v = beta2 * v + (1 - beta2) * dw**2
+    v *= beta2
+    np.multiply(dw, dw, out=scratch)
+    scratch *= 1 - beta2
+    v += scratch
+
+    # w -= learning_rate * mt / (sqrt(vt) + epsilon), with the bias
+    # corrections mt = m / (1 - beta1**t) and vt = v / (1 - beta2**t)
+    np.divide(v, 1 - beta2**t, out=scratch)
+    np.sqrt(scratch, out=scratch)
+    scratch += config['epsilon']
+    np.divide(m, scratch, out=scratch)
+    scratch *= config['learning_rate'] / (1 - beta1**t)
+    w -= scratch
+
+    return w, config
+
+
+def _trust_ratio(w_norm, update_norm):
+    # Ratio of the weight norm to the update norm, or 1 if either is zero
+    if w_norm > 0 and update_norm > 0:
+        return w_norm / update_norm
+    return 1.0
+
+
+def lars(w, dw, config=None):
+    """
+    Uses layer-wise adaptive rate scaling (LARS) on top of stochastic
+    gradient descent with momentum, for training with large minibatches.
+    The learning rate of every weight array is scaled by a local learning
+    rate proportional to the ratio of the norm of the weights to the norm of
+    their gradient, so that no layer takes steps that are large relative to
+    its weights.
+
+    Arrays with at most one dimension, such as biases and the scale and
+    shift of normalization layers, are updated without scaling and weight
+    decay, as is usual for LARS.
+
+    config format:
+    - learning_rate: Scalar global learning rate. Since the local learning
+      rate is small, this is usually much larger than for sgd_momentum.
+    - momentum: Scalar between 0 and 1 giving the momentum value.
+    - weight_decay: Scalar L2 weight decay added to the gradient.
+    - trust_coefficient: Scalar giving how far the weights may move
+      relative to their norm in one step, before the global learning rate.
+    - velocity: A numpy array of the same shape as w storing a moving
+      average of the updates.
+    """
+    if config is None: config = {}
+    config.setdefault('learning_rate', 1.0)
+    config.setdefault('momentum', 0.9)
+    config.setdefault('weight_decay', 0.0)
+    config.setdefault('trust_coefficient', 1e-3)
+    v = config.get('velocity', np.zeros_like(w))
+
+    if w.ndim > 1:
+        weight_decay = config['weight_decay']
+        w_norm = np.linalg.norm(w)
+        dw_norm = np.linalg.norm(dw)
+        local_lr = config['trust_coefficient'] * _trust_ratio(
+            w_norm, dw_norm + weight_decay * w_norm)
+        if weight_decay:
+            dw = dw + weight_decay * w
+    else:
+        local_lr = 1.0
+
+    v = config['momentum'] * v - config['learning_rate'] * local_lr * dw
+    w += v
+    config['velocity'] = v
+
+    return w, config
+
+
+def lamb(w, dw, config=None):
+    """
+    Uses the LAMB update rule, which applies layer-wise adaptive rate
+    scaling to Adam for training with large minibatches: the Adam step,
+    plus weight decay, of every weight array is rescaled so that its norm
+    is learning_rate times the norm of the weights.
+
+    Arrays with at most one dimension are updated without rescaling and
+    weight decay; see lars.
+
+    config format:
+    - learning_rate: Scalar learning rate.
+    - beta1, beta2, epsilon, m, v, t: As for adam.
+    - weight_decay: Scalar weight decay added to the Adam step.
+    """
+    if config is None: config = {}
+    config.setdefault('learning_rate', 1e-3)
+    config.setdefault('beta1', 0.9)
+    config.setdefault('beta2', 0.999)
+    config.setdefault('epsilon', 1e-6)
+    config.setdefault('weight_decay', 0.0)
+    config.setdefault('m', np.zeros_like(w))
+    config.setdefault('v', np.zeros_like(w))
+    config.setdefault('t', 0)
+    beta1, beta2 = config['beta1'], config['beta2']
+
+    t = config['t'] + 1
+    m = beta1 * config['m'] + (1 - beta1) * dw
+    v = beta2 * config['v'] + (1 - beta2) * (dw**2)
+    mt = m / (1 - beta1**t)
+    vt = v / (1 - beta2**t)
+    step = mt / (np.sqrt(vt) + config['epsilon'])
+
+    if w.ndim > 1:
+        if config['weight_decay']:
+            step += config['weight_decay'] * w
+        trust_ratio = _trust_ratio(np.linalg.norm(w), np.linalg.norm(step))
+    else:
+        trust_ratio = 1.0
+
+    w -= config['learning_rate'] * trust_ratio * step
+    config['m'], config['v'], config['t'] = m, v, t
+
+    return w, config
+
+
+# Update rules that adapt the step of every parameter array to its norm, and
+# so must see the parameters one at a time rather than in a flat buffer
+lars.layerwise = True
+lamb.layerwise = True
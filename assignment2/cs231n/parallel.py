@@ -0,0 +1,251 @@
+from __future__ import print_function, division
+from builtins import range
+from builtins import object
+import multiprocessing
+import traceback
+
+import numpy as np
+
+"""
+This file implements synchronous data-parallel computation of losses and
+gradients for models that follow the Solver API.
+
+A DataParallel object starts K worker processes, each holding a replica of
+the model. The parameters of all replicas live in a single shared-memory
+buffer, so an update written by the main process is immediately visible to
+every worker and no parameters are ever sent between processes. For every
+minibatch the main process copies the data into a shared input buffer and
+sends each worker the range of rows it is responsible for; the workers write
+their gradients into their own slot of a shared gradient buffer, and the main
+process averages the slots, weighted by the size of each shard.
+
+Workers are started with fork, so the model and anything it references are
+inherited rather than pickled. Each worker reseeds numpy's random state so
+that dropout masks differ between replicas. Batch normalization statistics
+are computed per shard, as in other data-parallel implementations; the
+running averages of the first replica are copied back to the main model
+after every step so that test-time predictions use them.
+
+Since every worker runs its own BLAS, it is usually best to limit BLAS to
+one thread per process (for example OMP_NUM_THREADS=1 or
+OPENBLAS_NUM_THREADS=1 in the environment) when using as many workers as
+cores.
+"""
+
+
+_ALIGN = 64
+
+
+def _get_context():
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork')
+    return multiprocessing
+
+
+def _param_layout(params):
+    """
+    Lay out a dictionary of arrays in a flat byte buffer, grouping arrays of
+    the same dtype so that each group is a contiguous typed region.
+
+    Returns a tuple (layout, groups, nbytes) where layout is a list of
+    (name, dtype, shape, offset) tuples, groups is a list of
+    (dtype, offset, count) tuples and nbytes is the aligned size of the
+    buffer.
+    """
+    names = sorted(params, key=lambda k: (params[k].dtype.str, k))
+    layout, groups = [], []
+    offset = 0
+    for name in names:
+        p = params[name]
+        if groups and groups[-1][0] == p.dtype:
+            dtype, start, count = groups[-1]
+            groups[-1] = (dtype, start, count + p.size)
+        else:
+            offset = -(-offset // _ALIGN) * _ALIGN
+            groups.append((p.dtype, offset, p.size))
+        layout.append((name, p.dtype, p.shape, offset))
+        offset += p.nbytes
+    nbytes = -(-offset // _ALIGN) * _ALIGN
+    return layout, groups, nbytes
+
+
+def _views(buf, layout, base=0):
+    """
+    Return a dictionary of arrays viewing buf according to layout, starting
+    base bytes into the buffer.
+    """
+    views = {}
+    for name, dtype, shape, offset in layout:
+        count = int(np.prod(shape))
+        views[name] = np.frombuffer(buf, dtype=dtype, count=count,
+                                    offset=base + offset).reshape(shape)
+    return views
+
+
+def _bn_state(model):
+    state = []
+    for bn_param in getattr(model, 'bn_params', []):
+        state.append({k: v for k, v in bn_param.items()
+                      if isinstance(v, np.ndarray)})
+    return state
+
+
+def _worker(conn, rank, model, X_shared, y_shared, grad_buf, layout,
+            slot_nbytes, seed):
+    np.random.seed(seed)
+    grads = _views(grad_buf, layout, rank * slot_nbytes)
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        start, stop = msg
+        try:
+            loss, step_grads = model.loss(X_shared[start:stop],
+                                          y_shared[start:stop])
+            for k, g in step_grads.items():
+                grads[k][...] = g
+            conn.send((True, loss, _bn_state(model) if rank == 0 else None))
+        except Exception:
+            conn.send((False, traceback.format_exc(), None))
+    conn.close()
+
+
+class DataParallel(object):
+    """
+    Splits the minibatches of a model across worker processes holding model
+    replicas, averages their gradients through shared memory and keeps the
+    parameters of all replicas in one shared buffer.
+
+    Example usage:
+
+    parallel = DataParallel(model, num_workers=4, batch_size=100,
+                            sample_shape=(3, 32, 32), dtype=np.float32)
+    loss, grads = parallel.loss(X_batch, y_batch)
+    ... update model.params in place ...
+    parallel.close()
+
+    Parameters must be updated in place, as all update rules in optim.py do,
+    since model.params holds views into the shared buffer. The Solver does
+    this for you when constructed with num_workers > 1.
+    """
+
+    def __init__(self, model, num_workers, batch_size, sample_shape,
+                 dtype=np.float32, seed=None):
+        """
+        Move the parameters of model into shared memory and start the workers.
+
+        Inputs:
+        - model: A model object conforming to the Solver API.
+        - num_workers: Number of worker processes.
+        - batch_size: Largest minibatch that will be passed to loss().
+        - sample_shape: Shape (d_1, ..., d_k) of a single sample.
+        - dtype: Datatype of the shared input buffer.
+        - seed: Base seed for the workers' random states; worker k uses
+          seed + k. If None, it is drawn from numpy's global random state.
+        """
+        ctx = _get_context()
+        self.model = model
+        self.num_workers = num_workers
+
+        # Shared parameters: copy the current values in and let the model
+        # (and, after the fork, every replica) use views of the buffer.
+        layout, groups, nbytes = _param_layout(model.params)
+        self._layout, self._groups, self._slot_nbytes = layout, groups, nbytes
+        self._param_buf = ctx.RawArray('b', max(nbytes, 1))
+        shared = _views(self._param_buf, layout)
+        for k, v in shared.items():
+            v[...] = model.params[k]
+        model.params = shared
+
+        self._grad_buf = ctx.RawArray('b', max(nbytes * num_workers, 1))
+        self._grads = np.empty(max(nbytes, 1), dtype=np.int8)
+        self._avg_grads = _views(self._grads, layout)
+
+        sample_shape = tuple(sample_shape)
+        self._X_buf = ctx.RawArray(
+            'b', batch_size * int(np.prod(sample_shape)) *
+            np.dtype(dtype).itemsize)
+        self._X = np.frombuffer(self._X_buf, dtype=dtype).reshape(
+            (batch_size,) + sample_shape)
+        self._y_buf = ctx.RawArray('b', batch_size * 8)
+        self._y = np.frombuffer(self._y_buf, dtype=np.int64)
+
+        if seed is None:
+            seed = np.random.randint(2**31 - num_workers)
+        self._conns, self._processes = [], []
+        for rank in range(num_workers):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(child_conn, rank, model, self._X, self._y,
+                      self._grad_buf, layout, nbytes, seed + rank))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+    def loss(self, X, y):
+        """
+        Compute the loss and gradients of the model on a minibatch, split
+        evenly across the workers.
+
+        Inputs:
+        - X: Array of shape (N, d_1, ..., d_k) with N <= batch_size.
+        - y: Array of shape (N,) of labels.
+
+        Returns a tuple of:
+        - loss: Scalar giving the loss, averaged over the whole minibatch.
+        - grads: Dictionary mapping parameter names to averaged gradients.
+          The arrays are reused by the next call to loss().
+        """
+        N = X.shape[0]
+        self._X[:N] = X
+        self._y[:N] = y
+
+        bounds = np.linspace(0, N, self.num_workers + 1).astype(int)
+        active = []
+        for k, conn in enumerate(self._conns):
+            if bounds[k + 1] > bounds[k]:
+                conn.send((bounds[k], bounds[k + 1]))
+                active.append(k)
+
+        weights = np.zeros(self.num_workers)
+        loss, error = 0.0, None
+        for k in active:
+            ok, result, bn_state = self._conns[k].recv()
+            if not ok:
+                error = result
+                continue
+            weights[k] = (bounds[k + 1] - bounds[k]) / N
+            loss += weights[k] * result
+            if bn_state:
+                for bn_param, state in zip(self.model.bn_params, bn_state):
+                    bn_param.update(state)
+        if error is not None:
+            raise RuntimeError('Data-parallel worker failed:\n%s' % error)
+
+        # Average the gradient slots, one contiguous region per dtype
+        for dtype, offset, count in self._groups:
+            slots = np.ndarray((self.num_workers, count), dtype=dtype,
+                               buffer=self._grad_buf, offset=offset,
+                               strides=(self._slot_nbytes, dtype.itemsize))
+            avg = np.frombuffer(self._grads, dtype=dtype, count=count,
+                                offset=offset)
+            avg[...] = np.dot(weights.astype(dtype), slots)
+        return loss, self._avg_grads
+
+    def close(self):
+        """
+        Stop the worker processes. model.params keeps its current values.
+        """
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (IOError, OSError):
+                pass
+        for process in self._processes:
+            process.join()
+        for conn in self._conns:
+            conn.close()
+        self._conns, self._processes = [], []
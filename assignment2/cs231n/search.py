@@ -0,0 +1,280 @@
+from __future__ import print_function, division
+from builtins import range
+from builtins import object
+import math
+import multiprocessing
+from multiprocessing import cpu_count
+
+import numpy as np
+
+from cs231n.solver import Solver
+from cs231n.timers import clock
+
+"""
+This file implements successive halving and Hyperband (Li et al., 2017) for
+searching the hyperparameters of models trained with a Solver.
+
+Successive halving trains many configurations for a small number of epochs,
+keeps the best 1 / eta of them by validation accuracy, trains the survivors
+for eta times as many epochs and repeats until one configuration remains or
+the maximum budget is reached. Survivors are not restarted: each trial keeps
+the state of its Solver (model, update rule state, histories and iteration)
+and training continues from where it stopped.
+
+Hyperband runs several rounds of successive halving that trade off the
+number of configurations against the budget each one starts with, so it
+does not depend on picking that tradeoff by hand.
+
+Trials run in a pool of worker processes. The data is shared with the
+workers by fork instead of being sent to them, and only the trial states
+travel between processes. As every worker runs its own BLAS, limiting BLAS
+to one thread per process (OMP_NUM_THREADS=1) usually gives the highest
+throughput.
+
+Example usage:
+
+def build_model(config):
+    return FullyConnectedNet([100, 100], weight_scale=config['weight_scale'],
+                             reg=config['reg'], dropout=config['dropout'])
+
+space = {
+  'learning_rate': (1e-4, 1e-2),
+  'weight_scale': (1e-3, 1e-1),
+  'reg': (1e-5, 1e-1),
+  'dropout': [0, 0.25, 0.5],
+}
+search = SuccessiveHalving(data, build_model,
+                           sample_configs(space, 27, seed=0),
+                           min_epochs=1, max_epochs=9,
+                           solver_kwargs={'update_rule': 'adam'})
+best = search.run()
+print(best.config, best.val_acc)
+"""
+
+
+# Configuration keys passed to the update rule and to the Solver rather than
+# (or in addition to) build_model.
+OPTIM_KEYS = ('learning_rate', 'momentum', 'decay_rate', 'beta1', 'beta2',
+              'epsilon')
+SOLVER_KEYS = ('update_rule', 'lr_decay', 'batch_size')
+
+
+def sample_configs(space, num_configs, seed=None):
+    """
+    Sample random configurations from a search space.
+
+    Inputs:
+    - space: Dictionary mapping hyperparameter names to one of:
+      - a list of values, sampled uniformly;
+      - a tuple (low, high), sampled log-uniformly;
+      - a tuple (low, high, 'linear'), sampled uniformly;
+      - a function of a np.random.RandomState returning a value.
+    - num_configs: Number of configurations to sample.
+    - seed: Seed of the random state.
+
+    Returns: A list of num_configs dictionaries.
+    """
+    rng = np.random.RandomState(seed)
+    configs = []
+    for _ in range(num_configs):
+        config = {}
+        for name in sorted(space):
+            value = space[name]
+            if callable(value):
+                config[name] = value(rng)
+            elif isinstance(value, list):
+                config[name] = value[rng.randint(len(value))]
+            elif len(value) == 3 and value[2] == 'linear':
+                config[name] = rng.uniform(value[0], value[1])
+            else:
+                low, high = np.log10(value[0]), np.log10(value[1])
+                config[name] = 10 ** rng.uniform(low, high)
+        configs.append(config)
+    return configs
+
+
+class Trial(object):
+    """
+    One configuration of a search with the state of its training so far.
+    """
+
+    def __init__(self, trial_id, config):
+        self.trial_id = trial_id
+        self.config = config
+        self.state = None
+        self.epochs = 0
+        self.val_acc = 0
+        self.val_acc_history = []
+        self.train_time = 0
+
+    def __repr__(self):
+        return '<Trial %d: val_acc %f after %g epochs, %r>' % (
+            self.trial_id, self.val_acc, self.epochs, self.config)
+
+
+# Set in the parent before the pool forks, so workers inherit them
+_DATA = None
+_BUILD_MODEL = None
+
+
+def _train_trial(job):
+    config, state, num_epochs, solver_kwargs, seed = job
+    np.random.seed(seed)
+    kwargs = dict(solver_kwargs)
+    optim_config = dict(kwargs.pop('optim_config', {}))
+    optim_config.update((k, config[k]) for k in OPTIM_KEYS if k in config)
+    kwargs.update((k, config[k]) for k in SOLVER_KEYS if k in config)
+    kwargs['optim_config'] = optim_config
+    kwargs['num_epochs'] = num_epochs
+    kwargs.setdefault('verbose', False)
+
+    model = _BUILD_MODEL(config) if state is None else state['model']
+    solver = Solver(model, _DATA, **kwargs)
+    if state is not None:
+        solver.set_state(state)
+    start = clock()
+    solver.train()
+    return solver.get_state(), clock() - start
+
+
+class SuccessiveHalving(object):
+    """
+    Successive halving over a list of configurations; see the top of this
+    file.
+    """
+
+    def __init__(self, data, build_model, configs, **kwargs):
+        """
+        Required arguments:
+        - data: Dictionary of training and validation data, as for the Solver.
+        - build_model: Function taking a configuration dictionary and
+          returning a new model. It is called in the worker processes.
+        - configs: List of configuration dictionaries. Keys in OPTIM_KEYS go
+          into the optim_config of the Solver and keys in SOLVER_KEYS are
+          passed to the Solver; build_model sees all of them.
+
+        Optional arguments:
+        - min_epochs: Number of epochs every configuration is trained for in
+          the first round; may be fractional.
+        - max_epochs: Largest number of epochs any configuration is trained
+          for; default is min_epochs * eta ** k for the smallest k that
+          leaves a single survivor.
+        - eta: Factor by which the number of trials shrinks and the budget
+          grows every round; default is 3.
+        - solver_kwargs: Dictionary of other arguments for the Solver, such
+          as update_rule or batch_size.
+        - num_workers: Number of worker processes; default is the number of
+          CPUs.
+        - seed: Seed from which the random state of every training job is
+          drawn, for reproducible searches.
+        - verbose: Boolean; if set to false then no output will be printed.
+        """
+        self.data = data
+        self.build_model = build_model
+        self.trials = [Trial(i, c) for i, c in enumerate(configs)]
+        self.min_epochs = kwargs.pop('min_epochs', 1)
+        self.eta = kwargs.pop('eta', 3)
+        self.max_epochs = kwargs.pop('max_epochs', None)
+        self.solver_kwargs = kwargs.pop('solver_kwargs', {})
+        self.num_workers = kwargs.pop('num_workers', None) or cpu_count()
+        self.rng = np.random.RandomState(kwargs.pop('seed', None))
+        self.verbose = kwargs.pop('verbose', True)
+
+        if len(kwargs) > 0:
+            extra = ', '.join('"%s"' % k for k in list(kwargs.keys()))
+            raise ValueError('Unrecognized arguments %s' % extra)
+
+        if self.max_epochs is None:
+            rounds = int(math.ceil(math.log(max(len(configs), 1), self.eta)))
+            self.max_epochs = self.min_epochs * self.eta ** rounds
+
+        self.best = None
+        self.train_time = None
+
+    def run(self):
+        """
+        Run the search.
+
+        Returns:
+        - best: The Trial with the highest validation accuracy among those
+          trained for the largest budget.
+        """
+        global _DATA, _BUILD_MODEL
+        _DATA, _BUILD_MODEL = self.data, self.build_model
+        ctx = multiprocessing
+        if hasattr(multiprocessing, 'get_context'):
+            ctx = multiprocessing.get_context('fork')
+        pool = ctx.Pool(min(self.num_workers, len(self.trials)))
+
+        start = clock()
+        try:
+            survivors = list(self.trials)
+            epochs = self.min_epochs
+            while True:
+                self._train(pool, survivors, epochs)
+                survivors.sort(key=lambda t: t.val_acc, reverse=True)
+                if self.verbose:
+                    print('%d trials at %g epochs, best val_acc: %f' % (
+                        len(survivors), epochs, survivors[0].val_acc))
+                if len(survivors) <= 1 or epochs >= self.max_epochs:
+                    break
+                survivors = survivors[:max(1, len(survivors) // self.eta)]
+                epochs = min(epochs * self.eta, self.max_epochs)
+        finally:
+            pool.close()
+            pool.join()
+            _DATA, _BUILD_MODEL = None, None
+        self.train_time = clock() - start
+        self.best = survivors[0]
+        return self.best
+
+    def _train(self, pool, trials, epochs):
+        jobs = [(t.config, t.state, epochs, self.solver_kwargs,
+                 self.rng.randint(2**31)) for t in trials]
+        for trial, (state, train_time) in zip(trials,
+                                              pool.imap(_train_trial, jobs)):
+            trial.state = state
+            trial.epochs = epochs
+            trial.val_acc = state['best_val_acc']
+            trial.val_acc_history = state['val_acc_history']
+            trial.train_time += train_time
+
+
+def hyperband(data, build_model, space, max_epochs, eta=3, seed=None,
+              **kwargs):
+    """
+    Run Hyperband: one round of successive halving for every bracket
+    s = s_max, ..., 0, where bracket s samples about
+    (s_max + 1) / (s + 1) * eta ** s configurations and starts them with
+    max_epochs * eta ** -s epochs.
+
+    Inputs:
+    - data, build_model: As for SuccessiveHalving.
+    - space: Search space, as for sample_configs.
+    - max_epochs: Largest number of epochs any configuration is trained for.
+    - eta: Factor by which trials shrink and budgets grow.
+    - seed: Seed for sampling configurations.
+    - kwargs: Other arguments for SuccessiveHalving, such as solver_kwargs,
+      num_workers or verbose. The smallest budget is max_epochs / eta ** s_max
+      where s_max is chosen so that it is at least min_epochs (default 1).
+
+    Returns a tuple of:
+    - best: The best Trial over all brackets.
+    - searches: List of the SuccessiveHalving objects of all brackets.
+    """
+    min_epochs = kwargs.pop('min_epochs', 1)
+    s_max = int(math.floor(math.log(max_epochs / min_epochs, eta) + 1e-9))
+    rng = np.random.RandomState(seed)
+    searches = []
+    for s in range(s_max, -1, -1):
+        n = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        configs = sample_configs(space, n, rng.randint(2**31))
+        search = SuccessiveHalving(data, build_model, configs,
+                                   min_epochs=max_epochs / eta ** s,
+                                   max_epochs=max_epochs, eta=eta,
+                                   seed=rng.randint(2**31), **kwargs)
+        search.run()
+        searches.append(search)
+    best = max((search.best for search in searches),
+               key=lambda t: t.val_acc)
+    return best, searches
@@ -0,0 +1,375 @@
+from __future__ import print_function, division
+from builtins import range
+from builtins import object
+import json
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from cs231n.data_utils import load_CIFAR10, load_tiny_imagenet, ImageDataset
+from cs231n.data_stats import compute_mean_image
+
+"""
+This file implements a sharded container format for image datasets, so that
+training can start without loading a whole dataset and any range of samples
+can be read directly from disk.
+
+A sharded dataset is a directory holding fixed-size shards of samples and an
+index:
+
+out_dir/index.json       number of samples, shard size, sample shape, dtype
+                         and the list of shard files
+out_dir/shard_00000.npy  samples [0, shard_size)
+out_dir/shard_00001.npy  samples [shard_size, 2 * shard_size)
+...
+out_dir/labels.npy       labels of all samples, if available
+
+Every shard except the last holds exactly shard_size samples, so sample i
+lives at row i % shard_size of shard i // shard_size. Shards are .npy files
+of uint8 pixels that are memory-mapped when read.
+
+The functions write_cifar10_shards and write_tiny_imagenet_shards convert the
+output of the existing loaders into one sharded dataset per split, and
+load_sharded_data returns those splits as ImageDatasets that can be passed to
+a Solver.
+"""
+
+
+INDEX = 'index.json'
+
+
+class ShardWriter(object):
+    """
+    Writes samples into a sharded dataset directory. Samples are appended
+    with write() in order; close() writes the final partial shard, the labels
+    and the index. The index is written last, so a directory without one is
+    an incomplete dataset.
+    """
+
+    def __init__(self, out_dir, sample_shape, shard_size=10000,
+                 dtype=np.uint8):
+        """
+        Inputs:
+        - out_dir: Directory to write the dataset to; created if needed.
+        - sample_shape: Shape of a single sample, such as (3, 32, 32).
+        - shard_size: Number of samples per shard.
+        - dtype: Datatype of the stored samples.
+        """
+        self.out_dir = out_dir
+        self.sample_shape = tuple(sample_shape)
+        self.shard_size = shard_size
+        self.dtype = np.dtype(dtype)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+
+        self.num_samples = 0
+        self.shards = []
+        self.labels = []
+        self._buffer = np.empty((shard_size,) + self.sample_shape, self.dtype)
+        self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+
+    def write(self, X, y=None):
+        """
+        Append samples to the dataset.
+
+        Inputs:
+        - X: Array of shape (N,) + sample_shape.
+        - y: Array of shape (N,) of labels, or None if the dataset has no
+          labels. Either all or no calls to write must pass labels.
+        """
+        if y is not None:
+            self.labels.append(np.asarray(y))
+        start = 0
+        N = X.shape[0]
+        while start < N:
+            n = min(N - start, self.shard_size - self._buffered)
+            self._buffer[self._buffered:self._buffered + n] = X[start:start + n]
+            self._buffered += n
+            start += n
+            if self._buffered == self.shard_size:
+                self._flush()
+        self.num_samples += N
+
+    def _flush(self):
+        if self._buffered == 0:
+            return
+        filename = 'shard_%05d.npy' % len(self.shards)
+        np.save(os.path.join(self.out_dir, filename),
+                self._buffer[:self._buffered])
+        self.shards.append(filename)
+        self._buffered = 0
+
+    def close(self):
+        """
+        Write the last shard, the labels and the index.
+        """
+        self._flush()
+        labels = None
+        if self.labels:
+            labels = 'labels.npy'
+            np.save(os.path.join(self.out_dir, labels),
+                    np.concatenate(self.labels))
+        index = {
+          'num_samples': self.num_samples,
+          'shard_size': self.shard_size,
+          'sample_shape': list(self.sample_shape),
+          'dtype': str(self.dtype),
+          'shards': self.shards,
+          'labels': labels,
+        }
+        tmp_file = os.path.join(self.out_dir, INDEX + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.rename(tmp_file, os.path.join(self.out_dir, INDEX))
+
+
+class ShardedDataset(object):
+    """
+    Random access to a sharded dataset written by ShardWriter.
+
+    A ShardedDataset behaves like a read-only array of shape
+    (num_samples,) + sample_shape: indexing it with an integer, a slice or
+    an integer array reads just the requested samples from the memory-mapped
+    shards. Reads that span several shards can be spread over a pool of
+    threads. The labels, if present, are available as the array y.
+    """
+
+    def __init__(self, path, num_workers=1):
+        """
+        Inputs:
+        - path: Directory of the sharded dataset.
+        - num_workers: Number of threads used to read from different shards
+          in parallel.
+        """
+        self.path = path
+        with open(os.path.join(path, INDEX), 'r') as f:
+            self.index = json.load(f)
+        self.shard_size = self.index['shard_size']
+        self.dtype = np.dtype(self.index['dtype'])
+        self.shape = ((self.index['num_samples'],) +
+                      tuple(self.index['sample_shape']))
+        self.y = None
+        if self.index['labels'] is not None:
+            self.y = np.load(os.path.join(path, self.index['labels']))
+        self.num_workers = num_workers
+        self._shards = [None] * len(self.index['shards'])
+        # The pool is created on first use, so that datasets that are never
+        # read in parallel, or are read only after the Solver forks its
+        # workers, start no threads; the lock guards its creation by
+        # concurrent readers such as prefetch threads.
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def shard(self, i):
+        """
+        Return shard i as a read-only memory-mapped array.
+        """
+        if self._shards[i] is None:
+            self._shards[i] = np.load(
+                os.path.join(self.path, self.index['shards'][i]),
+                mmap_mode='r')
+        return self._shards[i]
+
+    def read(self, start, stop, out=None):
+        """
+        Read the contiguous range of samples [start, stop).
+
+        Inputs:
+        - start, stop: Range of sample indices.
+        - out: Optional array of shape (stop - start,) + sample_shape to read
+          into.
+
+        Returns:
+        - out: Array holding the samples.
+        """
+        if out is None:
+            out = np.empty((stop - start,) + self.shape[1:], dtype=self.dtype)
+        pieces = []
+        pos = start
+        while pos < stop:
+            s, offset = divmod(pos, self.shard_size)
+            n = min(stop - pos, self.shard_size - offset)
+            pieces.append((s, offset, pos - start, n))
+            pos += n
+
+        def copy(piece):
+            s, offset, dst, n = piece
+            out[dst:dst + n] = self.shard(s)[offset:offset + n]
+        self._map(copy, pieces)
+        return out
+
+    def take(self, idx, out=None):
+        """
+        Gather the samples with the given indices.
+
+        Inputs:
+        - idx: Integer array of sample indices, in any order.
+        - out: Optional array of shape (len(idx),) + sample_shape to gather
+          into; it may have a different floating point dtype.
+
+        Returns:
+        - out: Array holding the samples.
+        """
+        idx = np.asarray(idx)
+        if idx.dtype == bool:
+            idx = np.flatnonzero(idx)
+        idx = np.where(idx < 0, idx + len(self), idx)
+        if out is None:
+            out = np.empty(idx.shape + self.shape[1:], dtype=self.dtype)
+        shard_ids = idx // self.shard_size
+
+        def gather(s):
+            mask = shard_ids == s
+            out[mask] = self.shard(s)[idx[mask] - s * self.shard_size]
+        self._map(gather, np.unique(shard_ids))
+        return out
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step == 1:
+                return self.read(start, max(start, stop))
+            return self.take(np.arange(start, stop, step))
+        if np.isscalar(idx):
+            idx = int(idx)
+            if idx < 0:
+                idx += len(self)
+            s, offset = divmod(idx, self.shard_size)
+            return np.array(self.shard(s)[offset])
+        return self.take(idx)
+
+    def _map(self, f, items):
+        if self.num_workers <= 1 or len(items) <= 1:
+            for item in items:
+                f(item)
+            return
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.num_workers)
+            pool = self._pool
+        pool.map(f, items)
+
+    def close(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def write_shards(out_dir, X, y=None, shard_size=10000, chunk_size=10000):
+    """
+    Write an array-like of samples to a sharded dataset.
+
+    Inputs:
+    - out_dir: Directory to write the dataset to.
+    - X: Array-like of shape (N, d_1, ..., d_k) supporting slicing.
+    - y: Array of shape (N,) of labels, or None.
+    - shard_size: Number of samples per shard.
+    - chunk_size: Number of samples copied at a time.
+    """
+    with ShardWriter(out_dir, X.shape[1:], shard_size,
+                     dtype=X.dtype) as writer:
+        for start in range(0, X.shape[0], chunk_size):
+            writer.write(X[start:start + chunk_size],
+                         None if y is None else y[start:start + chunk_size])
+
+
+def write_cifar10_shards(cifar10_dir, out_dir, num_training=49000,
+                         num_validation=1000, num_test=1000,
+                         shard_size=10000):
+    """
+    Convert the CIFAR-10 python batches into sharded train, val and test
+    datasets of uint8 images in channels-first layout, split the same way as
+    data_utils.get_CIFAR10_data.
+
+    Inputs:
+    - cifar10_dir: Directory of the CIFAR-10 python batches.
+    - out_dir: Directory to write the train, val and test datasets into.
+    - num_training, num_validation, num_test: Sizes of the splits.
+    - shard_size: Number of samples per shard.
+    """
+    X_train, y_train, X_test, y_test = load_CIFAR10(
+        cifar10_dir, dtype=np.uint8, channels_first=True)
+    splits = {
+      'train': (X_train[:num_training], y_train[:num_training]),
+      'val': (X_train[num_training:num_training + num_validation],
+              y_train[num_training:num_training + num_validation]),
+      'test': (X_test[:num_test], y_test[:num_test]),
+    }
+    for split, (X, y) in splits.items():
+        write_shards(os.path.join(out_dir, split), X, y, shard_size)
+
+
+def write_tiny_imagenet_shards(path, out_dir, shard_size=10000, **kwargs):
+    """
+    Convert a TinyImageNet directory into sharded train, val and test
+    datasets of uint8 images. The test split has no labels unless test
+    annotations are available.
+
+    Inputs:
+    - path: TinyImageNet directory.
+    - out_dir: Directory to write the train, val and test datasets into.
+    - shard_size: Number of samples per shard.
+    - kwargs: Passed on to data_utils.load_tiny_imagenet, such as
+      num_workers, cache_dir or progress.
+    """
+    data = load_tiny_imagenet(path, subtract_mean=False, lazy=True, **kwargs)
+    for split in ('train', 'val', 'test'):
+        write_shards(os.path.join(out_dir, split), data['X_' + split].X,
+                     data['y_' + split], shard_size)
+    with open(os.path.join(out_dir, 'class_names.json'), 'w') as f:
+        json.dump(data['class_names'], f)
+
+
+def load_sharded_data(root, subtract_mean=True, dtype=np.float32,
+                      num_workers=1):
+    """
+    Open the train, val and test datasets written by write_cifar10_shards or
+    write_tiny_imagenet_shards.
+
+    Inputs:
+    - root: Directory holding the train, val and test datasets.
+    - subtract_mean: Whether minibatches have the mean training image
+      subtracted. The mean is computed with streaming statistics the first
+      time and stored in root/stats.npz, and recomputed if the shape or a
+      sample of the images of the training data no longer matches it;
+      delete the file after rewriting shards in place with the same shape.
+    - dtype: Datatype of the minibatches.
+    - num_workers: Number of threads each dataset uses for reads.
+
+    Returns: A dictionary with the keys X_train, y_train, X_val, y_val,
+    X_test, y_test and mean_image, where the X_* entries are ImageDatasets
+    reading from the shards.
+    """
+    splits = {}
+    for split in ('train', 'val', 'test'):
+        splits[split] = ShardedDataset(os.path.join(root, split), num_workers)
+
+    mean_image = None
+    if subtract_mean:
+        mean_image = compute_mean_image(splits['train'], dtype,
+                                        os.path.join(root, 'stats.npz'),
+                                        num_workers=num_workers)
+
+    data = {'mean_image': mean_image}
+    for split, dataset in splits.items():
+        data['X_' + split] = ImageDataset(dataset, mean_image, dtype)
+        data['y_' + split] = dataset.y
+    return data
@@ -9,6 +9,14 @@ import pickle as pickle
 import numpy as np
 
 from cs231n import optim
+from cs231n.data_loader import BatchLoader
+from cs231n.parallel import DataParallel
+from cs231n.flat_params import FlatParams, FLAT_KEY
+from cs231n.lr_schedules import Warmup
+from cs231n.timers import NullTimer, clock
+from cs231n.tracing import span, add_listener, remove_listener
+from cs231n.checkpoint import (AsyncCheckpointWriter, CheckpointSeries,
+                               pack_state, unpack_state, load_checkpoint)
 
 
 class Solver(object):
@@ -33,6 +41,10 @@ class Solver(object):
     solver.train_acc_history and solver.val_acc_history will be lists of the
     accuracies of the model on the training and validation set at each epoch.
 
+    Training can be continued: increase solver.num_epochs and call train()
+    again, and optimization resumes from the last parameters and iteration of
+    the previous call (solver.last_params) rather than from the best ones.
+
     Example usage might look something like this:
 
     data = {
@@ -90,6 +102,9 @@ class Solver(object):
           'X_val': Array, shape (N_val, d_1, ..., d_k) of validation images
           'y_train': Array, shape (N_train,) of labels for training images
           'y_val': Array, shape (N_val,) of labels for validation images
+          The image arrays may also be array-like objects such as
+          data_utils.ImageDataset that provide .shape and return a minibatch
+          when indexed with an integer array or a slice.
 
         Optional arguments:
         - update_rule: A string giving the name of an update rule in optim.py.
@@ -113,6 +128,70 @@ class Solver(object):
           accuracy; default is None, which uses the entire validation set.
         - checkpoint_name: If not None, then save model checkpoints here every
           epoch.
+        - checkpoint_every: If not None, also save a checkpoint every this
+          many iterations, so that a run can be resumed mid-epoch.
+        - checkpoint_format: 'pkl' (default) pickles the solver state on the
+          training thread; 'npz' and 'raw' snapshot the arrays and write
+          them from a background thread with a checkpoint.AsyncCheckpointWriter
+          as an .npz archive or a directory of .npy files. 'series' appends
+          every checkpoint to a delta-compressed checkpoint.CheckpointSeries
+          in the directory checkpoint_name + '_series', also from a
+          background thread; a later run with the same checkpoint_name
+          appends to it, replacing checkpoints of the same name.
+        - checkpoint_keep: If not None, only keep this many of the most recent
+          checkpoints written in the 'npz' or 'raw' format.
+        - checkpoint_keyframe_every: Number of checkpoints between full
+          keyframes of a 'series'; default is 10.
+        - timer: If not None, a timers.PhaseTimer that times the phases
+          sample, forward_backward, update, check_accuracy and checkpoint of
+          training. It is available as solver.timer.
+        - profilers: List of tracing listeners, such as a
+          memory.MemoryProfiler, registered while train() runs; see
+          tracing.py.
+        - prefetch: Number of training minibatches to prepare ahead in
+          background threads using a data_loader.BatchLoader; default is 0,
+          which samples each minibatch on the training thread.
+        - prefetch_threads: Number of background threads used when prefetch
+          is positive; default is 1.
+        - augment: If not None, a function applied to every training
+          minibatch before the forward pass, such as an augment.Augmenter.
+          It runs in the prefetch threads when prefetching is enabled.
+        - num_workers: Number of worker processes used for synchronous
+          data-parallel training; each minibatch is split across this many
+          model replicas and their gradients are averaged before a single
+          update (see parallel.DataParallel). Default is 1, which computes
+          gradients on the training process.
+        - flat_params: If True, the parameters of the model are stored as
+          views into one contiguous buffer while train() runs, and the update
+          rule is called once per step on all of them together instead of
+          once per parameter (see flat_params.FlatParams). All parameters
+          must have the same dtype, and every parameter shares one
+          optim_config. Default is False.
+        - warmup_iterations: If positive, the learning rate is scaled by
+          (t + 1) / warmup_iterations on iterations t < warmup_iterations,
+          ramping it up linearly at the start of training. This stabilizes
+          training with large minibatches, such as with the lars and lamb
+          update rules. It is shorthand for wrapping lr_schedule in
+          lr_schedules.Warmup, so a given lr_schedule starts after the
+          warmup. Default is 0.
+        - lr_schedule: If not None, a function of (t, num_iterations), such
+          as one from lr_schedules.py, returning a factor by which the
+          learning rate is multiplied on iteration t of num_iterations
+          total iterations. It applies on top of lr_decay. A Warmup
+          schedule cannot be combined with warmup_iterations.
+        - patience: If not None, stop training once this many consecutive
+          accuracy checks have not improved the best validation accuracy
+          by more than min_delta.
+        - min_delta: Smallest improvement of the validation accuracy that
+          resets the patience count; default is 0.
+        - time_budget: If not None, stop training once this many seconds of
+          wall-clock time have been spent in train(), summed over calls.
+        - target_val_acc: If not None, stop training once the validation
+          accuracy reaches this value. The training time it took is stored
+          in solver.time_to_target.
+
+        When training stops, solver.stop_reason is set to 'num_epochs',
+        'patience', 'time_budget' or 'target_val_acc'.
         """
         self.model = model
         self.X_train = data['X_train']
@@ -130,8 +209,32 @@ class Solver(object):
         self.num_val_samples = kwargs.pop('num_val_samples', None)
 
         self.checkpoint_name = kwargs.pop('checkpoint_name', None)
+        self.checkpoint_every = kwargs.pop('checkpoint_every', None)
+        self.checkpoint_format = kwargs.pop('checkpoint_format', 'pkl')
+        self.checkpoint_keep = kwargs.pop('checkpoint_keep', None)
+        self.checkpoint_keyframe_every = kwargs.pop(
+            'checkpoint_keyframe_every', 10)
         self.print_every = kwargs.pop('print_every', 10)
         self.verbose = kwargs.pop('verbose', True)
+        self.prefetch = kwargs.pop('prefetch', 0)
+        self.prefetch_threads = kwargs.pop('prefetch_threads', 1)
+        self.augment = kwargs.pop('augment', None)
+        self.num_workers = kwargs.pop('num_workers', 1)
+        self.timer = kwargs.pop('timer', None) or NullTimer()
+        self.profilers = kwargs.pop('profilers', [])
+        self.flat_params = kwargs.pop('flat_params', False)
+        self.warmup_iterations = kwargs.pop('warmup_iterations', 0)
+        self.lr_schedule = kwargs.pop('lr_schedule', None)
+        if self.warmup_iterations > 0:
+            if isinstance(self.lr_schedule, Warmup):
+                raise ValueError('Pass either warmup_iterations or a Warmup '
+                                 'lr_schedule, not both')
+            self.lr_schedule = Warmup(self.warmup_iterations,
+                                      self.lr_schedule)
+        self.patience = kwargs.pop('patience', None)
+        self.min_delta = kwargs.pop('min_delta', 0.0)
+        self.time_budget = kwargs.pop('time_budget', None)
+        self.target_val_acc = kwargs.pop('target_val_acc', None)
 
         # Throw an error if there are extra keyword arguments
         if len(kwargs) > 0:
@@ -144,6 +247,13 @@ class Solver(object):
             raise ValueError('Invalid update_rule "%s"' % self.update_rule)
         self.update_rule = getattr(optim, self.update_rule)
 
+        if self.flat_params and self.num_workers > 1:
+            raise ValueError('flat_params cannot be combined with num_workers')
+        if self.flat_params and getattr(self.update_rule, 'layerwise', False):
+            raise ValueError('Update rule "%s" needs separate parameters and '
+                             'cannot be used with flat_params' %
+                             self.update_rule.__name__)
+
         self._reset()
 
 
@@ -154,15 +264,28 @@ class Solver(object):
         """
         # Set up some variables for book-keeping
         self.epoch = 0
+        self.iteration = 0
         self.best_val_acc = 0
         self.best_params = {}
+        self.last_params = None
         self.loss_history = []
         self.train_acc_history = []
         self.val_acc_history = []
-
-        # Make a deep copy of the optim_config for each parameter
+        self.train_time = 0.0
+        self.time_to_target = None
+        self.stop_reason = None
+        self._checks_without_improvement = 0
+        self._num_iterations = None
+        self._loader = None
+        self._parallel = None
+        self._checkpoint_writer = None
+        self._flat = None
+
+        # Make a deep copy of the optim_config for each parameter, or a
+        # single one for all flat parameters
         self.optim_configs = {}
-        for p in self.model.params:
+        params = [FLAT_KEY] if self.flat_params else self.model.params
+        for p in params:
             d = {k: v for k, v in self.optim_config.items()}
             self.optim_configs[p] = d
 
@@ -172,28 +295,114 @@ class Solver(object):
         Make a single gradient update. This is called by train() and should not
         be called manually.
         """
+        timer = self.timer
+
         # Make a minibatch of training data
-        num_train = self.X_train.shape[0]
-        batch_mask = np.random.choice(num_train, self.batch_size)
-        X_batch = self.X_train[batch_mask]
-        y_batch = self.y_train[batch_mask]
+        with timer.phase('sample'), span('sample'):
+            if self._loader is not None:
+                X_batch, y_batch = next(self._loader)
+            else:
+                num_train = self.X_train.shape[0]
+                batch_mask = np.random.choice(num_train, self.batch_size)
+                X_batch = self.X_train[batch_mask]
+                y_batch = self.y_train[batch_mask]
+                if self.augment is not None:
+                    X_batch = self.augment(X_batch)
 
         # Compute loss and gradient
-        loss, grads = self.model.loss(X_batch, y_batch)
+        with timer.phase('forward_backward'), span('forward_backward'):
+            if self._parallel is not None:
+                loss, grads = self._parallel.loss(X_batch, y_batch)
+            else:
+                loss, grads = self.model.loss(X_batch, y_batch)
         self.loss_history.append(loss)
 
         # Perform a parameter update
+        with timer.phase('update'), span('update'):
+            scale = 1.0
+            if self.lr_schedule is not None:
+                scale = self.lr_schedule(self.iteration, self._num_iterations)
+            if scale != 1.0:
+                learning_rates = self._scale_learning_rates(scale)
+            if self._flat is not None:
+                self._flat_update(grads)
+            else:
+                self._update(grads)
+            if scale != 1.0:
+                for config, lr in learning_rates:
+                    config['learning_rate'] = lr
+
+
+    def _scale_learning_rates(self, scale):
+        # Scale the learning rate of every optim_config that has one, and
+        # return (config, original learning rate) pairs to restore them.
+        # Update rules modify their config in place, so the same configs
+        # are found after the update.
+        learning_rates = []
+        for config in self.optim_configs.values():
+            if 'learning_rate' in config:
+                learning_rates.append((config, config['learning_rate']))
+                config['learning_rate'] *= scale
+        return learning_rates
+
+
+    def _update(self, grads):
         for p, w in self.model.params.items():
             dw = grads[p]
             config = self.optim_configs[p]
             next_w, next_config = self.update_rule(w, dw, config)
+            if self._parallel is not None and next_w is not w:
+                # The workers share w, so write the update into it
+                w[...] = next_w
+                next_w = w
             self.model.params[p] = next_w
             self.optim_configs[p] = next_config
 
 
-    def _save_checkpoint(self):
-        if self.checkpoint_name is None: return
-        checkpoint = {
+    def _flat_update(self, grads):
+        # One call of the update rule on the buffer holding all parameters
+        w = self._flat.data
+        dw = self._flat.gather_grads(grads)
+        next_w, self.optim_configs[FLAT_KEY] = self.update_rule(
+            w, dw, self.optim_configs[FLAT_KEY])
+        if next_w is not w:
+            w[...] = next_w
+
+
+    def _stop_reason(self, checked):
+        """
+        Return why training should stop after the current iteration, or None
+        to continue. checked is True if the accuracy was just checked.
+        """
+        if checked and self.target_val_acc is not None and \
+                self.val_acc_history[-1] >= self.target_val_acc:
+            if self.time_to_target is None:
+                self.time_to_target = self.train_time
+            return 'target_val_acc'
+        if checked and self.patience is not None and \
+                self._checks_without_improvement >= self.patience:
+            return 'patience'
+        if self.time_budget is not None and \
+                self.train_time >= self.time_budget:
+            return 'time_budget'
+        return None
+
+
+    def get_state(self):
+        """
+        Return a dictionary holding the complete training state: the model,
+        the per-parameter optim_configs (such as Adam moments or momentum
+        velocities), the iteration and epoch counters, the best parameters,
+        the histories and the state of numpy's global random number generator
+        and of the augmenter, if it has one. Scratch buffers of the fused
+        update rules are left out; they are allocated again on the next step.
+
+        Restoring the state with set_state() on a Solver constructed with the
+        same data and options continues training exactly as if it had not
+        been interrupted. This does not hold with prefetch > 0, since the
+        batch loader samples minibatches ahead of the training thread.
+        """
+        state = {
           'model': self.model,
           'update_rule': self.update_rule,
           'lr_decay': self.lr_decay,
@@ -202,11 +411,103 @@ class Solver(object):
           'num_train_samples': self.num_train_samples,
           'num_val_samples': self.num_val_samples,
           'epoch': self.epoch,
+          'iteration': self.iteration,
+          'optim_configs': {
+            p: {k: v for k, v in config.items()
+                if k not in optim.SCRATCH_KEYS}
+            for p, config in self.optim_configs.items()},
+          'best_val_acc': self.best_val_acc,
+          'best_params': self.best_params,
+          'last_params': self.last_params,
           'loss_history': self.loss_history,
           'train_acc_history': self.train_acc_history,
           'val_acc_history': self.val_acc_history,
+          'train_time': self.train_time,
+          'time_to_target': self.time_to_target,
+          'checks_without_improvement': self._checks_without_improvement,
+          'rng_state': np.random.get_state(),
         }
-        filename = '%s_epoch_%d.pkl' % (self.checkpoint_name, self.epoch)
+        if hasattr(self.augment, 'rng'):
+            state['augment_rng_state'] = self.augment.rng.get_state()
+        return state
+
+
+    def set_state(self, state):
+        """
+        Restore a training state returned by get_state().
+        """
+        if 'optim_configs' not in state:
+            raise ValueError('State does not hold the full solver state')
+        for k in ('model', 'epoch', 'iteration', 'optim_configs',
+                  'best_val_acc', 'best_params', 'last_params',
+                  'loss_history', 'train_acc_history', 'val_acc_history'):
+            setattr(self, k, state[k])
+        self.train_time = state.get('train_time', 0.0)
+        self.time_to_target = state.get('time_to_target')
+        self._checks_without_improvement = state.get(
+            'checks_without_improvement', 0)
+        np.random.set_state(state['rng_state'])
+        if 'augment_rng_state' in state and hasattr(self.augment, 'rng'):
+            self.augment.rng.set_state(state['augment_rng_state'])
+
+
+    def restore_checkpoint(self, filename, name=-1):
+        """
+        Restore the training state from a checkpoint written during train(),
+        so that calling train() again resumes the interrupted run. filename
+        is a .pkl checkpoint, the manifest, .npz archive or directory of
+        an 'npz' or 'raw' checkpoint, or the directory of a 'series'; name
+        then selects a checkpoint of the series, by default the last one.
+        """
+        if filename.endswith('.pkl'):
+            with open(filename, 'rb') as f:
+                self.set_state(pickle.load(f))
+            return
+        if os.path.isfile(os.path.join(filename, CheckpointSeries.INDEX)):
+            arrays = CheckpointSeries(filename).load(name)
+        else:
+            arrays, _ = load_checkpoint(filename)
+        state = unpack_state(arrays)
+        state['model'].params = state.pop('params')
+        self.set_state(state)
+
+
+    def _save_checkpoint(self, name=None):
+        if self.checkpoint_name is None: return
+        if name is None:
+            name = 'epoch_%d' % self.epoch
+        checkpoint = self.get_state()
+
+        if self.checkpoint_format != 'pkl':
+            if self._checkpoint_writer is None:
+                if self.checkpoint_format == 'series':
+                    self._checkpoint_writer = AsyncCheckpointWriter(
+                        self.checkpoint_name + '_series', 'series',
+                        keyframe_every=self.checkpoint_keyframe_every)
+                else:
+                    self._checkpoint_writer = AsyncCheckpointWriter(
+                        os.path.dirname(self.checkpoint_name),
+                        self.checkpoint_format, self.checkpoint_keep)
+            # Pickle the model without its params, which are stored as arrays
+            checkpoint['params'] = self.model.params
+            self.model.params = {}
+            try:
+                arrays = pack_state(checkpoint)
+            finally:
+                self.model.params = checkpoint['params']
+            metadata = {
+              'epoch': self.epoch,
+              'iteration': self.iteration,
+              'best_val_acc': self.best_val_acc,
+            }
+            if self.verbose:
+                print('Saving checkpoint "%s"' % name)
+            if self.checkpoint_format != 'series':
+                name = '%s_%s' % (os.path.basename(self.checkpoint_name), name)
+            self._checkpoint_writer.save(name, arrays, metadata)
+            return
+
+        filename = '%s_%s.pkl' % (self.checkpoint_name, name)
         if self.verbose:
             print('Saving checkpoint to "%s"' % filename)
         with open(filename, 'wb') as f:
@@ -260,52 +561,132 @@ class Solver(object):
         """
         num_train = self.X_train.shape[0]
         iterations_per_epoch = max(num_train // self.batch_size, 1)
-        num_iterations = self.num_epochs * iterations_per_epoch
+        num_iterations = int(self.num_epochs * iterations_per_epoch)
+        self._num_iterations = num_iterations
+        self.stop_reason = None
+        start_time = clock() - self.train_time
         #print('%d number to train.' % num_train)
         #print('%d batch size.' % self.batch_size)
         #print('%d iterations per epoch.' % iterations_per_epoch)
         #print('%d epochs.' % self.num_epochs)
-        print('%d iterations totally.' % num_iterations)
-
-        for t in range(num_iterations):
-            self._step()
-
-            # Maybe print training loss
-            if self.verbose and t % self.print_every == 0:
-                print('(Iteration %d / %d) loss: %f' % (
-                       t + 1, num_iterations, self.loss_history[-1]))
-
-            # At the end of every epoch, increment the epoch counter and decay
-            # the learning rate.
-            epoch_end = (t + 1) % iterations_per_epoch == 0
-            if epoch_end:
-                self.epoch += 1
-                for k in self.optim_configs:
-                    self.optim_configs[k]['learning_rate'] *= self.lr_decay
-
-            # Check train and val accuracy on the first iteration, the last
-            # iteration, and at the end of each epoch.
-            first_it = (t == 0)
-            last_it = (t == num_iterations - 1)
-            if first_it or last_it or epoch_end:
-                train_acc = self.check_accuracy(self.X_train, self.y_train,
-                    num_samples=self.num_train_samples)
-                val_acc = self.check_accuracy(self.X_val, self.y_val,
-                    num_samples=self.num_val_samples)
-                self.train_acc_history.append(train_acc)
-                self.val_acc_history.append(val_acc)
-                self._save_checkpoint()
-
-                if self.verbose:
-                    print('(Epoch %d / %d) train acc: %f; val_acc: %f' % (
-                           self.epoch, self.num_epochs, train_acc, val_acc))
-
-                # Keep track of the best model
-                if val_acc > self.best_val_acc:
-                    self.best_val_acc = val_acc
-                    self.best_params = {}
-                    for k, v in self.model.params.items():
-                        self.best_params[k] = v.copy()
-
-        # At the end of training swap the best params into the model
+        if self.verbose:
+            print('%d iterations totally.' % num_iterations)
+
+        # Continue from where a previous call to train() stopped
+        if self.last_params is not None:
+            self.model.params = self.last_params
+            self.last_params = None
+
+        if self.flat_params:
+            self._flat = FlatParams(self.model.params)
+            self.model.params = self._flat.params
+        # Fork the data-parallel workers before the prefetch threads start,
+        # since forking while other threads hold locks can deadlock the
+        # children
+        if self.num_workers > 1:
+            sample_shape = self.X_train.shape[1:]
+            dtype = getattr(self.model, 'dtype', None)
+            if dtype is None:
+                dtype = self.X_train[:1].dtype
+            self._parallel = DataParallel(self.model, self.num_workers,
+                                          self.batch_size, sample_shape, dtype)
+        if self.prefetch > 0:
+            self._loader = BatchLoader(self.X_train, self.y_train,
+                                       self.batch_size, prefetch=self.prefetch,
+                                       num_workers=self.prefetch_threads,
+                                       dtype=getattr(self.model, 'dtype', None),
+                                       transform=self.augment)
+        for profiler in self.profilers:
+            add_listener(profiler)
+        try:
+            for t in range(self.iteration, num_iterations):
+                with span('step'):
+                    self._step()
+                self.iteration = t + 1
+
+                # Maybe print training loss
+                if self.verbose and t % self.print_every == 0:
+                    print('(Iteration %d / %d) loss: %f' % (
+                           t + 1, num_iterations, self.loss_history[-1]))
+
+                # At the end of every epoch, increment the epoch counter and
+                # decay the learning rate.
+                epoch_end = (t + 1) % iterations_per_epoch == 0
+                if epoch_end:
+                    self.epoch += 1
+                    for k in self.optim_configs:
+                        config = self.optim_configs[k]
+                        config['learning_rate'] *= self.lr_decay
+
+                # Check train and val accuracy on the first iteration, the
+                # last iteration, and at the end of each epoch.
+                first_it = (t == 0)
+                last_it = (t == num_iterations - 1)
+                if first_it or last_it or epoch_end:
+                    with self.timer.phase('check_accuracy'), \
+                            span('check_accuracy'):
+                        train_acc = self.check_accuracy(
+                            self.X_train, self.y_train,
+                            num_samples=self.num_train_samples)
+                        val_acc = self.check_accuracy(self.X_val, self.y_val,
+                            num_samples=self.num_val_samples)
+                    self.train_acc_history.append(train_acc)
+                    self.val_acc_history.append(val_acc)
+
+                    if self.verbose:
+                        print('(Epoch %d / %d) train acc: %f; val_acc: %f' % (
+                               self.epoch, self.num_epochs, train_acc,
+                               val_acc))
+
+                    # Keep track of the best model
+                    if val_acc > self.best_val_acc + self.min_delta:
+                        self._checks_without_improvement = 0
+                    else:
+                        self._checks_without_improvement += 1
+                    if val_acc > self.best_val_acc:
+                        self.best_val_acc = val_acc
+                        self.best_params = {}
+                        for k, v in self.model.params.items():
+                            self.best_params[k] = v.copy()
+
+                self.train_time = clock() - start_time
+
+                # Save a checkpoint after the accuracy checks, so that it
+                # holds their results, and maybe every checkpoint_every
+                # iterations.
+                save, name = first_it or last_it or epoch_end, None
+                if (not save and self.checkpoint_every and
+                        self.iteration % self.checkpoint_every == 0):
+                    save, name = True, 'iter_%d' % self.iteration
+                if save and self.checkpoint_name is not None:
+                    with self.timer.phase('checkpoint'), span('checkpoint'):
+                        self._save_checkpoint(name)
+                self.timer.next_iteration()
+
+                self.stop_reason = self._stop_reason(
+                    first_it or last_it or epoch_end)
+                if self.stop_reason is not None:
+                    if self.verbose:
+                        print('Stopping after iteration %d: %s' % (
+                               self.iteration, self.stop_reason))
+                    break
+            else:
+                self.stop_reason = 'num_epochs'
+        finally:
+            for profiler in self.profilers:
+                remove_listener(profiler)
+            if self._loader is not None:
+                self._loader.close()
+                self._loader = None
+            if self._parallel is not None:
+                self._parallel.close()
+                self._parallel = None
+            self._flat = None
+            if self._checkpoint_writer is not None:
+                self._checkpoint_writer.close()
+                self._checkpoint_writer = None
+
+        # At the end of training swap the best params into the model, keeping
+        # the last ones so that training can be continued
+        self.last_params = self.model.params
         self.model.params = self.best_params
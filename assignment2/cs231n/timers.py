@@ -0,0 +1,259 @@
+from __future__ import print_function, division
+from builtins import range
+from builtins import object
+import csv
+import json
+import sys
+import time
+
+import numpy as np
+
+"""
+This file implements lightweight timers for the phases of a training loop.
+
+A PhaseTimer accumulates, for every named phase, the number of calls, the
+total, minimum and maximum time and a histogram of durations on log-spaced
+bins, from which approximate percentiles are read. Optionally it also keeps
+one record per iteration with the time spent in each phase. Timing a phase
+costs two clock reads and a few additions:
+
+timer = PhaseTimer()
+for t in range(num_iterations):
+    with timer.phase('sample'):
+        ...
+    with timer.phase('forward_backward'):
+        ...
+    timer.next_iteration()
+timer.report()
+timer.to_json('timings.json')
+
+The Solver accepts a PhaseTimer through its timer option and times the
+phases sample, forward_backward, update, check_accuracy and checkpoint.
+NullTimer has the same interface and does nothing; the Solver uses it when
+no timer is given.
+"""
+
+
+# Monotonic clock used to time phases, spans and benchmarks
+clock = getattr(time, 'perf_counter', time.time)
+
+# Histogram bin edges in seconds: 10 bins per decade from 1us to 1000s
+BIN_EDGES = 10.0 ** np.arange(-6, 3.01, 0.1)
+
+
+class _Phase(object):
+    # Reusable context manager timing one phase of a PhaseTimer
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *args):
+        self.timer.add(self.name, clock() - self.start)
+
+
+class PhaseStats(object):
+    """
+    Running statistics of the durations of one phase.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.histogram = np.zeros(len(BIN_EDGES) + 1, dtype=np.int64)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.histogram[np.searchsorted(BIN_EDGES, seconds)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """
+        Approximate q-th percentile, as the geometric center of the
+        histogram bin holding it, clipped to the observed range.
+        """
+        if self.count == 0:
+            return 0.0
+        i = np.searchsorted(np.cumsum(self.histogram), q / 100.0 * self.count)
+        if i == 0:
+            value = BIN_EDGES[0]
+        elif i == len(BIN_EDGES):
+            value = BIN_EDGES[-1]
+        else:
+            value = np.sqrt(BIN_EDGES[i - 1] * BIN_EDGES[i])
+        return float(min(max(value, self.min), self.max))
+
+    def summary(self):
+        return {
+          'count': self.count,
+          'total': self.total,
+          'mean': self.mean,
+          'min': self.min if self.count else 0.0,
+          'max': self.max,
+          'p50': self.percentile(50),
+          'p90': self.percentile(90),
+          'p99': self.percentile(99),
+        }
+
+
+class PhaseTimer(object):
+    """
+    Times named phases of a loop; see the top of this file.
+    """
+
+    enabled = True
+
+    def __init__(self, record_iterations=False):
+        """
+        Inputs:
+        - record_iterations: If True, keep a record of the time spent in
+          every phase for each iteration, ended by next_iteration().
+        """
+        self.record_iterations = record_iterations
+        self.stats = {}
+        self.records = []
+        self._phases = {}
+        self._current = {}
+        self._order = []
+
+    def phase(self, name):
+        """
+        Return a context manager that adds the time spent in its block to the
+        phase called name.
+        """
+        p = self._phases.get(name)
+        if p is None:
+            p = self._phases[name] = _Phase(self, name)
+        return p
+
+    def add(self, name, seconds):
+        """
+        Add a duration in seconds to a phase.
+        """
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = PhaseStats()
+            self._order.append(name)
+        stats.add(seconds)
+        if self.record_iterations:
+            self._current[name] = self._current.get(name, 0.0) + seconds
+
+    def next_iteration(self):
+        """
+        End the record of the current iteration.
+        """
+        if self.record_iterations:
+            self.records.append(self._current)
+            self._current = {}
+
+    def reset(self):
+        self.stats = {}
+        self.records = []
+        self._current = {}
+        self._order = []
+
+    def summary(self):
+        """
+        Return a dictionary mapping phase names to dictionaries of count,
+        total, mean, min, max and the p50, p90 and p99 percentiles, in
+        seconds.
+        """
+        return {name: self.stats[name].summary() for name in self._order}
+
+    def report(self):
+        """
+        Print a table of the phase statistics, with the share of the total
+        time spent in every phase.
+        """
+        summary = self.summary()
+        total = sum(s['total'] for s in summary.values()) or 1.0
+        print('%-18s %8s %10s %10s %10s %10s %6s' % (
+            'phase', 'count', 'total s', 'mean ms', 'p50 ms', 'p99 ms', '%'))
+        for name in self._order:
+            s = summary[name]
+            print('%-18s %8d %10.3f %10.3f %10.3f %10.3f %6.1f' % (
+                name, s['count'], s['total'], 1e3 * s['mean'],
+                1e3 * s['p50'], 1e3 * s['p99'], 100.0 * s['total'] / total))
+
+    def to_json(self, filename):
+        """
+        Write the summary, the histograms and any per-iteration records to a
+        JSON file.
+        """
+        result = {
+          'phases': self.summary(),
+          'bin_edges': BIN_EDGES.tolist(),
+          'histograms': {name: self.stats[name].histogram.tolist()
+                         for name in self._order},
+        }
+        if self.record_iterations:
+            result['iterations'] = self.records
+        with open(filename, 'w') as f:
+            json.dump(result, f, indent=1)
+
+    def to_csv(self, filename):
+        """
+        Write a CSV file with one row per iteration and one column per phase
+        if iterations are recorded, or one row per phase otherwise.
+        """
+        # The csv module writes its own line endings: it needs a binary file
+        # on Python 2 and newline='' on Python 3
+        if sys.version_info[0] < 3:
+            f = open(filename, 'wb')
+        else:
+            f = open(filename, 'w', newline='')
+        with f:
+            writer = csv.writer(f)
+            if self.record_iterations:
+                writer.writerow(['iteration'] + self._order)
+                for i, record in enumerate(self.records):
+                    writer.writerow([i] + [record.get(name, 0.0)
+                                           for name in self._order])
+            else:
+                keys = ['count', 'total', 'mean', 'min', 'max', 'p50', 'p90',
+                        'p99']
+                writer.writerow(['phase'] + keys)
+                for name, s in self.summary().items():
+                    writer.writerow([name] + [s[k] for k in keys])
+
+
+class _NullPhase(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class NullTimer(object):
+    """
+    A timer with the interface of PhaseTimer that records nothing.
+    """
+
+    enabled = False
+    _phase = _NullPhase()
+
+    def phase(self, name):
+        return self._phase
+
+    def add(self, name, seconds):
+        pass
+
+    def next_iteration(self):
+        pass
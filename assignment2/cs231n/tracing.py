@@ -0,0 +1,203 @@
+from __future__ import print_function, division
+from builtins import object
+import functools
+import json
+import os
+import threading
+
+import numpy as np
+
+from cs231n.timers import clock
+
+"""
+This file implements a tracing hook for layer functions and training phases.
+
+Functions in layers.py, fast_layers.py and layer_utils.py are decorated with
+@traced, and the Solver marks its phases with span(). While no listener is
+registered a traced call costs one extra function call and a list check.
+Once a listener is registered with add_listener, every traced call and span
+is reported to it when it returns, through
+
+listener.event(name, args, result, start, end, depth, leaf)
+
+where args and result are the arguments and return value of the call (None
+for spans), start and end are clock() times in seconds, depth is the nesting
+depth (0 for outermost calls) and leaf is True if no other traced call ran
+inside it. Convenience layers such as conv_relu_pool_forward are therefore
+reported with leaf=False, and the layers they call with leaf=True, so that
+listeners that sum costs can count every operation once.
+
+Tracer is a listener that writes the events in the Chrome trace-event format,
+which can be opened in chrome://tracing or https://ui.perfetto.dev:
+
+with Tracer('step.json'):
+    solver.train()
+"""
+
+
+_listeners = []
+_local = threading.local()
+
+
+def add_listener(listener):
+    """ Start reporting traced calls and spans to listener. """
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """ Stop reporting to listener. """
+    _listeners.remove(listener)
+
+
+def _frames():
+    frames = getattr(_local, 'frames', None)
+    if frames is None:
+        frames = _local.frames = []
+    return frames
+
+
+def in_span(name):
+    """
+    Return True if a span called name is open on the current thread, such
+    as the 'step' span of the Solver while a training step runs. Only
+    meaningful while a listener is registered.
+    """
+    return any(frame[1] == name for frame in _frames())
+
+
+def _call(name, func, args, kwargs):
+    # Each frame is a list holding whether the call has traced children and
+    # the name of the call or span.
+    frames = _frames()
+    if frames:
+        frames[-1][0] = True
+    frame = [False, name]
+    frames.append(frame)
+    try:
+        start = clock()
+        result = func(*args, **kwargs)
+        end = clock()
+    finally:
+        frames.pop()
+    for listener in list(_listeners):
+        listener.event(name, args, result, start, end, len(frames),
+                       not frame[0])
+    return result
+
+
+def traced(func):
+    """
+    Decorator reporting calls of func to the registered listeners.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _listeners:
+            return func(*args, **kwargs)
+        return _call(name, func, args, kwargs)
+    return wrapper
+
+
+class _Span(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        frames = _frames()
+        if frames:
+            frames[-1][0] = True
+        self.frame = [False, self.name]
+        frames.append(self.frame)
+        self.start = clock()
+        return self
+
+    def __exit__(self, *args):
+        end = clock()
+        frames = _frames()
+        frames.pop()
+        for listener in list(_listeners):
+            listener.event(self.name, None, None, self.start, end,
+                           len(frames), not self.frame[0])
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+def span(name):
+    """
+    Return a context manager reporting its block as an event called name.
+    """
+    if not _listeners:
+        return _null_span
+    return _Span(name)
+
+
+def _shapes(args):
+    return [list(a.shape) for a in args if isinstance(a, np.ndarray)]
+
+
+class Tracer(object):
+    """
+    A listener that records every event for the Chrome trace-event format.
+    Traced calls carry the shapes of their array arguments; spans are put in
+    the 'solver' category and layer calls in the 'layer' category.
+    """
+
+    def __init__(self, filename=None):
+        """
+        Inputs:
+        - filename: If not None, write the trace to this file when used as a
+          context manager.
+        """
+        self.filename = filename
+        self.events = []
+        self._origin = clock()
+        self._pid = os.getpid()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+        if self.filename is not None:
+            self.save(self.filename)
+
+    def start(self):
+        add_listener(self)
+
+    def stop(self):
+        remove_listener(self)
+
+    def event(self, name, args, result, start, end, depth, leaf):
+        event = {
+          'name': name,
+          'cat': 'solver' if args is None else 'layer',
+          'ph': 'X',
+          'ts': 1e6 * (start - self._origin),
+          'dur': 1e6 * (end - start),
+          'pid': self._pid,
+          'tid': threading.current_thread().ident,
+        }
+        if args is not None:
+            event['args'] = {'shapes': _shapes(args)}
+        self.events.append(event)
+
+    def save(self, filename):
+        """
+        Write the trace-event JSON file.
+        """
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, f)